@@ -13,25 +13,281 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from googleapiclient.discovery import build  # type: ignore
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlencode
+import httplib2  # type: ignore
+from googleapiclient.discovery import build_from_document  # type: ignore
+from googleapiclient.errors import HttpError  # type: ignore
+from googleapiclient.http import HttpRequest  # type: ignore
+import adh_deployment_manager.metrics as metrics
+import adh_deployment_manager.profiling as profiling
 import adh_deployment_manager.utils as utils
 from adh_deployment_manager.job import _is_adh_job_running
+from adh_deployment_manager.rate_limiter import RateLimiter
 
 _ADH_DISCOVERY_SERVICE_URL = "https://adsdatahub.googleapis.com/$discovery/rest?version=v1"
+# changing version invalidates all previously cached discovery documents
+_DISCOVERY_CACHE_VERSION = 1
+_DISCOVERY_CACHE_TTL = 24 * 60 * 60
+# maximum number of calls grouped into a single batch request
+_BATCH_SIZE = 50
+
+
+class RateLimitedHttpRequest(HttpRequest):
+    """ HttpRequest which waits for rate limiter before being executed."""
+    def __init__(self, *args, rate_limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter
+        # time the last execution waited for rate limiter
+        self.rate_limit_delay = 0
+
+    def execute(self, http=None, num_retries=0):
+        if self.rate_limiter:
+            self.rate_limit_delay = self.rate_limiter.acquire(self.methodId)
+            metrics.record_sleep(metrics.RATE_LIMIT, self.rate_limit_delay)
+        return super().execute(http=http, num_retries=num_retries)
+
+
+class DiscoveryCache:
+    """ On-disk cache of discovery documents.
+
+    Documents are stored as JSON files keyed by service name, version,
+    discovery URL and cache format version, and are considered fresh for
+    `ttl` seconds. Stale document is still used if it cannot be refreshed.
+
+    Args:
+      cache_dir: directory where documents are stored.
+      ttl: number of seconds a cached document is fresh.
+    """
+    def __init__(self, cache_dir=None, ttl=_DISCOVERY_CACHE_TTL):
+        self.cache_dir = cache_dir or os.path.join(utils.get_cache_dir(),
+                                                   "discovery")
+        self.ttl = ttl
+
+    def _get_path(self, service_name, version, discovery_url):
+        url_hash = hashlib.sha1(discovery_url.encode("utf-8")).hexdigest()
+        return os.path.join(
+            self.cache_dir, f"{service_name}.{version}.{url_hash[:12]}."
+            f"v{_DISCOVERY_CACHE_VERSION}.json").lower()
+
+    def get(self, service_name, version, discovery_url, allow_stale=False):
+        """ Returns cached document as a string or None if it's missing."""
+        path = self._get_path(service_name, version, discovery_url)
+        try:
+            if not allow_stale and time.time() - os.path.getmtime(
+                    path) > self.ttl:
+                return None
+            with open(path, "r") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, service_name, version, discovery_url, document):
+        path = self._get_path(service_name, version, discovery_url)
+        try:
+            utils.write_file_atomically(path, document)
+        except OSError as e:
+            logging.warning(f"cannot cache discovery document: {e}")
+
+
+def fetch_discovery_document(discovery_url, developer_key=None, timeout=60):
+    """ Downloads discovery document.
+
+    Returns:
+      Discovery document as a string.
+    """
+    if developer_key:
+        separator = "&" if "?" in discovery_url else "?"
+        discovery_url = f"{discovery_url}{separator}{urlencode({'key': developer_key})}"
+    response, content = httplib2.Http(timeout=timeout).request(discovery_url)
+    if response.status >= 400:
+        raise HttpError(response, content, uri=discovery_url)
+    content = content.decode("utf-8") if isinstance(content,
+                                                    bytes) else content
+    # make sure that only valid documents get cached
+    json.loads(content)
+    return content
 
 
 class AdhService:
+    """ Wrapper around ADH API service object.
+
+    Every thread gets its own service object (and connection) built from
+    the same discovery document and credentials, so the service can be
+    used from a thread pool. httplib2 connections are not thread-safe, so
+    requests should be executed by the thread that built them.
+
+    Discovery document of the API is read from `discovery_document` if it's
+    provided, otherwise it's taken from on-disk cache and downloaded only if
+    cached document is older than `discovery_cache_ttl`.
+
+    Args:
+      credentials: credentials used to authorize API calls.
+      developer_key: ADH developer key.
+      qps: maximum number of API calls per second, either one value for all
+        calls or dict {method family: qps}, i.e. {"list": 10, "start": 2}.
+      discovery_document: discovery document as a dict, JSON string or path
+        to JSON file.
+      discovery_cache_dir: directory where discovery documents are cached.
+      discovery_cache_ttl: number of seconds cached document is used for,
+        0 disables caching.
+      root_url: root URL of the API used instead of the one from discovery
+        document, i.e. URL of `FakeAdhServer`; if discovery document isn't
+        provided it's downloaded from this URL without caching.
+    """
     def __init__(self,
                  credentials,
                  developer_key,
                  serviceName="AdsDataHub",
                  version="v1",
-                 discoveryServiceUrl=_ADH_DISCOVERY_SERVICE_URL):
-        self.adh_service = build(serviceName=serviceName,
-                                 version=version,
-                                 credentials=credentials,
-                                 developerKey=developer_key,
-                                 discoveryServiceUrl=discoveryServiceUrl)
+                 discoveryServiceUrl=_ADH_DISCOVERY_SERVICE_URL,
+                 qps=None,
+                 discovery_document=None,
+                 discovery_cache_dir=None,
+                 discovery_cache_ttl=_DISCOVERY_CACHE_TTL,
+                 root_url=None):
+        # rate limiter is shared by every call made via the service
+        self.rate_limiter = RateLimiter(qps)
+        if root_url:
+            root_url = f"{root_url.rstrip('/')}/"
+            discovery_cache_ttl = 0
+            if discoveryServiceUrl == _ADH_DISCOVERY_SERVICE_URL:
+                discoveryServiceUrl = (
+                    f"{root_url}$discovery/rest?version={version}")
+        self.discovery_document = self._get_discovery_document(
+            serviceName, version, discoveryServiceUrl, developer_key,
+            discovery_document,
+            DiscoveryCache(discovery_cache_dir, discovery_cache_ttl)
+            if discovery_cache_ttl else None)
+        if root_url:
+            self.discovery_document = dict(self.discovery_document,
+                                           rootUrl=root_url)
+        self.credentials = credentials
+        self.developer_key = developer_key
+        self._local = threading.local()
+        # service of the creating thread is built right away
+        self.get_service()
+
+    @property
+    def adh_service(self):
+        return self.get_service()
+
+    def get_service(self):
+        """ Returns API service object owned by the current thread."""
+        service = getattr(self._local, "service", None)
+        if service is None:
+            with profiling.phase("discovery"):
+                service = build_from_document(
+                    self.discovery_document,
+                    credentials=self.credentials,
+                    developerKey=self.developer_key,
+                    requestBuilder=self._build_request)
+            self._local.service = service
+        return service
+
+    @staticmethod
+    @profiling.phase("discovery")
+    def _get_discovery_document(service_name, version, discovery_url,
+                                developer_key, discovery_document, cache):
+        if isinstance(discovery_document, dict):
+            return discovery_document
+        if discovery_document:
+            if os.path.isfile(discovery_document):
+                with open(discovery_document, "r") as f:
+                    return json.load(f)
+            return json.loads(discovery_document)
+        document = cache.get(service_name, version,
+                             discovery_url) if cache else None
+        if document:
+            return json.loads(document)
+        try:
+            document = fetch_discovery_document(discovery_url, developer_key)
+        except (HttpError, httplib2.HttpLib2Error, OSError) as e:
+            document = cache.get(service_name, version, discovery_url,
+                                 allow_stale=True) if cache else None
+            if not document:
+                raise
+            logging.warning(
+                f"cannot fetch discovery document, using cached one: {e}")
+            return json.loads(document)
+        if cache:
+            cache.set(service_name, version, discovery_url, document)
+        return json.loads(document)
+
+    def _build_request(self, *args, **kwargs):
+        return RateLimitedHttpRequest(*args,
+                                      rate_limiter=self.rate_limiter,
+                                      **kwargs)
+
+    def execute_batch(self,
+                      requests,
+                      batch_size=_BATCH_SIZE,
+                      return_exceptions=False):
+        """ Executes API calls grouped into batch requests.
+
+        Calls that failed with a retriable error, as well as calls from batch
+        requests that failed as a whole, are retried one by one with
+        `utils.execute_adh_api_call_with_retry`.
+
+        Args:
+          requests: list of HttpRequest objects.
+          batch_size: maximum number of calls in a single batch request.
+          return_exceptions: whether to return errors of failed calls instead
+            of raising the first of them.
+
+        Returns:
+          List of responses in the same order as requests.
+        """
+        responses = [None] * len(requests)
+        errors = {}
+        # calls from batch requests that failed as a whole
+        not_executed = set()
+
+        def callback(request_id, response, exception):
+            if exception:
+                errors[int(request_id)] = exception
+            else:
+                responses[int(request_id)] = response
+
+        for start in range(0, len(requests), batch_size):
+            batch = self.get_service().new_batch_http_request(
+                callback=callback)
+            chunk = range(start, min(start + batch_size, len(requests)))
+            for i in chunk:
+                metrics.record_sleep(
+                    metrics.RATE_LIMIT,
+                    self.rate_limiter.acquire(requests[i].methodId))
+                batch.add(requests[i], request_id=str(i))
+            recorder = metrics.CallRecorder("adsdatahub.batch")
+            try:
+                batch.execute()
+            except (HttpError, ConnectionError, TimeoutError) as e:
+                recorder.end_attempt()
+                recorder.finish(e)
+                logging.warning(f"batch request failed: {e}")
+                errors.update({i: e for i in chunk})
+                not_executed.update(chunk)
+            else:
+                recorder.end_attempt()
+                recorder.finish()
+        retry_policy = utils.RetryPolicy()
+        for i, error in sorted(errors.items()):
+            try:
+                if (i not in not_executed
+                        and not retry_policy.is_retriable(error)):
+                    raise error
+                responses[i] = utils.execute_adh_api_call_with_retry(
+                    requests[i])
+            except (HttpError, ConnectionError, TimeoutError) as e:
+                if not return_exceptions:
+                    raise
+                responses[i] = e
+        return responses
 
     def get_running_jobs(self):
         """ Get all running jobs.
@@ -43,7 +299,7 @@ class AdhService:
           List of running jobs as dict {"name": "startTime"}
         """
 
-        op = self.adh_service.operations().list(name='operations')
+        op = self.get_service().operations().list(name='operations')
         adh_operations = utils.execute_adh_api_call_with_retry(op)
         running_jobs = {}
         for operation in adh_operations["operations"]:
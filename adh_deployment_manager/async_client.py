@@ -0,0 +1,323 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+import google.auth.credentials  # type: ignore
+import google_auth_httplib2  # type: ignore
+import httplib2  # type: ignore
+from googleapiclient.errors import HttpError  # type: ignore
+import adh_deployment_manager.metrics as metrics
+import adh_deployment_manager.utils as utils
+from adh_deployment_manager.rate_limiter import RateLimiter
+
+_ADH_ROOT_URL = "https://adsdatahub.googleapis.com/"
+_API_VERSION = "v1"
+# maximum number of connections kept open to ADH API
+_MAX_CONNECTIONS = 100
+
+
+def _import_httpx():
+    try:
+        import httpx  # type: ignore
+    except ImportError as e:
+        raise ImportError(
+            "AsyncAdhClient requires httpx, install it with "
+            "`pip install adh-deployment-manager[async]`") from e
+    return httpx
+
+
+def _is_valid(credentials) -> bool:
+    if isinstance(credentials, google.auth.credentials.Credentials):
+        return credentials.valid
+    # oauth2client credentials
+    return (credentials.access_token is not None
+            and not credentials.access_token_expired)
+
+
+def _refresh_credentials(credentials) -> None:
+    # token is refreshed over a new connection, not an authorized one
+    if isinstance(credentials, google.auth.credentials.Credentials):
+        credentials.refresh(google_auth_httplib2.Request(httplib2.Http()))
+    else:
+        credentials.refresh(httplib2.Http())
+
+
+def _to_http_error(response) -> HttpError:
+    """ Converts error response to HttpError raised by googleapiclient."""
+    resp = httplib2.Response({"status": response.status_code})
+    resp.update({key.lower(): value for key, value in response.headers.items()})
+    resp.reason = response.reason_phrase
+    return HttpError(resp, response.content, uri=str(response.url))
+
+
+class AsyncAdhClient:
+    """ asyncio client of ADH API built on httpx connection pool.
+
+    Exposes API calls made by `AnalysisQuery`, `Job` and `AdhService`, so
+    many of them can be awaited concurrently from a single thread. Calls are
+    limited by rate limiter and retried according to retry policy the same
+    way as calls made via `AdhService`, errors are raised as `HttpError`.
+
+    Args:
+      credentials: credentials used to authorize API calls.
+      developer_key: ADH developer key.
+      root_url: root URL of ADH API.
+      qps: maximum number of API calls per second, see `AdhService`.
+      rate_limiter: RateLimiter shared with other clients, takes precedence
+        over qps.
+      retry_policy: RetryPolicy which defines when failed calls are retried.
+      max_connections: maximum number of open connections; calls exceeding
+        it wait for a free connection.
+      timeout: timeout of a single HTTP request in seconds.
+      transport: httpx transport used instead of network one.
+    """
+    def __init__(self,
+                 credentials=None,
+                 developer_key=None,
+                 root_url=_ADH_ROOT_URL,
+                 qps=None,
+                 rate_limiter=None,
+                 retry_policy=None,
+                 max_connections=_MAX_CONNECTIONS,
+                 timeout=60,
+                 transport=None):
+        httpx = _import_httpx()
+        self.credentials = credentials
+        self.developer_key = developer_key
+        self.rate_limiter = rate_limiter or RateLimiter(qps)
+        self.retry_policy = retry_policy or utils.RetryPolicy()
+        self._client = httpx.AsyncClient(
+            base_url=f"{root_url.rstrip('/')}/{_API_VERSION}/",
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+            # waiting for a free connection isn't limited by timeout
+            timeout=httpx.Timeout(timeout, pool=None),
+            transport=transport)
+        self._transport_errors = (httpx.TransportError, )
+        self._timeout_errors = (httpx.TimeoutException, )
+        self._auth_lock = asyncio.Lock()
+
+    @classmethod
+    def from_service(cls, adh_service, **kwargs):
+        """ Creates client sharing credentials, developer key, root URL and
+        rate limiter of AdhService."""
+        document = adh_service.discovery_document
+        kwargs.setdefault("credentials", adh_service.credentials)
+        kwargs.setdefault("developer_key", adh_service.developer_key)
+        kwargs.setdefault(
+            "root_url",
+            document.get("rootUrl", _ADH_ROOT_URL) +
+            document.get("servicePath", ""))
+        kwargs.setdefault("rate_limiter", adh_service.rate_limiter)
+        return cls(**kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _get_auth_headers(self, refresh=False) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        if not self.credentials:
+            return headers
+        # only one coroutine refreshes the token, others wait for it
+        async with self._auth_lock:
+            if refresh or not _is_valid(self.credentials):
+                await asyncio.get_running_loop().run_in_executor(
+                    None, _refresh_credentials, self.credentials)
+            self.credentials.apply(headers)
+        return headers
+
+    async def _request(self, http_method, path, params=None, body=None):
+        params = {
+            key: value
+            for key, value in (params or {}).items() if value is not None
+        }
+        if self.developer_key:
+            params["key"] = self.developer_key
+        refreshed = False
+        while True:
+            try:
+                response = await self._client.request(
+                    http_method,
+                    path,
+                    params=params,
+                    json=body,
+                    headers=await self._get_auth_headers(refresh=refreshed))
+            except self._timeout_errors as e:
+                raise TimeoutError(str(e)) from e
+            except self._transport_errors as e:
+                raise ConnectionError(str(e)) from e
+            # expired token is refreshed once, as googleapiclient does
+            if (response.status_code == 401 and self.credentials
+                    and not refreshed):
+                refreshed = True
+                continue
+            if response.status_code >= 400:
+                raise _to_http_error(response)
+            return response.json() if response.content else {}
+
+    async def call(self,
+                   method_id: str,
+                   http_method: str,
+                   path: str,
+                   params: Optional[Dict[str, Any]] = None,
+                   body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """ Makes API call retrying it on transient errors.
+
+        Args:
+          method_id: id of API method, i.e.
+            `adsdatahub.customers.analysisQueries.list`, used by rate limiter.
+          http_method: HTTP method of the call.
+          path: path of the call relative to API version.
+          params: query parameters, None values are skipped.
+          body: JSON body of the call.
+
+        Returns:
+          Response of the API call.
+
+        Raises:
+          HttpError: if error isn't retriable or retries are exhausted.
+        """
+        policy = self.retry_policy
+        deadline = time.monotonic() + policy.deadline
+        retries = 0
+        recorder = metrics.CallRecorder(method_id, path)
+        while True:
+            delay = self.rate_limiter.reserve(method_id)
+            if delay:
+                metrics.record_sleep(metrics.RATE_LIMIT, delay)
+                await asyncio.sleep(delay)
+            recorder.start_attempt()
+            try:
+                response = await self._request(http_method, path, params,
+                                               body)
+            except (HttpError, ConnectionError, TimeoutError) as e:
+                recorder.end_attempt()
+                retries += 1
+                if not policy.is_retriable(e) or retries > policy.max_retries:
+                    recorder.finish(e)
+                    raise
+                delay = policy.get_delay(retries, e)
+                if time.monotonic() + delay > deadline:
+                    recorder.finish(e)
+                    raise
+                logging.warning(
+                    e._get_reason() if isinstance(e, HttpError) else e)
+                logging.warning(f"retrying {method_id} in {delay:.1f} seconds")
+                await asyncio.sleep(delay)
+                recorder.add_retry(delay)
+            else:
+                recorder.end_attempt()
+                recorder.finish()
+                return response
+
+    async def _list(self, method_id, path, key, params,
+                    max_pages=None) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        page_token = None
+        pages = 0
+        while True:
+            response = await self.call(method_id, "GET", path,
+                                       dict(params, pageToken=page_token))
+            items.extend(response.get(key, []))
+            pages += 1
+            page_token = response.get("nextPageToken")
+            if not page_token or (max_pages and pages >= max_pages):
+                return items
+
+    async def list_queries(self,
+                           customer_id: str,
+                           filter: Optional[str] = None,
+                           page_size: Optional[int] = None,
+                           max_pages: Optional[int] = None
+                           ) -> List[Dict[str, Any]]:
+        """ Lists queries of the customer, fetching them page by page.
+
+        Args:
+          customer_id: customer in format `customers/<customer_id>`.
+          filter: filter of queries, i.e. `title="my_query"`.
+          page_size: maximum number of queries returned by a single call.
+          max_pages: maximum number of pages fetched, all by default.
+
+        Returns:
+          List of query objects.
+        """
+        return await self._list("adsdatahub.customers.analysisQueries.list",
+                                f"{customer_id}/analysisQueries",
+                                "queries", {
+                                    "filter": filter,
+                                    "pageSize": page_size
+                                }, max_pages)
+
+    async def get_query(self, name: str) -> Dict[str, Any]:
+        return await self.call("adsdatahub.customers.analysisQueries.get",
+                               "GET", name)
+
+    async def create_query(self, customer_id: str,
+                           body: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.call("adsdatahub.customers.analysisQueries.create",
+                               "POST",
+                               f"{customer_id}/analysisQueries",
+                               body=body)
+
+    async def patch_query(self, name: str,
+                          body: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.call("adsdatahub.customers.analysisQueries.patch",
+                               "PATCH",
+                               name,
+                               body=body)
+
+    async def validate_query(self, customer_id: str,
+                             body: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.call(
+            "adsdatahub.customers.analysisQueries.validate",
+            "POST",
+            f"{customer_id}/analysisQueries:validate",
+            body=body)
+
+    async def start_query(self, name: str,
+                          body: Dict[str, Any]) -> Dict[str, Any]:
+        """ Starts query job and returns its operation."""
+        return await self.call("adsdatahub.customers.analysisQueries.start",
+                               "POST",
+                               f"{name}:start",
+                               body=body)
+
+    async def get_operation(self, name: str) -> Dict[str, Any]:
+        return await self.call("adsdatahub.operations.get", "GET", name)
+
+    async def list_operations(self,
+                              filter: Optional[str] = None,
+                              page_size: Optional[int] = None,
+                              max_pages: Optional[int] = None
+                              ) -> List[Dict[str, Any]]:
+        """ Lists operations, fetching them page by page."""
+        return await self._list("adsdatahub.operations.list", "operations",
+                                "operations", {
+                                    "filter": filter,
+                                    "pageSize": page_size
+                                }, max_pages)
+
+    async def cancel_operation(self, name: str) -> Dict[str, Any]:
+        return await self.call("adsdatahub.operations.cancel", "POST",
+                               f"{name}:cancel")
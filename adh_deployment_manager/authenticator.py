@@ -16,9 +16,7 @@
 import os
 import logging
 import pickle
-from oauth2client.service_account import ServiceAccountCredentials  # type: ignore
-from google_auth_oauthlib import flow  # type: ignore
-import google.auth  # type: ignore
+import adh_deployment_manager.profiling as profiling
 
 _SCOPE = "https://www.googleapis.com/auth/adsdatahub"
 
@@ -35,6 +33,8 @@ class BaseAuthenticator:
 class ServiceAccount(BaseAuthenticator):
     def handle(self, file):
         try:
+            # auth libraries are imported on use to keep CLI startup fast
+            from oauth2client.service_account import ServiceAccountCredentials  # type: ignore
             credentials = ServiceAccountCredentials.from_json_keyfile_name(
                 file, _SCOPE)
             return credentials
@@ -45,6 +45,7 @@ class ServiceAccount(BaseAuthenticator):
 class InstalledAppFlow(BaseAuthenticator):
     def handle(self, file):
         try:
+            from google_auth_oauthlib import flow  # type: ignore
             appflow = flow.InstalledAppFlow.from_client_secrets_file(
                 file, _SCOPE)
             appflow.run_console()
@@ -57,6 +58,7 @@ class InstalledAppFlow(BaseAuthenticator):
 class DefaultCredentials(BaseAuthenticator):
     def handle(self, file):
         try:
+            import google.auth  # type: ignore
             credentials, _ = google.auth.default()
             return credentials
         except:
@@ -74,6 +76,7 @@ class AdhAutheticator:
             authenticator_chain = new_authenticator
         return authenticator_chain
 
+    @profiling.phase("auth")
     def get_credentials(self, file, dump_to_file=True):
         credentials = self.check_local_credentials(
         ) or self.authenticator.handle(file)
@@ -16,9 +16,7 @@
 import logging
 import argparse
 import os
-from adh_deployment_manager.authenticator import AdhAutheticator
-from adh_deployment_manager.deployment import Deployment
-from adh_deployment_manager.commands_factory import CommandsFactory
+import sys
 
 logging.getLogger().setLevel(logging.INFO)
 
@@ -29,25 +27,169 @@ def execute_command(factory, command, deployment, parameters):
     executable_command.execute(**parameters)
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument("-c|--config", dest="config_path", default="config.yml")
-parser.add_argument("-q|--queries-path", dest="queries_path", default="sql")
-parser.add_argument("-l|--location", dest="location", default="sql")
-parser.add_argument("command")
-parser.add_argument("subcommand", nargs="?")
-args = parser.parse_args()
-
-credentials = AdhAutheticator().get_credentials(os.environ['ADH_SECRET_FILE'])
-DEVELOPER_KEY = os.environ['ADH_DEVELOPER_KEY']
-config = os.path.join(os.getcwd(), args.config_path)
-deployment = Deployment(config=config,
-                        developer_key=DEVELOPER_KEY,
-                        credentials=credentials,
-                        queries_folder=os.path.join(os.getcwd(),
-                                                    args.queries_path))
-extra_parameters = vars(args)
-command = extra_parameters["command"]
-factory = CommandsFactory()
-for command in [args.subcommand, command]:
-    if command:
-        execute_command(factory, command, deployment, extra_parameters)
+def parse_args(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c|--config",
+                        dest="config_paths",
+                        action="append",
+                        default=None)
+    parser.add_argument("-q|--queries-path", dest="queries_path", default="sql")
+    parser.add_argument("-l|--location", dest="location", default="sql")
+    parser.add_argument("-w",
+                        "--workers",
+                        dest="max_workers",
+                        type=int,
+                        default=1)
+    parser.add_argument("-r", "--qps", dest="qps", type=float, default=None)
+    parser.add_argument("--discovery-document",
+                        dest="discovery_document",
+                        default=os.environ.get("ADH_DISCOVERY_DOCUMENT"))
+    parser.add_argument("--root-url",
+                        dest="root_url",
+                        default=os.environ.get("ADH_ROOT_URL"))
+    parser.add_argument("--query-index-ttl",
+                        dest="query_index_ttl",
+                        type=int,
+                        default=None)
+    parser.add_argument("--state-ttl", dest="state_ttl", type=int, default=3600)
+    parser.add_argument("--metrics-file", dest="metrics_file", default=None)
+    parser.add_argument("--events-file", dest="events_file", default=None)
+    parser.add_argument("--trace-file", dest="trace_file", default=None)
+    parser.add_argument("--profile", dest="profile", default=None)
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true")
+    parser.add_argument("--resume", dest="resume", action="store_true")
+    parser.add_argument("--skip-existing",
+                        dest="skip_existing",
+                        action="store_true")
+    parser.add_argument("command")
+    parser.add_argument("subcommand", nargs="?")
+    return parser.parse_args(args)
+
+
+def get_queries_path(config_path, queries_path, is_multi_config):
+    """ Returns location of queries for the config.
+
+    If several configs are executed relative queries path is resolved
+    against directory of each config, otherwise against current directory.
+    """
+    if is_multi_config:
+        return os.path.join(os.path.dirname(config_path), queries_path)
+    return os.path.join(os.getcwd(), queries_path)
+
+
+def add_metrics_hooks(args):
+    """ Starts recording API calls to files requested in arguments.
+
+    Returns:
+      List of added metrics hooks.
+    """
+    import adh_deployment_manager.metrics as metrics
+    hooks = []
+    if args.metrics_file:
+        hooks.append(metrics.add_hook(metrics.MetricsCollector()))
+    if args.events_file:
+        hooks.append(metrics.add_hook(metrics.JsonLinesExporter(
+            args.events_file)))
+    if args.trace_file:
+        hooks.append(
+            metrics.add_hook(
+                metrics.OpenTelemetryExporter(path=args.trace_file)))
+    return hooks
+
+
+def close_metrics_hooks(args, hooks):
+    """ Stops recording API calls and writes collected metrics."""
+    import adh_deployment_manager.metrics as metrics
+    for hook in hooks:
+        metrics.remove_hook(hook)
+        if isinstance(hook, metrics.MetricsCollector):
+            hook.write_prometheus(args.metrics_file)
+        hook.close()
+
+
+def main(args=None):
+    args = parse_args(args)
+    if not args.profile:
+        run(args)
+        return
+    from adh_deployment_manager.profiling import Profiler
+    profiler = Profiler().start()
+    try:
+        run(args)
+    finally:
+        profiler.stop()
+        profiler.write(args.profile)
+        logging.info(f"Profile is written to {args.profile}")
+
+
+def run(args):
+    # imported after parsing arguments so `adm --help` doesn't load
+    # API client and auth libraries
+    import adh_deployment_manager.profiling as profiling
+    with profiling.phase("import"):
+        from adh_deployment_manager.authenticator import AdhAutheticator
+        from adh_deployment_manager.adh_service import AdhService
+        from adh_deployment_manager.deployment import Deployment
+        from adh_deployment_manager.query_index import QueryIndex
+        from adh_deployment_manager.commands_factory import CommandsFactory
+    # fake ADH API doesn't need credentials
+    if args.root_url and "ADH_SECRET_FILE" not in os.environ:
+        credentials = None
+    else:
+        credentials = AdhAutheticator().get_credentials(
+            os.environ['ADH_SECRET_FILE'])
+    DEVELOPER_KEY = os.environ['ADH_DEVELOPER_KEY']
+    # all configs share credentials, service, its connections and query index
+    adh_service = AdhService(credentials,
+                             DEVELOPER_KEY,
+                             qps=args.qps,
+                             discovery_document=args.discovery_document,
+                             root_url=args.root_url)
+    query_index = QueryIndex(adh_service, ttl=args.query_index_ttl)
+    config_paths = [
+        os.path.join(os.getcwd(), config_path)
+        for config_path in args.config_paths or ["config.yml"]
+    ]
+    extra_parameters = dict(vars(args))
+    for parameter in ("config_paths", "qps", "discovery_document",
+                      "root_url", "query_index_ttl", "state_ttl",
+                      "metrics_file", "events_file", "trace_file", "profile"):
+        extra_parameters.pop(parameter)
+    factory = CommandsFactory()
+    failed_configs = []
+    hooks = add_metrics_hooks(args)
+    try:
+        for config in config_paths:
+            if len(config_paths) > 1:
+                logging.info(f"Processing config {config}...")
+            try:
+                deployment = Deployment(
+                    config=config,
+                    developer_key=DEVELOPER_KEY,
+                    credentials=credentials,
+                    queries_folder=get_queries_path(config, args.queries_path,
+                                                    len(config_paths) > 1),
+                    state_ttl=args.state_ttl,
+                    adh_service=adh_service,
+                    query_index=query_index)
+                for command in [args.subcommand, args.command]:
+                    if command:
+                        execute_command(factory, command, deployment,
+                                        dict(extra_parameters,
+                                             config_path=config))
+            except Exception as e:
+                # single config is failed as before, other configs are executed
+                # even if one of them fails
+                if len(config_paths) == 1:
+                    raise
+                logging.exception(f"Config {config} failed: {e}")
+                failed_configs.append(config)
+    finally:
+        close_metrics_hooks(args, hooks)
+    if failed_configs:
+        logging.error(f"Failed configs: {', '.join(failed_configs)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,43 @@
+import importlib
+
 from .abs_command import AbsCommand
-from .deploy import Deployer
-from .fetch import Fetcher
-from .update import Updater
-from .run import Runner
-from .populate import Populator
 from .null import NullCommand
+
+# command name -> (module, class); modules are imported only when
+# the command is executed, so CLI startup doesn't pay for all of them
+COMMANDS = {
+    "deploy": ("deploy", "Deployer"),
+    "fetch": ("fetch", "Fetcher"),
+    "update": ("update", "Updater"),
+    "run": ("run", "Runner"),
+    "populate": ("populate", "Populator"),
+    "plan": ("plan", "Planner"),
+}
+
+_CLASSES = {
+    class_name: module
+    for module, class_name in COMMANDS.values()
+}
+
+
+def get_command_class(command):
+    """ Imports class implementing the command.
+
+    Args:
+      command: name of the command, i.e. `deploy`.
+
+    Returns:
+      Command class or None if command is unknown.
+    """
+    if command not in COMMANDS:
+        return None
+    module, class_name = COMMANDS[command]
+    return getattr(importlib.import_module(f".{module}", __name__), class_name)
+
+
+def __getattr__(name):
+    # keeps `commands.Deployer` working without importing every command
+    if name in _CLASSES:
+        module = importlib.import_module(f".{_CLASSES[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
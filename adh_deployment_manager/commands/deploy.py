@@ -1,4 +1,5 @@
 from .abs_command import AbsCommand
+from adh_deployment_manager.diff import CREATE, UNCHANGED, UPDATE, format_changes
 import logging
 
 class Deployer(AbsCommand):
@@ -6,34 +7,68 @@ class Deployer(AbsCommand):
                  deployment):
        self.deployment = deployment
 
-    def execute(self, update=False, **kwargs):
-        deployed_queries = []
+    def execute(self, update=False, dry_run=False, **kwargs):
         # iterate over each query in config
-        queries = self.deployment._get_queries(is_buildable=True)
-        for adh_query, analysis_query in queries:
+        queries = list(self.deployment._get_queries(is_buildable=True))
+        # check if queries with provided titles are found in the project
+        query_results = self.deployment._fetch_queries(
+            [analysis_query for _, analysis_query in queries])
+        # only queries that differ from deployed ones are created or updated
+        changes = self.deployment._diff_queries(queries, query_results)
+        if dry_run:
+            print(format_changes([
+                change for change in changes
+                if update or change.action != UPDATE
+            ]))
+            return changes
+        operations = []
+        for change in changes:
+            adh_query, analysis_query = change.adh_query, change.analysis_query
             query = adh_query.title
-            # check if query with provided title is found in the project
-            if not analysis_query.get():
+            if change.action == CREATE:
                 logging.info(f"deploying query: {query}...")
-                # deploy query
-                deployed_query = analysis_query.deploy()
-                # add query to the list of deployed queries
-                deployed_queries.append(deployed_query)
-                self.queries[query] = deployed_query.get("name")
-            # if update flag is specified update existing query
-            elif update:
-                logging.info(f"updating query: {query}...")
-                deployed_query = analysis_query.update(
-                    title=adh_query.title,
-                    text=adh_query.text,
-                    parameters=adh_query.parameters,
-                    filtered_row_summary=adh_query.filtered_row_summary)
-                deployed_queries.append(deployed_query)
-                self.deployment.queries[query] = deployed_query.get("name")
+                operations.append(
+                    (change, analysis_query._create(),
+                     analysis_query._set_from_deploy_response))
+            # unchanged query is recorded in state whether updating or not
+            elif change.action == UNCHANGED:
+                logging.info(f"query {query} is up to date.")
+                self.deployment._set_state(change, change.remote_query)
             # if query is in the project already do nothing
-            else:
+            elif not update:
                 logging.warning(
                     f"query {query} cannot be deployed because it exists.")
+            # if update flag is specified update changed query
+            elif change.action == UPDATE:
+                logging.info(f"updating query: {query}...")
+                operations.append(
+                    (change,
+                     analysis_query._update(
+                         title=adh_query.title,
+                         text=adh_query.text,
+                         parameters=adh_query.parameters,
+                         filtered_row_summary=adh_query.filtered_row_summary),
+                     analysis_query._set_from_update_response))
+        # deploy and update queries using batch requests
+        responses = self.deployment.adh_service.execute_batch(
+            [request for _, request, _ in operations], return_exceptions=True)
+        deployed_queries = []
+        errors = []
+        for (change, _, set_from_response), deployed_query in zip(
+                operations, responses):
+            # state of successfully deployed queries is kept on failure
+            if isinstance(deployed_query, Exception):
+                logging.error(f"cannot deploy query "
+                              f"{change.adh_query.title}: {deployed_query}")
+                errors.append(deployed_query)
+                continue
+            set_from_response(deployed_query)
+            self.deployment._set_state(change, deployed_query)
+            # add query to the list of deployed queries
+            deployed_queries.append(deployed_query)
+            self.deployment.queries[
+                change.analysis_query.title] = deployed_query.get("name")
+        self.deployment.state.save()
+        if errors:
+            raise errors[0]
         return deployed_queries
-
-
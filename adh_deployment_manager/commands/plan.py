@@ -0,0 +1,15 @@
+from .abs_command import AbsCommand
+from adh_deployment_manager.diff import format_changes
+
+class Planner(AbsCommand):
+    def __init__(self,
+                 deployment):
+        self.deployment = deployment
+
+    def execute(self, **kwargs):
+        # changes are computed from local state and files, ADH is called
+        # only for queries with missing or stale state
+        queries = list(self.deployment._get_queries(is_buildable=True))
+        changes = self.deployment._plan_queries(queries)
+        print(format_changes(changes))
+        return changes
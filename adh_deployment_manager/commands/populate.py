@@ -7,11 +7,16 @@ class Populator(AbsCommand):
         self.deployment = deployment
 
     def execute(self, location, **kwargs):
-        queries = self.deployment._get_queries()
-        for adh_query, analysis_query in queries:
-            query_output = analysis_query.get()
+        queries = list(self.deployment._get_queries())
+        query_outputs = self.deployment._fetch_queries(
+            [analysis_query for _, analysis_query in queries])
+        populated_queries = set()
+        for (adh_query, analysis_query), query_output in zip(
+                queries, query_outputs):
             logging.debug(query_output)
-            if query_output:
+            # populate each query once, from the first customer that has it
+            if query_output and adh_query.title not in populated_queries:
+                populated_queries.add(adh_query.title)
                 analysis_query.dump(location)
                 query_result = query_output.get("queries")[0]
                 if query_result.get("parameterTypes"):
@@ -24,4 +29,3 @@ class Populator(AbsCommand):
                         print(
                             f'{field}: {values.get("type")}: {values.get("value").get("value")}'
                         )
-            break
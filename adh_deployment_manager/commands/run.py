@@ -1,15 +1,29 @@
 from .abs_command import AbsCommand
 from .deploy import Deployer
-from adh_deployment_manager.utils import format_date, get_file_content, execute_adh_api_call_with_retry
-from adh_deployment_manager.job import wait_for_query_success
+from adh_deployment_manager.utils import execute_adh_api_call_with_retry, list_bq_tables
+from adh_deployment_manager.dates import get_date_windows
+from adh_deployment_manager.job import OperationPoller, PollingPolicy, get_operations_status, wait_for_query_success
+import adh_deployment_manager.journal as journal
+from adh_deployment_manager.scheduler import DagScheduler, Node
+from collections import OrderedDict
 import logging
+import threading
+
+
+def format_jobs(jobs) -> str:
+    """ Returns human-readable report of jobs that would be launched."""
+    lines = [f"> launch    {job[1]} into {job[4]}" for job in jobs]
+    lines.append(f"{len(jobs)} to launch.")
+    return "\n".join(lines)
+
 
 class Runner(AbsCommand):
     def __init__(self,
                  deployment):
         self.deployment = deployment
-        self.adh_service = deployment.adh_service.adh_service
+        self.adh_service = deployment.adh_service
         self.config = deployment.config
+        self._existing_tables = set()
 
     def launch_job(self, job, wait):
         launched_job = execute_adh_api_call_with_retry(job)
@@ -20,73 +34,222 @@ class Runner(AbsCommand):
                                    launched_job.get("name"))
         return launched_job.get("name")
 
-    def execute(self, deploy=False, update=False, **kwargs):
-        from collections import deque
-        # TODO: evaluate whether we need deque
-        job_queue = deque()
-        # TODO: return Job instance instead of operation names
-        launched_job_queue = deque()
+    def _get_resumed_operation(self, key):
+        """ Returns operation of the job launched by the previous run if it's
+        still running or succeeded, so it shouldn't be launched again."""
+        record = self.journal.get(key)
+        if not record or not record.get("operation"):
+            return None
+        status = record.get("status")
+        if status == journal.LAUNCHED:
+            # jobs which weren't awaited by the previous run; jobs missing
+            # from the listing are re-attached and polled until they finish
+            status = self._resumed_statuses.get(record["operation"],
+                                                {}).get("status", "Running")
+        if status in ("Running", journal.SUCCESS):
+            return record["operation"]
+        return None
+
+    def _build_and_launch_job(self, job):
+        analysis_query, query_identifier, start_date, end_date, \
+            output_table_name, parameters, polling_policy, kwargs = job
+        key = journal.get_job_key(analysis_query.customer_id,
+                                  query_identifier, start_date, end_date,
+                                  output_table_name)
+        launched_job = self._get_resumed_operation(
+            key) if self._resume else None
+        if launched_job:
+            logging.info(f"re-attaching {query_identifier} to {launched_job}")
+            adh_job = None
+        else:
+            # job is journaled before it's launched, so the next run knows
+            # about it even if this one is killed
+            self.journal.record(key,
+                                status=journal.PLANNED,
+                                query=analysis_query.title,
+                                customerId=analysis_query.customer_id,
+                                startDate=start_date,
+                                endDate=end_date,
+                                destTable=output_table_name)
+            try:
+                adh_job = analysis_query._run(start_date, end_date,
+                                              output_table_name, parameters,
+                                              **kwargs)
+                launched_job = self.launch_job(job=adh_job, wait=False)
+            except Exception as e:
+                self.journal.record(key, status=journal.FAILED, error=str(e))
+                raise
+            self.journal.record(key,
+                                status=journal.LAUNCHED,
+                                operation=launched_job)
+        with self._lock:
+            self._launched_jobs.append((query_identifier, adh_job,
+                                        launched_job))
+            self._polling_policies[launched_job] = polling_policy
+            self._journal_keys[launched_job] = key
+        self.deployment.state.set(analysis_query.customer_id,
+                                  analysis_query.title,
+                                  lastOperation=launched_job)
+        return launched_job
+
+    def _wait_for_jobs(self, operations):
+        # watch all operations at once so they are polled together
+        futures = [
+            self.poller.watch(operation,
+                              self._polling_policies.get(operation))
+            for operation in operations
+        ]
+        statuses = [future.result() for future in futures]
+        for operation, operation_status in zip(operations, statuses):
+            self.journal.record(self._journal_keys[operation],
+                                status=operation_status.get("status"),
+                                errors=operation_status.get("errors"))
+        return statuses
+
+    def _get_jobs_for_query(self, query, query_for_run):
+        """ Splits query into jobs that should be launched.
+
+        In batch mode query is launched for each date window, skipping
+        windows whose output tables are known to exist.
+
+        Returns:
+          List of tuples (query_identifier, start_date, end_date,
+          output_table_name)
+        """
+        output_table_suffix = query_for_run.get("output_table_suffix")
+        table_name = f"{query}{output_table_suffix}" if output_table_suffix else query
+        dataset = f"{self.config.bq_project}.{self.config.bq_dataset}"
+        if not query_for_run.get("batch_mode"):
+            #TODO: if query failed due to 100,000 user sets error, switch to batch mode
+            return [(f"{query}", query_for_run.get("start_date"),
+                     query_for_run.get("end_date"), f"{dataset}.{table_name}")]
+        jobs = []
+        for start_date, end_date in get_date_windows(
+                query_for_run.get("start_date"), query_for_run.get("end_date"),
+                query_for_run.get("batch_window")):
+            date_suffix = start_date.strftime('%Y%m%d')
+            output_table = f"{output_table_suffix or query}_{date_suffix}"
+            if output_table in self._existing_tables:
+                logging.info(f"skipping {query} for {start_date}: "
+                             f"table {output_table} exists")
+                continue
+            jobs.append((f"{query}_{date_suffix}", start_date.isoformat(),
+                         end_date.isoformat(), f"{dataset}.{output_table}"))
+        return jobs
 
+    def _get_nodes(self, **kwargs):
+        """ Builds dependency graph nodes from query blocks in config."""
+        nodes = OrderedDict()
+        # iterate over queries in config
+        queries = list(self.deployment._get_queries())
+        query_results = self.deployment._fetch_queries(
+            [analysis_query for _, analysis_query in queries])
+        for (adh_query, analysis_query), query_result in zip(
+                queries, query_results):
+            query = adh_query.title
+            # check if query can be found in the project
+            if not query_result:
+                logging.error(
+                    f"{query} is not found for customer {analysis_query.customer_id}")
+                continue
+            self.deployment.state.set(
+                analysis_query.customer_id,
+                query,
+                name=analysis_query.name,
+                updateTime=query_result["queries"][0].get("updateTime"))
+            query_for_run = self.config.queries[query]
+            logging.info(f"setting up query for run: {query}...")
+            polling = query_for_run.get("polling")
+            polling_policy = PollingPolicy(**polling) if polling else None
+            block = query_for_run.get("block")
+            if block not in nodes:
+                nodes[block] = Node(block, query_for_run.get("depends_on"))
+            node = nodes[block]
+            # `wait: each` launches every query only after the previous one
+            # succeeds, otherwise queries in a block are launched together
+            if not node.stages or (query_for_run.get("wait_mode") == "each"
+                                   and node.stages[-1]
+                                   and node.stages[-1][-1][0].title != query):
+                node.stages.append([])
+            for (query_identifier, start_date, end_date,
+                 output_table_name) in self._get_jobs_for_query(
+                     query, query_for_run):
+                node.stages[-1].append(
+                    (analysis_query, query_identifier, start_date, end_date,
+                     output_table_name, query_for_run.get("parameters"),
+                     polling_policy, kwargs))
+        return list(nodes.values())
+
+    def execute(self,
+                deploy=False,
+                update=False,
+                max_workers=1,
+                dry_run=False,
+                skip_existing=False,
+                resume=False,
+                **kwargs):
+        """ Launches queries from config.
 
+        Each query block is a node in a dependency graph; a block is launched
+        as soon as all blocks it depends on succeed, and up to `max_workers`
+        jobs are launched concurrently. With `dry_run` jobs are only listed.
+        With `skip_existing` batch jobs whose output tables exist in BigQuery
+        are not launched. Launched jobs are recorded in run journal; with
+        `resume` jobs that are still running or succeeded in the previous
+        run are re-attached to instead of being launched again.
+        """
         if not self.config.bq_project or not self.config.bq_dataset:
             logging.error("BQ project and/or dataset weren't provided")
             raise ValueError(
                 "BQ project and dataset are required to run the queries!")
         if deploy:
-            deployer = Deployer(deployment)
-            deployer.execute(update=update)
-        # iterate over queries in config
-        queries = self.deployment._get_queries()
-        for adh_query, analysis_query in queries:
-            query = adh_query.title
-            # check if deployment already contains name of the query
-            if query not in self.config.queries.keys():
-                # deploy query if it's not in the project
-                if not analysis_query.get():
-                    # check if `deploy` option is specified
-                    logging.error(
-                        f"{query} is not found for customer {customer_id}")
-                    continue
-            query_for_run = self.config.queries[query]
-            logging.info(f"setting up query for run: {query}...")
-            output_table_suffix = query_for_run.get("output_table_suffix")
-            table_name = f"{query}{output_table_suffix}" if output_table_suffix else query
-            if not query_for_run.get("batch_mode"):
-                #TODO: if query failed due to 100,000 user sets error, switch to batch mode
-                job = analysis_query._run(
-                    query_for_run.get("start_date"),
-                    query_for_run.get("end_date"),
-                    f"{self.config.bq_project}.{self.config.bq_dataset}.{table_name}",
-                    query_for_run.get("parameters"), **kwargs)
-                launched_job = self.launch_job(job=job,
-                                          wait=query_for_run.get("wait"))
-                job_queue.append({
-                    "job_obj": job,
-                    "wait_status": query_for_run.get("wait"),
-                    "query_identifier": f"{query}"
-                })
-            else:
-                min_date = format_date(query_for_run, "start_date")
-                max_date = format_date(query_for_run, "end_date")
-                dates_array = date_range(min_date, max_date, freq='d')
-                for i, date in enumerate(dates_array):
-                    fetching_date = date.strftime("%Y-%m-%d")
-                    job = analysis_query._run(
-                        fetching_date, fetching_date,
-                        f"{self.config.bq_project}.{self.config.bq_dataset}.{output_table_suffix}_{date.strftime('%Y%m%d')}",
-                        query_for_run.get("parameters"), **kwargs)
-                    if i == (len(dates_array) - 1):
-                        wait = query_for_run.get("wait")
-                    else:
-                        wait = False
-                    launched_job = self.launch_job(job, wait=wait)
-                    job_queue.append({
-                        "job_obj":
-                        job,
-                        "wait_status":
-                        wait,
-                        "query_identifier":
-                        f"{query}_{date.strftime('%Y%m%d')}"
-                    })
-            launched_job_queue.append(launched_job)
-        return {"jobs": job_queue, "launched_jobs": launched_job_queue}
+            deployer = Deployer(self.deployment)
+            deployer.execute(update=update, dry_run=dry_run)
+        self._existing_tables = list_bq_tables(
+            self.config.bq_project,
+            self.config.bq_dataset) if skip_existing else set()
+        if dry_run:
+            print(
+                format_jobs([
+                    job for node in self._get_nodes(**kwargs)
+                    for stage in node.stages for job in stage
+                ]))
+            return {"jobs": [], "launched_jobs": []}
+        self._lock = threading.Lock()
+        self._launched_jobs = []
+        self._polling_policies = {}
+        self._journal_keys = {}
+        self.journal = self.deployment.journal
+        self._resume = resume
+        self._resumed_statuses = {}
+        if resume:
+            logging.info(f"resuming run of {len(self.journal)} journaled jobs")
+            self._resumed_statuses = get_operations_status(
+                self.adh_service, [
+                    record["operation"] for record in self.journal.values()
+                    if record.get("status") == journal.LAUNCHED
+                    and record.get("operation")
+                ])
+        else:
+            self.journal.reset()
+        # all launched jobs are tracked by a single polling loop
+        self.poller = OperationPoller(self.adh_service)
+        scheduler = DagScheduler(launch_job=self._build_and_launch_job,
+                                 wait_for_jobs=self._wait_for_jobs,
+                                 max_workers=max_workers)
+        try:
+            nodes = scheduler.run(self._get_nodes(**kwargs))
+        finally:
+            self.deployment.state.save()
+            self.journal.close()
+        failed_nodes = [node for node in nodes if node.error]
+        if failed_nodes:
+            raise failed_nodes[0].error
+        return {
+            "jobs": [{
+                "job_obj": job,
+                "query_identifier": query_identifier
+            } for query_identifier, job, _ in self._launched_jobs],
+            "launched_jobs":
+            [launched_job for _, _, launched_job in self._launched_jobs]
+        }
@@ -1,26 +1,60 @@
 import logging
 from .abs_command import AbsCommand
+from adh_deployment_manager.diff import CREATE, UPDATE, format_changes
 
 class Updater(AbsCommand):
     def __init__(self,
                  deployment):
        self.deployment = deployment
 
-    def execute(self, **kwargs):
-        updated_queries = []
-        queries = self.deployment._get_queries(is_buildable=True)
-        for adh_query, analysis_query in queries:
+    def execute(self, dry_run=False, **kwargs):
+        queries = list(self.deployment._get_queries(is_buildable=True))
+        query_results = self.deployment._fetch_queries(
+            [analysis_query for _, analysis_query in queries])
+        # only queries that differ from deployed ones are updated
+        changes = self.deployment._diff_queries(queries, query_results)
+        if dry_run:
+            print(format_changes(
+                [change for change in changes if change.action != CREATE]))
+            return changes
+        updates = []
+        for change in changes:
+            adh_query, analysis_query = change.adh_query, change.analysis_query
             query = adh_query.title
-            if analysis_query.get():
+            if change.action == UPDATE:
                 logging.info(f"updating query: {query}...")
-                updated_query = analysis_query.update(
-                    title=adh_query.title,
-                    text=adh_query.text,
-                    parameters=adh_query.parameters)
-                updated_queries.append(updated_query)
-                self.deployment.queries[query] = updated_query.get("name")
-            else:
+                updates.append((change,
+                                analysis_query._update(
+                                    title=adh_query.title,
+                                    text=adh_query.text,
+                                    parameters=adh_query.parameters,
+                                    filtered_row_summary=adh_query.
+                                    filtered_row_summary)))
+            elif change.action == CREATE:
                 logging.warning(
                     f"query {query} cannot be found, would you like to deploy?"
                 )
+            else:
+                logging.info(f"query {query} is up to date.")
+                self.deployment._set_state(change, change.remote_query)
+        # update queries using batch requests
+        responses = self.deployment.adh_service.execute_batch(
+            [request for _, request in updates], return_exceptions=True)
+        updated_queries = []
+        errors = []
+        for (change, _), updated_query in zip(updates, responses):
+            # state of successfully updated queries is kept on failure
+            if isinstance(updated_query, Exception):
+                logging.error(f"cannot update query "
+                              f"{change.adh_query.title}: {updated_query}")
+                errors.append(updated_query)
+                continue
+            change.analysis_query._set_from_update_response(updated_query)
+            self.deployment._set_state(change, updated_query)
+            updated_queries.append(updated_query)
+            self.deployment.queries[
+                change.analysis_query.title] = updated_query.get("name")
+        self.deployment.state.save()
+        if errors:
+            raise errors[0]
         return updated_queries
@@ -1,7 +1,17 @@
-from inspect import getmembers, isclass, isabstract, getfile
-from pathlib import Path
+from importlib import metadata
 import adh_deployment_manager.commands as commands
 
+# entry point group for commands provided by other packages
+_ENTRY_POINT_GROUP = "adh_deployment_manager.commands"
+
+
+def _get_entry_points():
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        return entry_points.select(group=_ENTRY_POINT_GROUP)
+    return entry_points.get(_ENTRY_POINT_GROUP, [])
+
+
 class CommandsFactory:
     commands = {}
 
@@ -13,15 +23,26 @@ class CommandsFactory:
             print(command)
 
     def load_commands(self):
-        classes = getmembers(commands,
-                             lambda m: isclass(m) and not isabstract(m))
-        for _, _type in classes:
-            if isclass(_type) and issubclass(_type, commands.AbsCommand):
-                command = Path(getfile(_type)).stem
-                self.commands.update([[command, _type]])
+        # built-in commands are registered by name and imported on use
+        self.commands.update({command: None for command in commands.COMMANDS})
+
+    def _get_command_class(self, command):
+        if self.commands.get(command):
+            return self.commands[command]
+        _type = commands.get_command_class(command)
+        if not _type:
+            # metadata is scanned only for commands which aren't built-in
+            for entry_point in _get_entry_points():
+                if entry_point.name == command:
+                    _type = entry_point.load()
+                    break
+        if _type:
+            self.commands[command] = _type
+        return _type
 
     def create_command(self, command, deployment):
-        if command in self.commands:
-            return self.commands[command](deployment)
+        _type = self._get_command_class(command)
+        if _type:
+            return _type(deployment)
         else:
             return commands.NullCommand(command)
@@ -13,18 +13,98 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-#TODO: validate config
-
 import logging
 import os
 import yaml
 from collections import OrderedDict
-import adh_deployment_manager.utils as utils
+from datetime import date, datetime, timedelta
+from types import MappingProxyType
+from typing import Any, Dict, List, Tuple
+import adh_deployment_manager.profiling as profiling
+from adh_deployment_manager.dates import parse_window
+from adh_deployment_manager.scheduler import DagScheduler, Node
+
+# C implementation of YAML parser is much faster if it's available
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+_WAIT_MODES = ("each", "block")
+_EXECUTION_MODES = ("normal", "batch")
+_FILTERED_ROW_SUMMARY_TYPES = ("SUM", "CONSTANT")
+_POLLING_KEYS = ("initial_delay", "delay", "multiplier", "max_delay",
+                 "jitter", "use_expected_duration")
+_CONFIG_KEYS = ("include", "developer_key", "customer_id", "ads_data_from",
+                "bq_project", "bq_dataset", "date_range_setup",
+                "queries_setup")
+_BLOCK_KEYS = ("name", "queries", "parameters", "filtered_row_summary",
+               "execution_mode", "wait", "depends_on", "polling", "replace",
+               "output_table_suffix", "date_range_setup", "date_range",
+               "batch_window")
+
+
+class ConfigError(ValueError):
+    """ Raised when config is invalid."""
+
+
+class _Record:
+    """ Read-only record which can be accessed both as object and as dict."""
+    __slots__: Tuple[str, ...] = ()
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            object.__setattr__(self, field, fields.get(field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def keys(self):
+        return self.__slots__
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}"
+                           for field in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class QuerySetup(_Record):
+    """ Setup of a query from `queries_setup` block of config."""
+    __slots__ = ("title", "start_date", "end_date", "wait", "parameters",
+                 "filtered_row_summary", "batch_mode", "replacements",
+                 "output_table_suffix", "block", "depends_on", "wait_mode",
+                 "polling", "batch_window")
+
+
+class BlockSetup(_Record):
+    """ Block of queries from `queries_setup` of config."""
+    __slots__ = ("name", "depends_on", "wait_mode", "queries")
 
 
 class Config:
+    """ Config of deployment.
+
+    Args:
+      path: location of config file or already loaded config as a dict.
+      working_directory: directory which path (or files included by
+        config dict) is relative to.
+    """
+    @profiling.phase("config")
     def __init__(self, path, working_directory=None):
-        self.path = path
+        if isinstance(path, dict):
+            self.path = None
+            self._config = path
+        else:
+            self.path = path
+            self._config = None
         self.working_directory = working_directory
         # TODO: duplicate fields for config
         self.config = self.get_config()
@@ -41,6 +121,8 @@ class Config:
     def _atomic_to_list(self, obj):
         if isinstance(obj, list):
             return obj
+        elif obj is None:
+            return []
         else:
             return [obj]
 
@@ -63,70 +145,212 @@ class Config:
         if date_string.find("YYYYMMDD") == -1:
             return date_string
         else:
-            from datetime import date, timedelta
             days_ago = date_string.index("-") + 1
             new_date = date.today() - timedelta(
                 days=int(date_string[days_ago:]))
             return new_date.strftime("%Y-%m-%d")
 
-    # TODO: make get_config independent of a file (we can specify it as already
-    # provided structure (yaml was already loaded)
+    def _resolve_date(self, date_range_setup, base, location):
+        """ Converts date from config and checks its format."""
+        value = date_range_setup.get(base)
+        if value is None:
+            return None
+        try:
+            resolved_date = self._convert_date(str(value))
+            datetime.strptime(resolved_date, "%Y-%m-%d")
+        except ValueError:
+            raise ConfigError(
+                f"{location}: {base} should be either YYYY-MM-DD or "
+                f"YYYYMMDD-<days>, got {value}")
+        return resolved_date
+
+    def _read_config(self, path, included_from=()):
+        """ Reads config file together with files it includes."""
+        path = os.path.abspath(path)
+        if path in included_from:
+            raise ConfigError(
+                f"Circular include: {' -> '.join(included_from + (path,))}")
+        with open(path, "r") as config:
+            cfg = yaml.load(config, Loader=_YAML_LOADER) or {}
+        if not isinstance(cfg, dict):
+            raise ConfigError(f"{path}: config should be a mapping")
+        return self._include(cfg, os.path.dirname(path),
+                             included_from + (path, ))
+
+    def _include(self, cfg, directory, included_from=()):
+        """ Merges config with config files it includes.
+
+        Included files are read first; their `queries_setup` blocks go
+        before the blocks of the including config and other keys are
+        overridden by the including config.
+
+        Args:
+          cfg: config as a dict.
+          directory: directory which included paths are relative to.
+          included_from: files which included the config.
+        """
+        includes = self._atomic_to_list(cfg.get("include"))
+        if not includes:
+            return cfg
+        merged: Dict[str, Any] = {}
+        queries_setup: List[Any] = []
+        for include in includes:
+            included = self._read_config(os.path.join(directory, str(include)),
+                                         included_from)
+            queries_setup.extend(included.pop("queries_setup", None) or [])
+            merged.update(included)
+        merged.update(cfg)
+        merged.pop("include")
+        merged["queries_setup"] = queries_setup + (cfg.get("queries_setup")
+                                                   or [])
+        return merged
+
     def get_config(self):
-        """ Read config.yml file and return key elements."""
+        """ Read config.yml file and return key elements.
+
+        If config was provided as a dict it's used instead of a file, with
+        included files resolved relative to working directory.
+        """
+        if self._config is not None:
+            return self._include(self._config, self.working_directory
+                                 or os.getcwd())
         if not self.working_directory:
             self.working_directory = os.path.dirname(__file__)
-        with open(os.path.join(self.working_directory, self.path),
-                  "r") as config:
-            cfg = yaml.load(config, Loader=yaml.SafeLoader)
-            return cfg
+        return self._read_config(
+            os.path.join(self.working_directory, self.path))
+
+    def _validate_block(self, i, setups):
+        """ Checks that block of queries_setup follows config schema."""
+        location = f"queries_setup[{i}]"
+        if not isinstance(setups, dict):
+            raise ConfigError(f"{location}: block should be a mapping")
+        if "queries" not in setups:
+            raise ConfigError(f"{location}: no queries specified in block")
+        for key in setups:
+            if key not in _BLOCK_KEYS:
+                logging.warning(f"{location}: unknown key {key} is ignored")
+        queries = self._atomic_to_list(setups.get("queries"))
+        if not all(isinstance(query, str) for query in queries):
+            raise ConfigError(f"{location}: queries should be query titles")
+        if setups.get("wait") not in (None, ) + _WAIT_MODES:
+            raise ConfigError(f"{location}: wait should be one of "
+                              f"{', '.join(_WAIT_MODES)}")
+        if setups.get("execution_mode") not in (None, ) + _EXECUTION_MODES:
+            raise ConfigError(f"{location}: execution_mode should be one of "
+                              f"{', '.join(_EXECUTION_MODES)}")
+        for key in ("parameters", "filtered_row_summary", "polling",
+                    "replace", "date_range_setup", "date_range"):
+            if not isinstance(setups.get(key) or {}, dict):
+                raise ConfigError(f"{location}: {key} should be a mapping")
+        for parameter, values in (setups.get("parameters") or {}).items():
+            if not isinstance(values, dict) or not values.get("type"):
+                raise ConfigError(
+                    f"{location}: parameter {parameter} should have type")
+        for column, values in (setups.get("filtered_row_summary")
+                               or {}).items():
+            if not isinstance(values, dict) or values.get(
+                    "type") not in _FILTERED_ROW_SUMMARY_TYPES:
+                raise ConfigError(
+                    f"{location}: filtered row summary column {column} "
+                    f"should have type {' or '.join(_FILTERED_ROW_SUMMARY_TYPES)}"
+                )
+        try:
+            parse_window(setups.get("batch_window"))
+        except ValueError as e:
+            raise ConfigError(f"{location}: {e}")
+        for key in setups.get("polling") or {}:
+            if key not in _POLLING_KEYS:
+                raise ConfigError(f"{location}: unknown polling option {key}")
+        return queries
 
     def extract_queries_setup(self):
-        """ Extract queries_setup from config.yml and maps query to parameters."""
-        query_names: Query = OrderedDict()
+        """ Extract queries_setup from config.yml and maps query to parameters.
+
+        Config is validated and compiled into read-only execution plan:
+        `blocks` of queries in order of their execution and `queries`
+        mapping between query titles and their setup.
+
+        Raises:
+          ConfigError: if config is invalid.
+        """
+        if not isinstance(self.config, dict):
+            raise ConfigError("config should be a mapping")
+        for key in self.config:
+            if key not in _CONFIG_KEYS:
+                logging.warning(f"unknown config key {key} is ignored")
         queries_setup = self.config.get("queries_setup")
+        if not isinstance(queries_setup, list):
+            raise ConfigError("queries_setup should be a list of blocks")
+        # dates of the config are resolved once for all queries
+        date_range_setup = self.config.get("date_range_setup") or {}
+        default_dates = {
+            base: self._resolve_date(date_range_setup, base,
+                                     "date_range_setup")
+            for base in ("start_date", "end_date")
+        }
+        query_names: Dict[str, QuerySetup] = OrderedDict()
+        blocks: List[BlockSetup] = []
+        # blocks that next block depends on if it has no explicit `depends_on`
+        previous_dependencies: List[str] = []
         for i, setups in enumerate(queries_setup):
-            wait_for_query = False
-            start_date = None
-            end_date = None
-            date_range_block = setups.get("date_range")
-            if date_range_block:
-                start_date = self._convert_date(
-                    str(date_range_block.get("start_date")))
-                end_date = self._convert_date(
-                    str(date_range_block.get("end_date")))
+            queries = self._validate_block(i, setups)
+            if not queries:
+                continue
+            block_date_range = setups.get("date_range_setup") or setups.get(
+                "date_range") or {}
+            dates = {
+                base: self._resolve_date(block_date_range, base,
+                                         f"queries_setup[{i}]")
+                or default_dates[base]
+                for base in ("start_date", "end_date")
+            }
             end_block = i == (len(queries_setup) - 1)
-            try:
-                queries = setups["queries"]
-                if not queries:
-                    continue
-                max_queries = len(queries)
-                for j, query in enumerate(queries):
-                    end_query = j == (max_queries - 1)
-                    if setups.get("wait") == "each":
-                        wait_for_query = True
-                    elif setups.get("wait") == "block":
-                        if j == (max_queries - 1):
-                            wait_for_query = True
-                    query_names[query] = {
-                        "start_date":
-                        start_date
-                        if start_date else self.convert_date("start_date"),
-                        "end_date":
-                        end_date
-                        if end_date else self.convert_date("end_date"),
-                        "wait":
-                        False if end_block and end_query else wait_for_query,
-                        "parameters":
-                        setups.get("parameters"),
-                        "filtered_row_summary":
-                        setups.get("filtered_row_summary"),
-                        "batch_mode":
-                        setups.get("execution_mode") == "batch",
-                        "replacements":
-                        setups.get("replace"),
-                        "output_table_suffix":
-                        setups.get("output_table_suffix")
-                    }
-            except KeyError:
-                raise KeyError("No queries specified in query block!")
-        return query_names
+            wait_mode = setups.get("wait")
+            block_name = str(setups.get("name", f"block_{i}"))
+            if any(block.name == block_name for block in blocks):
+                raise ConfigError(f"block {block_name} is defined twice")
+            if "depends_on" in setups:
+                depends_on = [
+                    str(block)
+                    for block in self._atomic_to_list(setups.get("depends_on"))
+                ]
+            else:
+                depends_on = previous_dependencies
+            # blocks with `wait` are awaited by the blocks that follow
+            if wait_mode in _WAIT_MODES:
+                previous_dependencies = [block_name]
+            for j, query in enumerate(queries):
+                if query in query_names:
+                    raise ConfigError(
+                        f"query {query} is specified in more than one block")
+                end_query = j == (len(queries) - 1)
+                wait_for_query = wait_mode == "each" or (wait_mode == "block"
+                                                         and end_query)
+                query_names[query] = QuerySetup(
+                    title=query,
+                    start_date=dates["start_date"],
+                    end_date=dates["end_date"],
+                    wait=False if end_block and end_query else wait_for_query,
+                    parameters=setups.get("parameters"),
+                    filtered_row_summary=setups.get("filtered_row_summary"),
+                    batch_mode=setups.get("execution_mode") == "batch",
+                    replacements=setups.get("replace"),
+                    output_table_suffix=setups.get("output_table_suffix"),
+                    block=block_name,
+                    depends_on=depends_on,
+                    wait_mode=wait_mode,
+                    polling=setups.get("polling"),
+                    batch_window=setups.get("batch_window"))
+            blocks.append(
+                BlockSetup(name=block_name,
+                           depends_on=tuple(depends_on),
+                           wait_mode=wait_mode,
+                           queries=tuple(queries)))
+        try:
+            DagScheduler._validate(
+                {block.name: Node(block.name, block.depends_on)
+                 for block in blocks})
+        except ValueError as e:
+            raise ConfigError(str(e))
+        self.blocks: Tuple[BlockSetup, ...] = tuple(blocks)
+        return MappingProxyType(query_names)
@@ -0,0 +1,95 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+from typing import List, Tuple, Union
+
+_DAILY = ("day", "daily")
+_WEEKLY = ("week", "weekly")
+_MONTHLY = ("month", "monthly")
+
+Window = Union[str, int, None]
+
+
+def parse_window(window: Window) -> Union[str, int]:
+    """ Normalizes size of date window.
+
+    Args:
+      window: one of `day`, `week`, `month` (or `daily`, `weekly`,
+        `monthly`) or number of days in a window.
+
+    Returns:
+      Number of days in a window or `month`.
+
+    Raises:
+      ValueError: if window is invalid.
+    """
+    if window is None or window in _DAILY:
+        return 1
+    if window in _WEEKLY:
+        return "week"
+    if window in _MONTHLY:
+        return "month"
+    try:
+        days = int(window)
+    except (TypeError, ValueError):
+        days = 0
+    if days < 1:
+        raise ValueError(
+            f"date window should be day, week, month or number of days, "
+            f"got {window}")
+    return days
+
+
+def _next_month(date: datetime.date) -> datetime.date:
+    if date.month == 12:
+        return datetime.date(date.year + 1, 1, 1)
+    return datetime.date(date.year, date.month + 1, 1)
+
+
+def get_date_windows(
+        start_date: str,
+        end_date: str,
+        window: Window = None
+) -> List[Tuple[datetime.date, datetime.date]]:
+    """ Splits date range into consecutive windows.
+
+    Weekly windows follow calendar weeks (Monday to Sunday) and monthly
+    windows follow calendar months; the first and the last window are cut
+    to the date range.
+
+    Args:
+      start_date: first date of range in YYYY-MM-DD format.
+      end_date: last date of range in YYYY-MM-DD format.
+      window: size of a window, see `parse_window`.
+
+    Returns:
+      List of tuples (first date, last date) of each window.
+    """
+    window = parse_window(window)
+    start = datetime.date.fromisoformat(str(start_date))
+    end = datetime.date.fromisoformat(str(end_date))
+    windows = []
+    while start <= end:
+        if window == "month":
+            window_end = _next_month(start) - datetime.timedelta(days=1)
+        elif window == "week":
+            window_end = start + datetime.timedelta(days=6 - start.weekday())
+        else:
+            window_end = start + datetime.timedelta(days=window - 1)
+        window_end = min(window_end, end)
+        windows.append((start, window_end))
+        start = window_end + datetime.timedelta(days=1)
+    return windows
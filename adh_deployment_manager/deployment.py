@@ -21,9 +21,17 @@ from adh_deployment_manager.adh_service import AdhService
 from adh_deployment_manager.job import Job, wait_for_query_success
 from adh_deployment_manager.config import Config
 from adh_deployment_manager.query import AdhQuery, AnalysisQuery
-from adh_deployment_manager.utils import format_date, get_file_content, execute_adh_api_call_with_retry
-from pandas import date_range  # type: ignore
+from adh_deployment_manager.query_index import QueryIndex
+from adh_deployment_manager.query_loader import QueryLoader
+from adh_deployment_manager.template import get_customer_values
+from adh_deployment_manager.diff import QueryChange, UNCHANGED, UPDATE, diff_queries, get_query_hash
+from adh_deployment_manager.journal import RunJournal, get_journal_path
+from adh_deployment_manager.state import DeploymentState, get_state_path, _STATE_TTL
+from adh_deployment_manager.validation_cache import ValidationCache, _VALIDATION_CACHE_TTL
+from adh_deployment_manager.utils import format_date, execute_adh_api_call_with_retry
 import datetime
+import os
+import time
 
 class AdhAnalysisQuery(NamedTuple):
     adh_query: AdhQuery
@@ -35,10 +43,46 @@ class Deployment:
                  developer_key,
                  credentials,
                  queries_folder="sql",
-                 query_file_extention=".sql"):
-        self.config = Config(config)
-        self.adh_service = AdhService(credentials, developer_key)
+                 query_file_extention=".sql",
+                 qps=None,
+                 discovery_document=None,
+                 query_index_ttl=None,
+                 validation_cache_ttl=_VALIDATION_CACHE_TTL,
+                 state_path=None,
+                 state_ttl=_STATE_TTL,
+                 adh_service=None,
+                 query_index=None,
+                 root_url=None,
+                 journal_path=None):
+        # config is either a path, a dict or a Config object
+        self.config = config if isinstance(config, Config) else Config(config)
+        if not state_path and self.config.path:
+            state_path = get_state_path(
+                os.path.join(self.config.working_directory, self.config.path))
+        # hashes of deployed queries are used to skip unchanged queries
+        self.state = DeploymentState(state_path)
+        if not journal_path and self.config.path:
+            journal_path = get_journal_path(
+                os.path.join(self.config.working_directory, self.config.path))
+        # jobs launched by `run` are journaled so the run can be resumed
+        self.journal = RunJournal(journal_path)
+        self.state_ttl = state_ttl
+        # deployments may share service and its connections
+        self.adh_service = adh_service or AdhService(
+            credentials,
+            developer_key,
+            qps=qps,
+            discovery_document=discovery_document,
+            root_url=root_url)
+        # queries are looked up in per-customer index instead of
+        # listing them one by one
+        self.query_index = query_index or QueryIndex(
+            self.adh_service, ttl=query_index_ttl)
+        # successful validations are reused by later runs
+        self.validation_cache = ValidationCache(
+            ttl=validation_cache_ttl) if validation_cache_ttl else None
         self.queries_folder = queries_folder
+        self.query_loader = QueryLoader()
         self.query_file_extention = query_file_extention
         self.queries = {}
 
@@ -61,27 +105,136 @@ List of queries:
         """
         return deployment_message
 
+    def _get_query_path(self, query):
+        return f"{self.queries_folder}/{query}{self.query_file_extention}"
+
     def _get_queries(self, is_buildable=False):
+        if is_buildable:
+            # read and compile all query files up front
+            templates = self.query_loader.load_templates(
+                [self._get_query_path(query) for query in self.config.queries])
         for query in self.config.queries:
             query_for_run = self.config.queries[query]
-            if is_buildable:
-                adh_query = AdhQuery(
-                    query,
-                    get_file_content(
-                        f"{self.queries_folder}/{query}{self.query_file_extention}"
-                    ),
-                    query_for_run.get("parameters"),
-                    query_for_run.get("filtered_row_summary"))
-            else:
-                adh_query = AdhQuery(query)
+            replacements = query_for_run.get("replacements")
+            adh_query = None if is_buildable else AdhQuery(query)
             for customer_id, ads_data_from in zip(self.config.customer_id,
                                                   self.config.ads_data_from):
+                if is_buildable:
+                    template = templates[self._get_query_path(query)]
+                    # placeholders are rendered only if query has `replace`
+                    text = template.render(
+                        get_customer_values(replacements, customer_id,
+                                            ads_data_from)
+                    ) if replacements else template.text
+                    # customers share query unless its text differs
+                    if not adh_query or adh_query.text != text:
+                        adh_query = AdhQuery(
+                            query, text, query_for_run.get("parameters"),
+                            query_for_run.get("filtered_row_summary"))
                 # create AnalysisQuery object for deployment and / or run
                 analysis_query = AnalysisQuery(
-                    adh_service=self.adh_service.adh_service,
+                    adh_service=self.adh_service,
                     customer_id=customer_id,
                     ads_data_from=ads_data_from,
-                    query=adh_query)
+                    query=adh_query,
+                    query_index=self.query_index,
+                    validation_cache=self.validation_cache)
                 yield AdhAnalysisQuery(
                     adh_query=adh_query,
                     analysis_query=analysis_query)
+
+    def _fetch_queries(self, analysis_queries):
+        """ Gets queries from ADH.
+
+        Queries are looked up in query index if they have one, otherwise
+        they are fetched using batch requests.
+
+        Args:
+          analysis_queries: list of AnalysisQuery objects.
+
+        Returns:
+          List of results of `AnalysisQuery.get` call for each query.
+        """
+        if all(analysis_query.query_index
+               for analysis_query in analysis_queries):
+            return [
+                analysis_query.get() for analysis_query in analysis_queries
+            ]
+        responses = self.adh_service.execute_batch(
+            [analysis_query._get() for analysis_query in analysis_queries])
+        return [
+            analysis_query._set_from_get_response(response) for analysis_query,
+            response in zip(analysis_queries, responses)
+        ]
+
+    def _diff_queries(self, queries, query_results):
+        """ Finds queries which should be created or updated.
+
+        Args:
+          queries: list of AdhAnalysisQuery built from local files.
+          query_results: results of `_fetch_queries` for the queries.
+
+        Returns:
+          List of QueryChange for each query.
+        """
+        return diff_queries(queries, query_results, self.state)
+
+    def _set_state(self, change, query):
+        """ Records query deployed to ADH in deployment state.
+
+        Args:
+          change: QueryChange which was applied to the query.
+          query: query returned by ADH.
+        """
+        if query:
+            self.state.set(change.analysis_query.customer_id,
+                           query.get("title"),
+                           name=query.get("name"),
+                           hash=change.query_hash,
+                           sourceHash=get_query_hash(
+                               change.adh_query.format_for_deployment()),
+                           updateTime=query.get("updateTime"),
+                           syncTime=time.time())
+
+    def _plan_queries(self, queries):
+        """ Finds queries which should be created or updated using state.
+
+        Queries are compared with their state; only queries missing from
+        state or not compared with ADH within `state_ttl` are fetched
+        from ADH.
+
+        Args:
+          queries: list of AdhAnalysisQuery built from local files.
+
+        Returns:
+          List of QueryChange for each query.
+        """
+        changes = []
+        stale_queries = []
+        for adh_query, analysis_query in queries:
+            source_hash = get_query_hash(adh_query.format_for_deployment())
+            deployed_query = self.state.get(analysis_query.customer_id,
+                                            adh_query.title)
+            if not deployed_query or time.time() - deployed_query.get(
+                    "syncTime", 0) > self.state_ttl:
+                changes.append(None)
+                stale_queries.append((adh_query, analysis_query))
+                continue
+            action = UNCHANGED if deployed_query.get(
+                "sourceHash") == source_hash else UPDATE
+            changes.append(
+                QueryChange(action, adh_query, analysis_query, source_hash))
+        if stale_queries:
+            logging.info(f"refreshing state of {len(stale_queries)} queries...")
+            stale_changes = self._diff_queries(
+                stale_queries,
+                self._fetch_queries([
+                    analysis_query for _, analysis_query in stale_queries
+                ]))
+            for change in stale_changes:
+                if change.action == UNCHANGED:
+                    self._set_state(change, change.remote_query)
+            self.state.save()
+            stale_changes.reverse()
+            changes = [change or stale_changes.pop() for change in changes]
+        return changes
@@ -0,0 +1,122 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from adh_deployment_manager.query import AdhQuery, AnalysisQuery
+from adh_deployment_manager.state import DeploymentState
+
+CREATE = "create"
+UPDATE = "update"
+UNCHANGED = "unchanged"
+
+_REPORT_SYMBOLS = {CREATE: "+", UPDATE: "~", UNCHANGED: "="}
+
+
+class QueryChange(NamedTuple):
+    action: str
+    adh_query: AdhQuery
+    analysis_query: AnalysisQuery
+    query_hash: str
+    remote_query: Optional[Dict[str, Any]] = None
+
+
+def get_query_hash(query_body: Dict[str, Any]) -> str:
+    """ Returns hash of deployable content of ADH query.
+
+    Line endings and trailing whitespace of query text as well as
+    empty parameterTypes and mergeSpec don't change the hash.
+    """
+    query_text = "\n".join(
+        line.rstrip()
+        for line in (query_body.get("queryText") or "").splitlines()).strip()
+    content = json.dumps(
+        {
+            "title": query_body.get("title"),
+            "queryText": query_text,
+            "parameterTypes": query_body.get("parameterTypes") or {},
+            "mergeSpec": query_body.get("mergeSpec") or {}
+        },
+        sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _is_unchanged(query_hash: str, remote_query: Dict[str, Any],
+                  deployed_query: Optional[Dict[str, Any]]) -> bool:
+    if query_hash == get_query_hash(remote_query):
+        return True
+    # ADH may store query differently than it was sent, so query which
+    # wasn't modified remotely since its deployment is compared with state
+    return bool(deployed_query and deployed_query.get("hash") == query_hash
+                and remote_query.get("updateTime")
+                and deployed_query.get("updateTime") ==
+                remote_query.get("updateTime"))
+
+
+def diff_queries(queries,
+                 query_results,
+                 state: Optional[DeploymentState] = None) -> List[QueryChange]:
+    """ Compares queries built from config with the ones deployed to ADH.
+
+    Args:
+      queries: list of AdhAnalysisQuery built from local files.
+      query_results: results of `AnalysisQuery.get` call for each query.
+      state: state of the last deployment.
+
+    Returns:
+      List of QueryChange for each query.
+    """
+    changes = []
+    for (adh_query, analysis_query), query_result in zip(
+            queries, query_results):
+        if not query_result:
+            changes.append(
+                QueryChange(CREATE, adh_query, analysis_query,
+                            get_query_hash(adh_query.format_for_deployment())))
+            continue
+        # hash content the query would have after it's patched
+        query_hash = get_query_hash(
+            analysis_query._get_update_body(
+                title=adh_query.title,
+                text=adh_query.text,
+                parameters=adh_query.parameters,
+                filtered_row_summary=adh_query.filtered_row_summary))
+        deployed_query = state.get(analysis_query.customer_id,
+                                   adh_query.title) if state else None
+        remote_query = query_result["queries"][0]
+        action = UNCHANGED if _is_unchanged(query_hash, remote_query,
+                                            deployed_query) else UPDATE
+        changes.append(
+            QueryChange(action, adh_query, analysis_query, query_hash,
+                        remote_query))
+    return changes
+
+
+def format_changes(changes: List[QueryChange]) -> str:
+    """ Returns human-readable report of changes."""
+    lines = [
+        f"{_REPORT_SYMBOLS[change.action]} {change.action:<9} "
+        f"{change.analysis_query.customer_id} {change.adh_query.title}"
+        for change in changes
+    ]
+    counts = {
+        action: sum(change.action == action for change in changes)
+        for action in _REPORT_SYMBOLS
+    }
+    lines.append(f"{counts[CREATE]} to create, {counts[UPDATE]} to update, "
+                 f"{counts[UNCHANGED]} unchanged.")
+    return "\n".join(lines)
@@ -0,0 +1,587 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""In-process fake of ADH API for offline tests and benchmarks.
+
+Server implements `analysisQueries` list, get, create, patch, validate and
+start calls, `operations` get, list and cancel calls, batch requests and
+serves its own discovery document:
+
+    with FakeAdhServer(latency=0.05, error_rate=0.01, job_duration=5) as server:
+        adh_service = AdhService(None, "key", root_url=server.url)
+
+Deployment of a config whose files are kept in a temporary directory is
+created with `server.create_deployment(directory, config, queries)`.
+
+It can also be started from command line:
+
+    python -m adh_deployment_manager.fake_server --port 8080
+"""
+
+import argparse
+import collections
+import datetime
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlparse
+
+# end time of operations which are still running
+_NOT_FINISHED = "1970-01-01T00:00:00Z"
+_ERROR_STATUSES = {
+    400: "INVALID_ARGUMENT",
+    404: "NOT_FOUND",
+    409: "ALREADY_EXISTS",
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    502: "UNAVAILABLE",
+    503: "UNAVAILABLE",
+    504: "DEADLINE_EXCEEDED",
+}
+# resource -> method -> (HTTP method, path, path parameter, query parameters)
+_METHODS = {
+    "customers.analysisQueries": {
+        "list": ("GET", "v1/{+parent}/analysisQueries", "parent",
+                 ("filter", "pageSize", "pageToken")),
+        "get": ("GET", "v1/{+name}", "name", ()),
+        "create": ("POST", "v1/{+parent}/analysisQueries", "parent", ()),
+        "patch": ("PATCH", "v1/{+name}", "name", ("updateMask", )),
+        "validate": ("POST", "v1/{+parent}/analysisQueries:validate",
+                     "parent", ()),
+        "start": ("POST", "v1/{+name}:start", "name", ()),
+    },
+    "operations": {
+        "list": ("GET", "v1/{+name}", "name",
+                 ("filter", "pageSize", "pageToken")),
+        "get": ("GET", "v1/{+name}", "name", ()),
+        "cancel": ("POST", "v1/{+name}:cancel", "name", ()),
+    },
+}
+# (HTTP method, path pattern, method id, name of FakeAdhServer handler)
+_ROUTES = (
+    ("GET", r"v1/(customers/[^/]+)/analysisQueries",
+     "customers.analysisQueries.list", "_list_queries"),
+    ("POST", r"v1/(customers/[^/]+)/analysisQueries",
+     "customers.analysisQueries.create", "_create_query"),
+    ("POST", r"v1/(customers/[^/]+)/analysisQueries:validate",
+     "customers.analysisQueries.validate", "_validate_query"),
+    ("GET", r"v1/(customers/[^/]+/analysisQueries/[^/:]+)",
+     "customers.analysisQueries.get", "_get_query"),
+    ("PATCH", r"v1/(customers/[^/]+/analysisQueries/[^/:]+)",
+     "customers.analysisQueries.patch", "_patch_query"),
+    ("POST", r"v1/(customers/[^/]+/analysisQueries/[^/:]+):start",
+     "customers.analysisQueries.start", "_start_query"),
+    ("GET", r"v1/(operations)", "operations.list", "_list_operations"),
+    ("GET", r"v1/(operations/[^/:]+)", "operations.get", "_get_operation"),
+    ("POST", r"v1/(operations/[^/:]+):cancel", "operations.cancel",
+     "_cancel_operation"),
+)
+
+
+def get_discovery_document(root_url: str) -> Dict[str, Any]:
+    """ Builds discovery document of the part of ADH API used by the library.
+
+    Args:
+      root_url: root URL of the API, i.e. `http://localhost:8080/`.
+
+    Returns:
+      Discovery document as a dict.
+    """
+    resources: Dict[str, Any] = {}
+    for resource, methods in _METHODS.items():
+        node = {"resources": resources}
+        for name in resource.split("."):
+            node = node["resources"].setdefault(name, {"resources": {}})
+        node["methods"] = {}
+        for method, (http_method, path, path_parameter,
+                     query_parameters) in methods.items():
+            parameters = {
+                path_parameter: {
+                    "type": "string",
+                    "location": "path",
+                    "required": True
+                }
+            }
+            for parameter in query_parameters:
+                parameters[parameter] = {
+                    "type":
+                    "integer" if parameter == "pageSize" else "string",
+                    "location": "query"
+                }
+            node["methods"][method] = {
+                "id": f"adsdatahub.{resource}.{method}",
+                "path": path,
+                "flatPath": path,
+                "httpMethod": http_method,
+                "parameters": parameters,
+                "parameterOrder": [path_parameter],
+                "response": {
+                    "$ref": "Object"
+                },
+            }
+            if http_method in ("POST", "PATCH"):
+                node["methods"][method]["request"] = {"$ref": "Object"}
+    return {
+        "kind": "discovery#restDescription",
+        "discoveryVersion": "v1",
+        "id": "adsdatahub:v1",
+        "name": "adsdatahub",
+        "version": "v1",
+        "protocol": "rest",
+        "rootUrl": root_url,
+        "servicePath": "",
+        "batchPath": "batch",
+        "parameters": {
+            "key": {
+                "type": "string",
+                "location": "query"
+            }
+        },
+        "schemas": {
+            "Object": {
+                "id": "Object",
+                "type": "object",
+                "additionalProperties": {
+                    "type": "any"
+                }
+            }
+        },
+        "resources": resources,
+    }
+
+
+def _format_timestamp(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(
+        timestamp, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _error(code: int, message: str) -> Tuple[int, Dict[str, Any]]:
+    return code, {
+        "error": {
+            "code": code,
+            "message": message,
+            "status": _ERROR_STATUSES.get(code, "UNKNOWN")
+        }
+    }
+
+
+class FakeAdhServer:
+    """ HTTP server which imitates ADH API.
+
+    Server runs in a background thread and keeps queries and operations in
+    memory. Every call, including each call of a batch request, may fail
+    with one of `error_codes`; started jobs finish after `job_duration`.
+
+    Args:
+      host: host the server listens on.
+      port: port the server listens on, random free port by default.
+      latency: number of seconds each HTTP request takes.
+      error_rate: fraction of calls which fail with injected error.
+      error_codes: HTTP status codes of injected errors.
+      retry_after: value of Retry-After header of injected errors.
+      job_duration: number of seconds a job runs, or (min, max) tuple to
+        pick duration of each job at random.
+      job_error_rate: fraction of jobs which finish with error.
+      page_size: default number of items returned by list calls.
+      seed: seed of random generator used for error injection.
+    """
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 latency: float = 0,
+                 error_rate: float = 0,
+                 error_codes: Tuple[int, ...] = (429, 503),
+                 retry_after: Optional[float] = None,
+                 job_duration: Union[float, Tuple[float, float]] = 0,
+                 job_error_rate: float = 0,
+                 page_size: int = 100,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        self.retry_after = retry_after
+        self.job_duration = job_duration
+        self.job_error_rate = job_error_rate
+        self.page_size = page_size
+        self.queries: Dict[str, Dict[str, Any]] = {}
+        self.operations: Dict[str, Dict[str, Any]] = {}
+        # number of calls of each API method, injected errors included
+        self.calls: collections.Counter = collections.Counter()
+        self._random = random.Random(seed)
+        self._query_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """ Root URL of the API."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def discovery_document(self) -> Dict[str, Any]:
+        return get_discovery_document(self.url)
+
+    def create_deployment(self, directory: str, config: Dict[str, Any],
+                          queries: Dict[str, str], **kwargs):
+        """ Writes config and query files and returns Deployment using server.
+
+        Args:
+          directory: directory for config, query files, deployment state and
+            run journal, so nothing is written into user's cache.
+          config: config as a dict.
+          queries: dict {query title: query text}.
+          kwargs: other arguments of Deployment.
+        """
+        # only deployments need the API client, serving doesn't
+        import yaml
+        from adh_deployment_manager.adh_service import AdhService
+        from adh_deployment_manager.deployment import Deployment
+        os.makedirs(os.path.join(directory, "sql"), exist_ok=True)
+        for title, text in queries.items():
+            with open(os.path.join(directory, "sql", f"{title}.sql"), "w") as f:
+                f.write(text)
+        config_path = os.path.join(directory, "config.yml")
+        with open(config_path, "w") as f:
+            yaml.safe_dump(config, f)
+        kwargs.setdefault("validation_cache_ttl", None)
+        return Deployment(config=config_path,
+                          developer_key="key",
+                          credentials=None,
+                          queries_folder=os.path.join(directory, "sql"),
+                          state_path=os.path.join(directory, "state.json"),
+                          journal_path=os.path.join(directory,
+                                                    "journal.jsonl"),
+                          adh_service=AdhService(
+                              None,
+                              "key",
+                              discovery_document=self.discovery_document),
+                          **kwargs)
+
+    def start(self) -> "FakeAdhServer":
+        # short poll interval lets the server stop quickly
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        args=(0.05, ),
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_query(self, customer_id, title: str,
+                  text: str = "SELECT 1") -> Dict[str, Any]:
+        """ Adds query to the server, i.e. to test queries existing in ADH."""
+        with self._lock:
+            return self._create_query(f"customers/{customer_id:>09}", {}, {
+                "title": title,
+                "queryText": text
+            })[1]
+
+    def _get_job_duration(self) -> float:
+        if isinstance(self.job_duration, (tuple, list)):
+            return self._random.uniform(*self.job_duration)
+        return self.job_duration
+
+    def _inject_error(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        if self.error_rate and self._random.random() < self.error_rate:
+            return _error(self._random.choice(self.error_codes),
+                          "injected error")
+        return None
+
+    def handle(self, http_method: str, url: str,
+               body: Optional[Dict[str, Any]]) -> Tuple[int, Dict[str, Any]]:
+        """ Executes a single API call.
+
+        Returns:
+          Tuple (HTTP status code, response).
+        """
+        parsed_url = urlparse(url)
+        path = parsed_url.path.lstrip("/")
+        params = {
+            key: values[0]
+            for key, values in parse_qs(parsed_url.query).items()
+        }
+        for route_method, pattern, method_id, handler in _ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == http_method and match:
+                break
+        else:
+            return _error(404, f"{http_method} {path} not found")
+        with self._lock:
+            self.calls[f"adsdatahub.{method_id}"] += 1
+            error = self._inject_error()
+            if error:
+                return error
+            return getattr(self, handler)(match.group(1), params, body or {})
+
+    def _get_page(self, key, items, params):
+        offset = int(params.get("pageToken") or 0)
+        page_size = int(params.get("pageSize") or self.page_size)
+        response: Dict[str, Any] = {}
+        if items[offset:offset + page_size]:
+            response[key] = items[offset:offset + page_size]
+        if offset + page_size < len(items):
+            response["nextPageToken"] = str(offset + page_size)
+        return response
+
+    def _list_queries(self, parent, params, body):
+        queries = [
+            query for name, query in self.queries.items()
+            if name.startswith(f"{parent}/")
+        ]
+        match = re.fullmatch(r'(\w+)\s*=\s*"(.*)"', params.get("filter", ""))
+        if match:
+            queries = [
+                query for query in queries
+                if query.get(match.group(1)) == match.group(2)
+            ]
+        return 200, self._get_page("queries", queries, params)
+
+    def _get_query(self, name, params, body):
+        if name not in self.queries:
+            return _error(404, f"query {name} not found")
+        return 200, self.queries[name]
+
+    def _create_query(self, parent, params, body):
+        if not body.get("title") or not body.get("queryText"):
+            return _error(400, "query title and text are required")
+        if any(
+                query["title"] == body["title"]
+                for name, query in self.queries.items()
+                if name.startswith(f"{parent}/")):
+            return _error(409, f"query {body['title']} already exists")
+        now = _format_timestamp(time.time())
+        name = f"{parent}/analysisQueries/{next(self._query_ids)}"
+        self.queries[name] = dict(body,
+                                  name=name,
+                                  queryState="RUNNABLE",
+                                  createTime=now,
+                                  updateTime=now)
+        return 200, self.queries[name]
+
+    def _patch_query(self, name, params, body):
+        if name not in self.queries:
+            return _error(404, f"query {name} not found")
+        self.queries[name].update(
+            {key: value
+             for key, value in body.items() if key != "name"})
+        self.queries[name]["updateTime"] = _format_timestamp(time.time())
+        return 200, self.queries[name]
+
+    def _validate_query(self, parent, params, body):
+        if not body.get("query", {}).get("queryText"):
+            return _error(400, "query text is required")
+        return 200, {}
+
+    def _start_query(self, name, params, body):
+        if name not in self.queries:
+            return _error(404, f"query {name} not found")
+        operation_name = f"operations/{uuid.uuid4().hex}"
+        start_time = time.time()
+        self.operations[operation_name] = {
+            "name": operation_name,
+            "query": self.queries[name],
+            "body": body,
+            "start_time": start_time,
+            "end_time": start_time + self._get_job_duration(),
+            "failed": self._random.random() < self.job_error_rate,
+            "cancelled": False,
+        }
+        return 200, self._format_operation(operation_name)
+
+    def _format_operation(self, name):
+        operation = self.operations[name]
+        done = operation["cancelled"] or time.time() >= operation["end_time"]
+        response = {
+            "name": name,
+            "metadata": {
+                "queryResourceName":
+                operation["query"]["name"],
+                "queryTitle":
+                operation["query"]["title"],
+                "customerId":
+                operation["query"]["name"].split("/")[1],
+                "startTime":
+                _format_timestamp(operation["start_time"]),
+                "endTime":
+                _format_timestamp(operation["end_time"])
+                if done else _NOT_FINISHED,
+            },
+            "done": done,
+        }
+        if done and operation["cancelled"]:
+            response["error"] = {"code": 1, "message": "job was cancelled"}
+        elif done and operation["failed"]:
+            response["error"] = {"code": 3, "message": "simulated job error"}
+        elif done:
+            response["response"] = {
+                "destTable": operation["body"].get("destTable")
+            }
+        return response
+
+    def _list_operations(self, name, params, body):
+        # the latest operations come first
+        operations = [
+            self._format_operation(name) for name in reversed(self.operations)
+        ]
+        return 200, self._get_page("operations", operations, params)
+
+    def _get_operation(self, name, params, body):
+        if name not in self.operations:
+            return _error(404, f"operation {name} not found")
+        return 200, self._format_operation(name)
+
+    def _cancel_operation(self, name, params, body):
+        if name not in self.operations:
+            return _error(404, f"operation {name} not found")
+        operation = self.operations[name]
+        if time.time() < operation["end_time"]:
+            operation["cancelled"] = True
+            operation["end_time"] = time.time()
+        return 200, {}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # many workers connect at once, default backlog of 5 resets connections
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # connections are kept alive like connections to ADH API
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body: bytes, content_type, headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _get_headers(self, code):
+        fake = self.server.fake
+        if code in fake.error_codes and fake.retry_after is not None:
+            return {"Retry-After": str(fake.retry_after)}
+        return {}
+
+    def _handle(self, http_method):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        content = self.rfile.read(length)
+        if fake.latency:
+            time.sleep(fake.latency)
+        path = urlparse(self.path).path
+        if path == "/$discovery/rest":
+            return self._send(200,
+                              json.dumps(fake.discovery_document).encode(),
+                              "application/json")
+        if path == "/batch":
+            return self._handle_batch(content)
+        code, response = fake.handle(http_method, self.path,
+                                     json.loads(content) if content else None)
+        self._send(code,
+                   json.dumps(response).encode(), "application/json",
+                   self._get_headers(code))
+
+    def _handle_batch(self, content):
+        fake = self.server.fake
+        with fake._lock:
+            fake.calls["batch"] += 1
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() +
+            content)
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for part in message.iter_parts():
+            payload = part.get_payload(decode=True)
+            head, _, body = payload.replace(b"\r\n", b"\n").partition(b"\n\n")
+            http_method, url = head.split(b"\n")[0].decode().split(" ")[:2]
+            code, response = fake.handle(
+                http_method, url,
+                json.loads(body) if body.strip() else None)
+            data = json.dumps(response)
+            headers = "".join(f"{header}: {value}\r\n"
+                              for header, value in self._get_headers(
+                                  code).items())
+            content_id = part["Content-ID"].strip("<>")
+            parts.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {code} {self.responses.get(code, ('', ))[0]}\r\n"
+                f"Content-Type: application/json\r\n{headers}"
+                f"Content-Length: {len(data)}\r\n\r\n{data}\r\n")
+        self._send(200, ("".join(parts) + f"--{boundary}--\r\n").encode(),
+                   f"multipart/mixed; boundary={boundary}")
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Runs fake ADH API until interrupted.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--job-duration", type=float, default=0)
+    parser.add_argument("--job-error-rate", type=float, default=0)
+    args = parser.parse_args(args)
+    server = FakeAdhServer(args.host,
+                           args.port,
+                           latency=args.latency,
+                           error_rate=args.error_rate,
+                           job_duration=args.job_duration,
+                           job_error_rate=args.job_error_rate)
+    server.start()
+    print(f"Fake ADH API is listening on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,8 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
 import time
 import logging
+import random
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Optional
+import adh_deployment_manager.metrics as metrics
 import adh_deployment_manager.utils as utils
 
 
@@ -26,39 +33,374 @@ def check_operation_status(adh_service, job_id):
     """ Check status of a running operation
 
     Args:
-      adh_service: ADH service object
+      adh_service: AdhService or ADH service object
       job_id: adh job_id in a format operations/912udkjfakdsjfw0
 
     Returns:
       Status of the job, one of Running, Error, Success
     """
-    op = adh_service.operations().get(name=job_id)
+    op = utils.get_service(adh_service).operations().get(name=job_id)
     operation_status = utils.execute_adh_api_call_with_retry(op)
-    if _is_adh_job_running(operation_status["metadata"]):
+    return _get_operation_status(operation_status)
+
+
+def _get_operation_status(operation):
+    if _is_adh_job_running(operation["metadata"]):
         status = "Running"
-    elif "error" in operation_status.keys():
+    elif "error" in operation.keys():
         status = "Error"
     else:
         status = "Success"
-    return {"status": status, "errors": operation_status.get("error")}
+    return {"status": status, "errors": operation.get("error")}
+
+
+def list_operations(adh_service, page_size=None):
+    """ Iterates over all operations, fetching them page by page.
+
+    Args:
+      adh_service: AdhService or ADH service object
+      page_size: maximum number of operations returned in a single call
+
+    Yields:
+      Operation objects as dicts
+    """
+    page_token = None
+    while True:
+        op = utils.get_service(adh_service).operations().list(
+            name="operations", pageSize=page_size, pageToken=page_token)
+        adh_operations = utils.execute_adh_api_call_with_retry(op)
+        for operation in adh_operations.get("operations", []):
+            yield operation
+        page_token = adh_operations.get("nextPageToken")
+        if not page_token:
+            return
+
+
+def get_operations_status(adh_service, job_ids):
+    """ Checks status of many operations with a single sweep over operations.
+
+    Listing stops as soon as all operations are found, so statuses of
+    recently launched operations take a page or two instead of a call per
+    operation.
+
+    Args:
+      adh_service: AdhService or ADH service object
+      job_ids: adh job_ids in a format operations/912udkjfakdsjfw0
+
+    Returns:
+      Dict {job_id: status of the job} for operations found in the listing.
+    """
+    missing = set(job_ids)
+    statuses = {}
+    if not missing:
+        return statuses
+    for operation in list_operations(adh_service):
+        if operation.get("name") in missing:
+            missing.discard(operation["name"])
+            statuses[operation["name"]] = _get_operation_status(operation)
+            if not missing:
+                break
+    return statuses
+
+
+def _parse_timestamp(timestamp):
+    """ Converts RFC 3339 timestamp (i.e. 2021-01-01T00:00:00.123Z) to datetime."""
+    timestamp = timestamp.rstrip("Z")
+    base, _, fraction = timestamp.partition(".")
+    parsed = datetime.datetime.strptime(base, "%Y-%m-%dT%H:%M:%S")
+    if fraction:
+        parsed += datetime.timedelta(seconds=float(f"0.{fraction}"))
+    return parsed
+
+
+def _get_operation_key(operation):
+    metadata = operation.get("metadata", {})
+    return metadata.get("queryResourceName") or metadata.get("queryTitle")
+
+
+class PollingPolicy:
+    """ Defines when status of a running operation should be checked.
+
+    First check is made after `initial_delay` seconds, following checks are
+    made with exponentially growing delay (starting from `delay` and capped
+    at `max_delay`) randomized by `jitter`. If expected duration of the query
+    is known, no checks are made until the query is expected to finish.
+
+    Args:
+      initial_delay: time to give ADH to register a job before first check.
+      delay: delay before the second check.
+      multiplier: factor by which delay grows after each check.
+      max_delay: maximum delay between two checks.
+      jitter: maximum random deviation from delay, as a fraction of delay.
+      use_expected_duration: whether to wait for expected end of the query.
+    """
+    def __init__(self,
+                 initial_delay: float = 5,
+                 delay: float = 5,
+                 multiplier: float = 1.5,
+                 max_delay: float = 60,
+                 jitter: float = 0.1,
+                 use_expected_duration: bool = True):
+        self.initial_delay = initial_delay
+        self.delay = delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.use_expected_duration = use_expected_duration
+
+    def next_delay(self,
+                   attempt: int,
+                   elapsed: float = 0,
+                   expected_duration: Optional[float] = None) -> float:
+        """ Calculates delay before the next check of operation status.
+
+        Args:
+          attempt: number of checks already made.
+          elapsed: seconds since operation was launched.
+          expected_duration: expected duration of the operation in seconds.
+        """
+        if attempt == 0:
+            delay = self.initial_delay
+        else:
+            delay = min(self.delay * self.multiplier**(attempt - 1),
+                        self.max_delay)
+        if self.use_expected_duration and expected_duration:
+            delay = max(delay, expected_duration - elapsed)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+class DurationEstimator:
+    """ Learns expected duration of queries from finished operations.
 
+    Args:
+      history_size: number of last durations used for estimation.
+    """
+    def __init__(self, history_size: int = 10):
+        self.history_size = history_size
+        self._durations: Dict[str, deque] = {}
+        self._seen: set = set()
+
+    def add(self, operation) -> None:
+        """ Records duration of the operation if it's finished."""
+        metadata = operation.get("metadata", {})
+        key = _get_operation_key(operation)
+        if (not key or operation.get("name") in self._seen
+                or not metadata.get("startTime")
+                or _is_adh_job_running(metadata) or "error" in operation):
+            return
+        self._seen.add(operation.get("name"))
+        duration = (_parse_timestamp(metadata["endTime"]) -
+                    _parse_timestamp(metadata["startTime"])).total_seconds()
+        self._durations.setdefault(
+            key, deque(maxlen=self.history_size)).append(duration)
+
+    def expected_duration(self, key) -> Optional[float]:
+        """ Returns median duration of the query or None if it's unknown."""
+        durations = sorted(self._durations.get(key, []))
+        if not durations:
+            return None
+        return durations[len(durations) // 2]
+
+
+def _sleep(seconds):
+    metrics.record_sleep(metrics.POLLING, seconds)
+    time.sleep(seconds)
+
+
+def wait_for_query_success(adh_service,
+                           job_id,
+                           delay: Optional[int] = None,
+                           policy: Optional[PollingPolicy] = None):
+    """ Blocks until operation is no longer running.
 
-def wait_for_query_success(adh_service, job_id, delay: int = 30) -> None:
+    Args:
+      adh_service: AdhService or ADH service object
+      job_id: adh job_id in a format operations/912udkjfakdsjfw0
+      delay: fixed interval between checks, overrides `policy`.
+      policy: PollingPolicy used to schedule checks.
+
+    Returns:
+      Final status of the job as returned by `check_operation_status`.
+    """
+    if delay:
+        policy = PollingPolicy(initial_delay=10,
+                               delay=delay,
+                               multiplier=1,
+                               jitter=0)
+    policy = policy or PollingPolicy()
+    started = time.monotonic()
     # give ADH additional time to register a job
-    time.sleep(10)
+    _sleep(policy.next_delay(0))
     # poll query operation status
     operation_status = check_operation_status(adh_service, job_id)
     logging.info(f'current job status is {operation_status.get("status")}')
+    attempt = 1
     while operation_status.get("status") == "Running":
-        time.sleep(delay)
+        _sleep(policy.next_delay(attempt, time.monotonic() - started))
+        attempt += 1
         operation_status = check_operation_status(adh_service, job_id)
+    return operation_status
+
+
+class _WatchedOperation:
+    __slots__ = ("future", "policy", "started", "attempt", "next_check",
+                 "key")
+
+    def __init__(self, policy):
+        self.future: Future = Future()
+        self.policy = policy
+        self.started = time.monotonic()
+        self.attempt = 0
+        self.next_check = self.started + policy.next_delay(0)
+        self.key = None
+
+
+class OperationPoller:
+    """ Waits for many operations using a single polling loop.
+
+    Every tick all outstanding operations are refreshed by one sweep over
+    `operations().list` (only operations which cannot be found in the listing
+    are fetched individually), and futures returned by `watch` are resolved
+    with the final status of the operation. Finished operations found in the
+    listing are used to learn expected duration of each query, so that long
+    queries are not checked before they are expected to finish.
+
+    Args:
+      adh_service: AdhService or ADH service object
+      policy: default PollingPolicy for watched operations.
+      max_pages: maximum number of operation pages fetched during a sweep.
+    """
+    def __init__(self,
+                 adh_service,
+                 policy: Optional[PollingPolicy] = None,
+                 max_pages: int = 10):
+        self.adh_service = adh_service
+        self.policy = policy or PollingPolicy()
+        self.max_pages = max_pages
+        self.estimator = DurationEstimator()
+        self.api_calls = 0
+        self._operations: Dict[str, _WatchedOperation] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def watch(self, job_id, policy: Optional[PollingPolicy] = None) -> Future:
+        """ Starts tracking operation.
+
+        Args:
+          job_id: adh job_id in a format operations/912udkjfakdsjfw0
+          policy: PollingPolicy for the operation, poller's policy is used
+            if not provided.
+
+        Returns:
+          Future resolved with the final status of the job as returned by
+          `check_operation_status`.
+        """
+        with self._lock:
+            if job_id in self._operations:
+                return self._operations[job_id].future
+            watched_operation = _WatchedOperation(policy or self.policy)
+            self._operations[job_id] = watched_operation
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run,
+                                                name="OperationPoller",
+                                                daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return watched_operation.future
+
+    def wait(self, job_id, policy: Optional[PollingPolicy] = None):
+        """ Blocks until operation is no longer running and returns its status."""
+        return self.watch(job_id, policy).result()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._operations:
+                    self._thread = None
+                    return
+                now = time.monotonic()
+                next_check = min(operation.next_check
+                                 for operation in self._operations.values())
+                due = [
+                    name for name, operation in self._operations.items()
+                    if operation.next_check <= now
+                ]
+                # watch() adds operations from other threads
+                watched = set(self._operations)
+            if not due:
+                self._wakeup.wait(timeout=next_check - now)
+                self._wakeup.clear()
+                metrics.record_sleep(metrics.POLLING, time.monotonic() - now)
+                continue
+            try:
+                statuses = self._refresh(due, watched)
+            except Exception as e:
+                logging.error(f"cannot get status of operations: {e}")
+                statuses = {name: e for name in due}
+            self._resolve(statuses)
+
+    def _refresh(self, due, watched):
+        """ Gets status of operations, using as few API calls as possible.
+
+        Returns:
+          Dict {operation name: (status, query key)} for all watched
+          operations found, including ones which are not due yet.
+        """
+        missing = set(due)
+        statuses = {}
+        page_token = None
+        for _ in range(self.max_pages):
+            op = utils.get_service(
+                self.adh_service).operations().list(name="operations",
+                                                    pageToken=page_token)
+            self.api_calls += 1
+            adh_operations = utils.execute_adh_api_call_with_retry(op)
+            for operation in adh_operations.get("operations", []):
+                self.estimator.add(operation)
+                if operation.get("name") in watched:
+                    missing.discard(operation["name"])
+                    statuses[operation["name"]] = (
+                        _get_operation_status(operation),
+                        _get_operation_key(operation))
+            page_token = adh_operations.get("nextPageToken")
+            if not missing or not page_token:
+                break
+        for name in missing:
+            self.api_calls += 1
+            statuses[name] = (check_operation_status(self.adh_service,
+                                                     name), None)
+        return statuses
+
+    def _resolve(self, statuses):
+        with self._lock:
+            now = time.monotonic()
+            for name, result in statuses.items():
+                operation = self._operations[name]
+                if isinstance(result, Exception):
+                    del self._operations[name]
+                    operation.future.set_exception(result)
+                    continue
+                operation_status, operation.key = result[0], (
+                    result[1] or operation.key)
+                if operation_status.get("status") != "Running":
+                    del self._operations[name]
+                    logging.info(
+                        f'job {name} status is {operation_status.get("status")}'
+                    )
+                    operation.future.set_result(operation_status)
+                elif operation.next_check <= now:
+                    operation.attempt += 1
+                    operation.next_check = now + operation.policy.next_delay(
+                        operation.attempt, now - operation.started,
+                        self.estimator.expected_duration(operation.key))
 
 
 class Job():
     def __init__(self, name, adh_service):
         self.name = name
         self.status = None
-        self.adh_service = adh_service.adh_service
+        self.adh_service = adh_service
 
     def get_status(self):
         job_status = check_operation_status(self.adh_service, self.name)
@@ -66,6 +408,7 @@ class Job():
         return job_status
 
     def stop(self):
-        op = self.adh_service.operations().cancel(name=self.name)
+        op = utils.get_service(
+            self.adh_service).operations().cancel(name=self.name)
         result = utils.execute_adh_api_call_with_retry(op)
         return result
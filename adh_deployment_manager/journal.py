@@ -0,0 +1,138 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import adh_deployment_manager.utils as utils
+
+# statuses of jobs recorded in journal
+PLANNED = "Planned"
+LAUNCHED = "Launched"
+FAILED = "Failed"
+SUCCESS = "Success"
+ERROR = "Error"
+
+
+def get_journal_path(config_path: str) -> str:
+    """ Returns location of run journal of the config in cache directory."""
+    config_path = os.path.abspath(config_path)
+    path_hash = hashlib.sha1(config_path.encode("utf-8")).hexdigest()
+    config_name = os.path.splitext(os.path.basename(config_path))[0]
+    return os.path.join(utils.get_cache_dir(), "journal",
+                        f"{config_name}.{path_hash[:12]}.jsonl")
+
+
+def get_job_key(customer_id: str, query_identifier: str, start_date: str,
+                end_date: str, output_table_name: str) -> str:
+    """ Returns key identifying a job of a run in journal."""
+    return "|".join([
+        str(customer_id),
+        str(query_identifier),
+        str(start_date),
+        str(end_date),
+        str(output_table_name)
+    ])
+
+
+class RunJournal:
+    """ Write-ahead journal of jobs launched by `run`.
+
+    Every job is recorded before it's launched (`Planned`), after it's
+    launched together with its operation (`Launched`), if it cannot be
+    launched (`Failed`) and once its final status is known (`Success` or
+    `Error`). Records are appended to a JSON lines file as they happen, so
+    the journal survives the process dying midway through a run, and the
+    latest record of each job wins when the journal is loaded.
+
+    Args:
+      path: location of journal file; journal is kept only in memory if
+        path isn't provided.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._jobs: Dict[str, Dict[str, Any]] = self._load()
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        jobs: Dict[str, Dict[str, Any]] = {}
+        if not self.path:
+            return jobs
+        try:
+            with open(self.path, "r") as f:
+                lines = f.readlines()
+        except OSError:
+            return jobs
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last record may be partially written by a killed run
+                logging.warning(
+                    f"ignoring corrupted record in journal {self.path}")
+                continue
+            jobs.setdefault(record.pop("key"), {}).update(record)
+        return jobs
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._jobs.get(key)
+
+    def values(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def reset(self) -> None:
+        """ Forgets jobs of the previous run, so a new run is journaled."""
+        with self._lock:
+            self._jobs = {}
+            self._close()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def record(self, key: str, **fields) -> None:
+        """ Updates provided fields of the job and appends them to journal."""
+        fields["time"] = time.time()
+        with self._lock:
+            self._jobs.setdefault(key, {}).update(fields)
+            if not self.path:
+                return
+            try:
+                if not self._file:
+                    os.makedirs(os.path.dirname(self.path) or ".",
+                                exist_ok=True)
+                    self._file = open(self.path, "a")
+                self._file.write(json.dumps(dict(fields, key=key)) + "\n")
+                # record is visible to the next run even if this one is killed
+                self._file.flush()
+            except OSError as e:
+                logging.warning(f"cannot write run journal: {e}")
+
+    def _close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
@@ -0,0 +1,399 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import collections
+import json
+import logging
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+# upper bounds of API call latency histogram buckets in seconds
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_CUSTOMER = re.compile(r"customers/(\d+)")
+# reasons of sleeps recorded with `record_sleep`
+RATE_LIMIT = "rate_limit"
+POLLING = "polling"
+# reason of sleeps between retries, recorded as part of ApiCall
+RETRY = "retry"
+
+
+class ApiCall(NamedTuple):
+    """ Single API call including its retries.
+
+    Attributes:
+      method: API method id, i.e. `adsdatahub.customers.analysisQueries.start`.
+      customer: id of customer the call was made for, if any.
+      start_time: time the call was made at, seconds since epoch.
+      duration: total time spent on the call in seconds.
+      latency: time spent waiting for API responses in seconds.
+      retries: number of retries.
+      sleep: time spent sleeping between retries in seconds.
+      status: HTTP status of the last response or name of error raised
+        without response, i.e. `ConnectionError`.
+    """
+    method: str
+    customer: Optional[str]
+    start_time: float
+    duration: float
+    latency: float
+    retries: int
+    sleep: float
+    status: Union[int, str]
+
+
+def get_customer(uri: Optional[str]) -> Optional[str]:
+    """ Extracts customer id from URI of API call."""
+    match = _CUSTOMER.search(uri or "")
+    return match.group(1) if match else None
+
+
+def get_status(error: Optional[Exception]) -> Union[int, str]:
+    """ Returns HTTP status of failed call or name of the error."""
+    if error is None:
+        return 200
+    resp = getattr(error, "resp", None)
+    if resp is not None and getattr(resp, "status", None):
+        return int(resp.status)
+    return type(error).__name__
+
+
+class MetricsHook:
+    """ Receives API calls and sleeps recorded by the library."""
+    def on_api_call(self, call: ApiCall) -> None:
+        pass
+
+    def on_sleep(self, reason: str, seconds: float) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+_hooks: List[MetricsHook] = []
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook: MetricsHook) -> MetricsHook:
+    """ Starts sending API calls and sleeps to the hook."""
+    global _hooks
+    with _hooks_lock:
+        # hooks are replaced rather than modified, so they are read unlocked
+        _hooks = _hooks + [hook]
+    return hook
+
+
+def remove_hook(hook: MetricsHook) -> None:
+    global _hooks
+    with _hooks_lock:
+        _hooks = [added_hook for added_hook in _hooks if added_hook is not hook]
+
+
+def is_enabled() -> bool:
+    return bool(_hooks)
+
+
+def record_api_call(call: ApiCall) -> None:
+    for hook in _hooks:
+        try:
+            hook.on_api_call(call)
+        except Exception as e:
+            logging.warning(f"metrics hook {type(hook).__name__} failed: {e}")
+
+
+def record_sleep(reason: str, seconds: float) -> None:
+    if seconds <= 0:
+        return
+    for hook in _hooks:
+        try:
+            hook.on_sleep(reason, seconds)
+        except Exception as e:
+            logging.warning(f"metrics hook {type(hook).__name__} failed: {e}")
+
+
+class CallRecorder:
+    """ Measures a single API call and its retries.
+
+    Args:
+      method: API method id.
+      uri: URI or path of the call, used to find customer id.
+    """
+    def __init__(self, method: Optional[str], uri: Optional[str] = None):
+        self.method = method or "unknown"
+        self.customer = get_customer(uri)
+        self.start_time = time.time()
+        self.latency = 0.0
+        self.sleep = 0.0
+        self.retries = 0
+        self._started = time.monotonic()
+        self._attempt_started = self._started
+
+    def start_attempt(self) -> None:
+        self._attempt_started = time.monotonic()
+
+    def end_attempt(self, throttled: float = 0) -> None:
+        """ Adds time of the attempt, except time waited for rate limiter."""
+        self.latency += max(
+            time.monotonic() - self._attempt_started - throttled, 0)
+
+    def add_retry(self, delay: float) -> None:
+        self.retries += 1
+        self.sleep += delay
+
+    def finish(self, error: Optional[Exception] = None) -> None:
+        if not _hooks:
+            return
+        record_api_call(
+            ApiCall(method=self.method,
+                    customer=self.customer,
+                    start_time=self.start_time,
+                    duration=time.monotonic() - self._started,
+                    latency=self.latency,
+                    retries=self.retries,
+                    sleep=self.sleep,
+                    status=get_status(error)))
+
+
+class Histogram:
+    """ Histogram with fixed buckets.
+
+    Args:
+      buckets: sorted upper bounds of buckets, the last `+Inf` bucket is
+        added implicitly.
+    """
+    def __init__(self, buckets: Tuple[float, ...] = _LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_cumulative_counts(self) -> List[Tuple[str, int]]:
+        """ Returns list of (upper bound, number of values below it)."""
+        result = []
+        total = 0
+        for bound, count in zip(
+                [str(bucket) for bucket in self.buckets] + ["+Inf"],
+                self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+def _format_labels(**labels) -> str:
+    formatted = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace(
+            "\n", "\\n")
+        formatted.append(f'{key}="{value}"')
+    return "{" + ",".join(formatted) + "}"
+
+
+class MetricsCollector(MetricsHook):
+    """ Aggregates API calls and sleeps into counters and histograms.
+
+    Args:
+      buckets: upper bounds of API call latency histogram buckets.
+    """
+    def __init__(self, buckets: Tuple[float, ...] = _LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.calls: collections.Counter = collections.Counter()
+        self.retries: collections.Counter = collections.Counter()
+        self.latency: Dict[str, Histogram] = {}
+        self.sleep: collections.Counter = collections.Counter()
+        self._lock = threading.Lock()
+
+    def on_api_call(self, call: ApiCall) -> None:
+        with self._lock:
+            self.calls[(call.method, call.customer or "",
+                        str(call.status))] += 1
+            self.retries[call.method] += call.retries
+            if call.method not in self.latency:
+                self.latency[call.method] = Histogram(self.buckets)
+            self.latency[call.method].observe(call.latency)
+            self.sleep[RETRY] += call.sleep
+
+    def on_sleep(self, reason: str, seconds: float) -> None:
+        with self._lock:
+            self.sleep[reason] += seconds
+
+    def get_summary(self) -> Dict[str, float]:
+        """ Returns totals of API calls, their latency, retries and sleeps."""
+        with self._lock:
+            summary = {
+                "api_calls": sum(self.calls.values()),
+                "api_seconds": sum(
+                    histogram.sum for histogram in self.latency.values()),
+                "retries": sum(self.retries.values()),
+            }
+            for reason, seconds in sorted(self.sleep.items()):
+                summary[f"{reason}_sleep_seconds"] = seconds
+        return summary
+
+    def to_prometheus(self) -> str:
+        """ Formats metrics in Prometheus text exposition format."""
+        lines = [
+            "# HELP adh_api_calls_total Number of ADH API calls.",
+            "# TYPE adh_api_calls_total counter"
+        ]
+        with self._lock:
+            for (method, customer, status), count in sorted(self.calls.items()):
+                lines.append("adh_api_calls_total" + _format_labels(
+                    method=method, customer=customer, status=status) +
+                             f" {count}")
+            lines += [
+                "# HELP adh_api_call_duration_seconds Time spent waiting for "
+                "ADH API responses.",
+                "# TYPE adh_api_call_duration_seconds histogram"
+            ]
+            for method, histogram in sorted(self.latency.items()):
+                for bound, count in histogram.get_cumulative_counts():
+                    lines.append("adh_api_call_duration_seconds_bucket" +
+                                 _format_labels(method=method, le=bound) +
+                                 f" {count}")
+                lines.append("adh_api_call_duration_seconds_sum" +
+                             _format_labels(method=method) +
+                             f" {histogram.sum}")
+                lines.append("adh_api_call_duration_seconds_count" +
+                             _format_labels(method=method) +
+                             f" {histogram.count}")
+            lines += [
+                "# HELP adh_api_retries_total Number of retried ADH API calls.",
+                "# TYPE adh_api_retries_total counter"
+            ]
+            for method, retries in sorted(self.retries.items()):
+                lines.append("adh_api_retries_total" +
+                             _format_labels(method=method) + f" {retries}")
+            lines += [
+                "# HELP adh_sleep_seconds_total Time spent sleeping between "
+                "retries, waiting for rate limiter and polling jobs.",
+                "# TYPE adh_sleep_seconds_total counter"
+            ]
+            for reason, seconds in sorted(self.sleep.items()):
+                lines.append("adh_sleep_seconds_total" +
+                             _format_labels(reason=reason) + f" {seconds}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """ Writes metrics to a file, i.e. for node_exporter textfile collector."""
+        # utils imports metrics, so it's imported when it's used
+        import adh_deployment_manager.utils as utils
+        utils.write_file_atomically(path, self.to_prometheus())
+
+
+class JsonLinesExporter(MetricsHook):
+    """ Writes every API call and sleep as a JSON line to a local file.
+
+    Args:
+      path: file events are appended to.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    def _write(self, event) -> None:
+        line = json.dumps(event) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def on_api_call(self, call: ApiCall) -> None:
+        self._write(dict(call._asdict(), type="api_call"))
+
+    def on_sleep(self, reason: str, seconds: float) -> None:
+        self._write({
+            "type": "sleep",
+            "reason": reason,
+            "start_time": time.time() - seconds,
+            "duration": seconds
+        })
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class OpenTelemetryExporter(MetricsHook):
+    """ Reports every API call and sleep as OpenTelemetry span.
+
+    Spans are created with `tracer`, or, if `path` is provided, exported as
+    JSON lines to a local file.
+
+    Args:
+      tracer: OpenTelemetry tracer, tracer of the global tracer provider is
+        used by default.
+      path: file spans are appended to, requires opentelemetry-sdk.
+    """
+    def __init__(self, tracer=None, path: Optional[str] = None):
+        try:
+            from opentelemetry import trace  # type: ignore
+        except ImportError as e:
+            raise ImportError(
+                "OpenTelemetryExporter requires opentelemetry, install it "
+                "with `pip install adh-deployment-manager[otel]`") from e
+        self._trace = trace
+        self._provider = None
+        self._file = None
+        if path:
+            from opentelemetry.sdk.trace import TracerProvider  # type: ignore
+            from opentelemetry.sdk.trace.export import (  # type: ignore
+                ConsoleSpanExporter, SimpleSpanProcessor)
+            self._file = open(path, "a")
+            self._provider = TracerProvider()
+            self._provider.add_span_processor(
+                SimpleSpanProcessor(
+                    ConsoleSpanExporter(
+                        out=self._file,
+                        formatter=lambda span: span.to_json(indent=None) +
+                        "\n")))
+            tracer = self._provider.get_tracer("adh_deployment_manager")
+        self.tracer = tracer or trace.get_tracer("adh_deployment_manager")
+
+    def on_api_call(self, call: ApiCall) -> None:
+        attributes = {
+            "adh.method": call.method,
+            "adh.retries": call.retries,
+            "adh.latency": call.latency,
+            "adh.sleep": call.sleep,
+            "http.status_code": str(call.status),
+        }
+        if call.customer:
+            attributes["adh.customer"] = call.customer
+        span = self.tracer.start_span(call.method,
+                                      start_time=int(call.start_time * 1e9),
+                                      attributes=attributes)
+        if call.status != 200:
+            span.set_status(self._trace.Status(self._trace.StatusCode.ERROR))
+        span.end(end_time=int((call.start_time + call.duration) * 1e9))
+
+    def on_sleep(self, reason: str, seconds: float) -> None:
+        end_time = time.time()
+        span = self.tracer.start_span(f"sleep {reason}",
+                                      start_time=int(
+                                          (end_time - seconds) * 1e9),
+                                      attributes={"adh.sleep_reason": reason})
+        span.end(end_time=int(end_time * 1e9))
+
+    def close(self) -> None:
+        if self._provider:
+            self._provider.shutdown()
+        if self._file:
+            self._file.close()
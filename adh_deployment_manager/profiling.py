@@ -0,0 +1,158 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cProfile
+import contextlib
+import json
+import os
+import pstats
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import adh_deployment_manager.metrics as metrics
+
+# profiler of the running process, phases are timed only when it's set
+_profiler: Optional["Profiler"] = None
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    """ Adds wall-clock time of the block to a phase of the running profiler.
+
+    Can also be used as a function decorator; does nothing unless a profiler
+    is started.
+
+    Args:
+      name: name of the phase, i.e. `auth` or `config`.
+    """
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.add(name, time.perf_counter() - start)
+
+
+class Profiler:
+    """ Captures CPU profile and wall-clock time spent in phases of a run.
+
+    Phases are timed by blocks wrapped in `phase`, time spent in API calls
+    and sleeps is taken from metrics recorded by `metrics` module. Phases
+    may overlap (i.e. `sql` is part of `config` when query files are read
+    while config is loaded) and their time is summed over all threads.
+    CPU profile covers the thread which started the profiler.
+
+    Args:
+      cpu: whether to capture CPU profile with cProfile.
+    """
+    def __init__(self, cpu: bool = True):
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.wall_seconds = 0.0
+        self._cpu = cProfile.Profile() if cpu else None
+        self._collector = metrics.MetricsCollector()
+        self._lock = threading.Lock()
+        self._started = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self) -> "Profiler":
+        global _profiler
+        _profiler = self
+        metrics.add_hook(self._collector)
+        self._started = time.perf_counter()
+        if self._cpu:
+            self._cpu.enable()
+        return self
+
+    def stop(self) -> None:
+        global _profiler
+        if self._cpu:
+            self._cpu.disable()
+        self.wall_seconds = time.perf_counter() - self._started
+        metrics.remove_hook(self._collector)
+        if _profiler is self:
+            _profiler = None
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timing = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+            timing["seconds"] += seconds
+            timing["calls"] += 1
+
+    def get_phases(self) -> Dict[str, Dict[str, float]]:
+        """ Returns time spent in each phase, including API calls and sleeps."""
+        with self._lock:
+            phases = {name: dict(timing) for name, timing in self.phases.items()}
+        summary = self._collector.get_summary()
+        phases["api"] = {
+            "seconds": summary["api_seconds"],
+            "calls": summary["api_calls"]
+        }
+        for key, seconds in summary.items():
+            if key.endswith("_sleep_seconds"):
+                phases[key[:-len("_seconds")]] = {"seconds": seconds}
+        return phases
+
+    def get_functions(self, limit: int = 30) -> List[Dict[str, Any]]:
+        """ Returns functions with the highest cumulative CPU profile time."""
+        if not self._cpu:
+            return []
+        stats = pstats.Stats(self._cpu)
+        functions = []
+        for (filename, line, function), (_, calls, total, cumulative,
+                                         _) in stats.stats.items():
+            functions.append({
+                "function": f"{filename}:{line}({function})",
+                "calls": calls,
+                "total_seconds": total,
+                "cumulative_seconds": cumulative
+            })
+        functions.sort(key=lambda f: f["cumulative_seconds"], reverse=True)
+        return functions[:limit]
+
+    def get_report(self, limit: int = 30) -> Dict[str, Any]:
+        """ Returns machine-readable report of the run.
+
+        Args:
+          limit: number of functions included from CPU profile.
+
+        Returns:
+          Dict with wall time of the run, time spent in each phase, summary
+          of API calls and functions with the highest cumulative time.
+        """
+        return {
+            "wall_seconds": self.wall_seconds,
+            "phases": self.get_phases(),
+            "api": self._collector.get_summary(),
+            "functions": self.get_functions(limit)
+        }
+
+    def write(self, path: str) -> None:
+        """ Writes JSON report to a file and CPU profile next to it.
+
+        CPU profile is saved in `pstats` format to the path with `.prof`
+        extension, so it can be explored with `python -m pstats` or snakeviz.
+        """
+        with open(path, "w") as f:
+            json.dump(self.get_report(), f, indent=2)
+        if self._cpu:
+            self._cpu.dump_stats(f"{os.path.splitext(path)[0]}.prof")
@@ -16,6 +16,7 @@
 import adh_deployment_manager.utils as utils
 from googleapiclient.errors import HttpError
 import os
+import threading
 
 
 class FilteredRowSummary:
@@ -149,7 +150,9 @@ class AnalysisQuery(AdhQuery):
                  parameters=None,
                  filtered_row_summary=None,
                  parameterTypes=None,
-                 mergeSpec=None):
+                 mergeSpec=None,
+                 query_index=None,
+                 validation_cache=None):
         if not query and not title:
             raise ValueError(
                 "Either AdhQuery object or query title must be provided!")
@@ -164,10 +167,18 @@ class AnalysisQuery(AdhQuery):
         self.ads_data_from = f"{ads_data_from:>09}" if ads_data_from else f"{customer_id:>09}"
         self.name = None
         self.adh_service = adh_service
+        self.query_index = query_index
+        self.validation_cache = validation_cache
         self.query_body_create = None
         self.is_valid_query = None
+        self._validation_lock = threading.Lock()
         self.is_copied = None
 
+    def _analysis_queries(self):
+        # service is resolved on each call, so query can be used by any thread
+        return utils.get_service(
+            self.adh_service).customers().analysisQueries()
+
     def copy_from(self, copy_from):
         self.customer_id = self.customer_id if self.customer_id else copy_from.title
         self.title = self.title if self.title else copy_from.title
@@ -176,14 +187,15 @@ class AnalysisQuery(AdhQuery):
         self.mergeSpec = self.mergeSpec if self.mergeSpec else copy_from.mergeSpec
         self.copy_from = True
 
-    def get(self):
+    def _get(self):
         if self.name:
             filter = f'name="{self.name}"'
         else:
             filter = f'title="{self.title}"'
-        op = (self.adh_service.customers().analysisQueries().list(
+        return (self._analysis_queries().list(
             parent=self.customer_id, filter=filter))
-        query_result = utils.execute_adh_api_call_with_retry(op)
+
+    def _set_from_get_response(self, query_result):
         if query_result:
             query = query_result["queries"][0]
             self.name = query.get("name")
@@ -193,6 +205,20 @@ class AnalysisQuery(AdhQuery):
             self.queryState = query.get("queryState")
         return query_result
 
+    def _set_from_deploy_response(self, deployed_query):
+        if deployed_query:
+            self.name = deployed_query.get("name")
+            self._set_from_update_response(deployed_query)
+        return deployed_query
+
+    def get(self):
+        if self.query_index:
+            query = self.query_index.get(self.customer_id, self.title)
+            query_result = {"queries": [query]} if query else {}
+        else:
+            query_result = utils.execute_adh_api_call_with_retry(self._get())
+        return self._set_from_get_response(query_result)
+
     def _create(self):
         if self.is_copied:
             query_body_create = {
@@ -205,7 +231,7 @@ class AnalysisQuery(AdhQuery):
                 query_body_create["mergeSpec"] = self.parameterTypes
         else:
             self.query_body_create = super().format_for_deployment()
-        return (self.adh_service.customers().analysisQueries().create(
+        return (self._analysis_queries().create(
             parent=self.customer_id, body=self.query_body_create))
 
     def _get_query_body(self):
@@ -219,18 +245,33 @@ class AnalysisQuery(AdhQuery):
         }
 
     def deploy(self, copy_from=None):
-        return utils.execute_adh_api_call_with_retry(self._create())
+        deployed_query = utils.execute_adh_api_call_with_retry(self._create())
+        return self._set_from_deploy_response(deployed_query)
 
     def validate(self):
-        self.get()
+        # query may have been already fetched, i.e. by Deployment._fetch_queries
+        if not self.name or not self.text:
+            self.get()
+        # unchanged query that was already validated isn't validated again
+        if self.validation_cache:
+            validation_key = self.validation_cache.get_key(
+                self.customer_id, self.text, self.parameterTypes)
+            if self.validation_cache.is_valid(validation_key):
+                return (True, None)
+        policy = utils.RetryPolicy()
         try:
-            validation_result = (
-                self.adh_service.customers().analysisQueries().validate(
-                    parent=self.customer_id,
-                    body=self._get_query_body()).execute())
-            return (True, None)
+            validation_result = utils.execute_adh_api_call_with_retry(
+                self._analysis_queries().validate(
+                    parent=self.customer_id, body=self._get_query_body()),
+                policy=policy)
         except HttpError as e:
+            # transient errors which outlasted retries say nothing about query
+            if policy.is_retriable(e):
+                raise
             return (False, e)
+        if self.validation_cache:
+            self.validation_cache.set_valid(validation_key)
+        return (True, None)
 
     def _run(self,
              start_date,
@@ -238,8 +279,10 @@ class AnalysisQuery(AdhQuery):
              output_table_name,
              parameters=None,
              **kwargs):
-        if not self.is_valid_query:
-            self.is_valid_query = self.validate()
+        # windows of the query are launched by several workers at once
+        with self._validation_lock:
+            if not self.is_valid_query:
+                self.is_valid_query = self.validate()
         if not self.is_valid_query[0]:
             raise ValueError(
                 f"Cannot start invalid query {self.name}! error: {self.is_valid_query[1]}"
@@ -256,7 +299,7 @@ class AnalysisQuery(AdhQuery):
             queryExecuteBody["spec"]["parameterValues"] = \
                 Parameters.prepare_parameters(parameters, **kwargs)
 
-        op = (self.adh_service.customers().analysisQueries().start(
+        op = (self._analysis_queries().start(
             name=self.name, body=queryExecuteBody))
         return op
 
@@ -264,14 +307,12 @@ class AnalysisQuery(AdhQuery):
         run_query = utils.execute_adh_api_call_with_retry(op)
         return run_query
 
-    def update(self,
-               title=None,
-               text=None,
-               parameters=None,
-               filtered_row_summary=None):
-        if not self.name:
-            self.get()
-        query_body = {
+    def _get_update_body(self,
+                         title=None,
+                         text=None,
+                         parameters=None,
+                         filtered_row_summary=None):
+        return {
             "title":
             title if title else self.title,
             "queryText":
@@ -285,16 +326,43 @@ class AnalysisQuery(AdhQuery):
             if filtered_row_summary else self.mergeSpec
         }
 
-        op = (self.adh_service.customers().analysisQueries().patch(
+    def _update(self,
+                title=None,
+                text=None,
+                parameters=None,
+                filtered_row_summary=None):
+        if not self.name:
+            self.get()
+        query_body = self._get_update_body(title, text, parameters,
+                                           filtered_row_summary)
+        return (self._analysis_queries().patch(
             name=self.name, body=query_body))
-        updated_query = utils.execute_adh_api_call_with_retry(op)
+
+    def _set_from_update_response(self, updated_query):
         if updated_query:
             self.title = updated_query.get("title")
             self.text = updated_query.get("queryText")
             self.parameterTypes = updated_query.get("parameterTypes")
             self.mergeSpec = updated_query.get("mergeSpec")
+            if self.query_index:
+                self.query_index.add(self.customer_id, updated_query)
         return updated_query
 
+    def update(self,
+               title=None,
+               text=None,
+               parameters=None,
+               filtered_row_summary=None):
+        op = self._update(title, text, parameters, filtered_row_summary)
+        try:
+            updated_query = utils.execute_adh_api_call_with_retry(op)
+        except HttpError as e:
+            # query might have been deleted after it was indexed
+            if self.query_index and e.resp.status == 404:
+                self.query_index.invalidate(self.customer_id)
+            raise
+        return self._set_from_update_response(updated_query)
+
     # TODO: add relative and absolute files
     # TODO: fix saving into file folder (adh_deployment_manager)
     def dump(self, location, file_name=None, extension=".sql"):
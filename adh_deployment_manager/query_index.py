@@ -0,0 +1,147 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import adh_deployment_manager.utils as utils
+
+# bump whenever format of persisted index changes
+_QUERY_INDEX_VERSION = 1
+
+
+class QueryIndex:
+    """ Per-customer index of ADH queries by title.
+
+    Index of a customer is built from a single paginated listing of its
+    queries the first time any of its queries is looked up, and is kept
+    up to date with queries created or patched through the index.
+    If `ttl` is provided, index is also persisted on disk and reused by
+    later runs for `ttl` seconds.
+
+    Args:
+      adh_service: AdhService or ADH API service object.
+      ttl: number of seconds persisted index is fresh; index is kept only
+        in memory if ttl is None.
+      cache_dir: directory where index is persisted.
+    """
+    def __init__(self, adh_service, ttl=None, cache_dir=None):
+        self.adh_service = adh_service
+        self.ttl = ttl
+        self.cache_dir = cache_dir or os.path.join(utils.get_cache_dir(),
+                                                   "query_index")
+        self._indexes: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._customer_locks: Dict[str, threading.Lock] = {}
+
+    def _get_path(self, customer_id: str) -> str:
+        return os.path.join(
+            self.cache_dir,
+            f"{customer_id.replace('/', '_')}.v{_QUERY_INDEX_VERSION}.json")
+
+    def _read(self, customer_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        if self.ttl is None:
+            return None
+        path = self._get_path(customer_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, customer_id: str, index: Dict[str, Dict[str,
+                                                             Any]]) -> None:
+        if self.ttl is None:
+            return
+        path = self._get_path(customer_id)
+        try:
+            utils.write_file_atomically(path, json.dumps(index))
+        except OSError as e:
+            logging.warning(f"cannot save query index: {e}")
+
+    def _list_queries(self, customer_id: str) -> Dict[str, Dict[str, Any]]:
+        index: Dict[str, Dict[str, Any]] = {}
+        page_token = None
+        while True:
+            response = utils.execute_adh_api_call_with_retry(
+                utils.get_service(
+                    self.adh_service).customers().analysisQueries().list(
+                    parent=customer_id, pageToken=page_token))
+            for query in response.get("queries", []):
+                # keep the first query if title is not unique
+                index.setdefault(query.get("title"), query)
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return index
+
+    def _get_index(self, customer_id: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            if customer_id in self._indexes:
+                return self._indexes[customer_id]
+            customer_lock = self._customer_locks.setdefault(
+                customer_id, threading.Lock())
+        # queries of different customers are listed concurrently
+        with customer_lock:
+            if customer_id not in self._indexes:
+                index = self._read(customer_id)
+                if index is None:
+                    logging.info(f"listing queries of {customer_id}...")
+                    index = self._list_queries(customer_id)
+                    self._write(customer_id, index)
+                with self._lock:
+                    self._indexes[customer_id] = index
+            return self._indexes[customer_id]
+
+    def get(self, customer_id: str, title: str) -> Optional[Dict[str, Any]]:
+        """ Returns query with provided title or None if it doesn't exist.
+
+        Args:
+          customer_id: customer in format `customers/<customer_id>`.
+          title: title of the query.
+        """
+        return self._get_index(customer_id).get(title)
+
+    def add(self, customer_id: str, query: Dict[str, Any]) -> None:
+        """ Adds created or updated query to the index.
+
+        Query replaces indexed one with the same title unless indexed query
+        was updated later.
+        """
+        if not query or not query.get("title"):
+            return
+        index = self._get_index(customer_id)
+        with self._lock:
+            indexed_query = index.get(query["title"])
+            if indexed_query and indexed_query.get("updateTime", "") > query.get(
+                    "updateTime", ""):
+                return
+            index[query["title"]] = query
+            self._write(customer_id, index)
+
+    def invalidate(self, customer_id: str) -> None:
+        """ Drops index of customer so it's listed again on next lookup."""
+        with self._lock:
+            self._indexes.pop(customer_id, None)
+            if self.ttl is not None:
+                try:
+                    os.remove(self._get_path(customer_id))
+                except OSError:
+                    pass
@@ -0,0 +1,87 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import adh_deployment_manager.utils as utils
+from adh_deployment_manager.template import QueryTemplate
+
+
+class QueryLoader:
+    """ Reads query files in parallel and caches them as compiled templates.
+
+    File is read again only if its modification time or size changed, so
+    commands sharing the loader read and compile every file once.
+
+    Args:
+      max_workers: maximum number of files read concurrently.
+      working_directory: directory relative paths are resolved against.
+    """
+    def __init__(self, max_workers: int = 8, working_directory=None):
+        self.max_workers = max_workers
+        self.working_directory = working_directory
+        self._cache: Dict[str, Tuple[Tuple[int, int], QueryTemplate]] = {}
+        self._lock = threading.Lock()
+
+    def _get_path(self, path: str) -> str:
+        working_directory = self.working_directory or os.path.dirname(
+            utils.__file__)
+        return os.path.join(working_directory, path)
+
+    def _read(self, path: str) -> QueryTemplate:
+        path = self._get_path(path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+        template = QueryTemplate(utils.get_file_content(path), path)
+        with self._lock:
+            self._cache[path] = (version, template)
+        return template
+
+    def load_templates(self, paths: List[str]) -> Dict[str, QueryTemplate]:
+        """ Reads and compiles query files.
+
+        Args:
+          paths: list of file paths.
+
+        Returns:
+          Mapping between paths and compiled templates of the files.
+        """
+        paths = list(dict.fromkeys(paths))
+        if len(paths) <= 1 or self.max_workers <= 1:
+            return {path: self._read(path) for path in paths}
+        with ThreadPoolExecutor(
+                max_workers=min(self.max_workers, len(paths))) as executor:
+            return dict(zip(paths, executor.map(self._read, paths)))
+
+    def load(self, paths: List[str]) -> Dict[str, str]:
+        """ Reads content of query files.
+
+        Args:
+          paths: list of file paths.
+
+        Returns:
+          Mapping between paths and content of the files.
+        """
+        return {
+            path: template.text
+            for path, template in self.load_templates(paths).items()
+        }
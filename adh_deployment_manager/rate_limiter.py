@@ -0,0 +1,124 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from typing import Dict, Optional, Union
+
+# method family used when no rate is specified for the family of a method
+_DEFAULT_FAMILY = "default"
+
+
+class TokenBucket:
+    """ Thread-safe token bucket.
+
+    Tokens are added at `rate` per second up to `capacity`; a caller that
+    takes a token from an empty bucket waits until it's refilled. Callers
+    are served in the order they came in.
+
+    Args:
+      rate: number of tokens added per second.
+      capacity: maximum number of tokens, i.e. size of allowed burst.
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("Rate should be positive!")
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """ Takes tokens from the bucket.
+
+        Returns:
+          Number of seconds caller should wait before using the tokens.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        """ Blocks until tokens are available and returns time spent waiting."""
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+
+class RateLimiter:
+    """ Limits rate of API calls separately for each method family.
+
+    Method family is the last part of API method id, i.e. calls to
+    `adsdatahub.customers.analysisQueries.list` and `adsdatahub.operations.list`
+    share `list` family.
+
+    Args:
+      qps: maximum number of calls per second, either one value for all
+        families or dict {family: qps}; families missing from dict are
+        limited by `default` key if it's present.
+    """
+    def __init__(self, qps: Union[float, Dict[str, float], None] = None):
+        if isinstance(qps, dict):
+            self.qps = dict(qps)
+        elif qps:
+            self.qps = {_DEFAULT_FAMILY: qps}
+        else:
+            self.qps = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_method_family(method_id: Optional[str]) -> str:
+        if not method_id:
+            return _DEFAULT_FAMILY
+        return method_id.split(".")[-1]
+
+    def _get_bucket(self, family: str) -> Optional[TokenBucket]:
+        qps = self.qps.get(family, self.qps.get(_DEFAULT_FAMILY))
+        if not qps:
+            return None
+        with self._lock:
+            if family not in self._buckets:
+                self._buckets[family] = TokenBucket(qps)
+            return self._buckets[family]
+
+    def reserve(self, method_id: Optional[str], tokens: float = 1) -> float:
+        """ Takes tokens for the method without waiting.
+
+        Returns:
+          Number of seconds caller should wait before making the call.
+        """
+        bucket = self._get_bucket(self.get_method_family(method_id))
+        return bucket.reserve(tokens) if bucket else 0
+
+    def acquire(self, method_id: Optional[str], tokens: float = 1) -> float:
+        """ Blocks until call to the method can be made.
+
+        Returns:
+          Number of seconds spent waiting.
+        """
+        delay = self.reserve(method_id, tokens)
+        if delay:
+            time.sleep(delay)
+        return delay
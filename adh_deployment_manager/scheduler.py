@@ -0,0 +1,165 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Node:
+    """ Group of jobs that is launched once all its dependencies succeed.
+
+    Args:
+      name: unique name of the node.
+      depends_on: names of the nodes which should succeed before the node
+        is launched.
+      stages: list of job lists; jobs in a stage are launched concurrently,
+        stages are launched one after another once the previous stage
+        succeeds.
+    """
+    def __init__(self,
+                 name: str,
+                 depends_on: Optional[List[str]] = None,
+                 stages: Optional[List[List[Any]]] = None):
+        self.name = name
+        self.depends_on = list(depends_on or [])
+        self.stages = stages or []
+        self.status: Optional[str] = None
+        self.error: Optional[Exception] = None
+        self.launched: List[Any] = []
+
+
+class DagScheduler:
+    """ Launches nodes of dependency graph as soon as their dependencies succeed.
+
+    Args:
+      launch_job: callable that launches a job and returns its operation name.
+      wait_for_jobs: callable that blocks until all operations from the list
+        are completed and returns their statuses as dicts {"status": ...}.
+      max_workers: maximum number of jobs launched concurrently.
+    """
+    def __init__(self,
+                 launch_job: Callable[[Any], str],
+                 wait_for_jobs: Callable[[List[str]], List[Dict[str, Any]]],
+                 max_workers: int = 1):
+        self.launch_job = launch_job
+        self.wait_for_jobs = wait_for_jobs
+        self.max_workers = max_workers or 1
+
+    @staticmethod
+    def _validate(nodes: Dict[str, Node]) -> None:
+        for node in nodes.values():
+            for dependency in node.depends_on:
+                if dependency not in nodes:
+                    raise ValueError(
+                        f"{node.name} depends on unknown block {dependency}!")
+        visited: Dict[str, bool] = {}
+
+        def visit(name, path):
+            if visited.get(name):
+                return
+            if name in path:
+                raise ValueError(
+                    f"Circular dependency: {' -> '.join(path + [name])}")
+            for dependency in nodes[name].depends_on:
+                visit(dependency, path + [name])
+            visited[name] = True
+
+        for name in nodes:
+            visit(name, [])
+
+    def _run_node(self, node: Node, launcher: ThreadPoolExecutor,
+                  is_awaited: bool) -> str:
+        logging.info(f"launching block {node.name}...")
+        for i, stage in enumerate(node.stages):
+            launches = [launcher.submit(self.launch_job, job) for job in stage]
+            operations = []
+            errors = []
+            for job, launch in zip(stage, launches):
+                try:
+                    operation = launch.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                node.launched.append((job, operation))
+                operations.append(operation)
+            if errors:
+                raise errors[0]
+            # last stage is awaited only if other nodes depend on it
+            if is_awaited or i < len(node.stages) - 1:
+                for operation, operation_status in zip(
+                        operations, self.wait_for_jobs(operations)):
+                    if operation_status.get("status") != "Success":
+                        logging.error(
+                            f"job {operation} in block {node.name} failed: "
+                            f"{operation_status.get('errors')}")
+                        return "Error"
+        return "Success"
+
+    def _skip_dependents(self, name: str, dependents: Dict[str, List[str]],
+                         remaining: Dict[str, set], nodes: Dict[str, Node]):
+        for dependent in dependents[name]:
+            if dependent in remaining:
+                del remaining[dependent]
+                nodes[dependent].status = "Skipped"
+                logging.warning(
+                    f"skipping block {dependent} since block {name} failed")
+                self._skip_dependents(dependent, dependents, remaining, nodes)
+
+    def run(self, nodes: List[Node]) -> List[Node]:
+        """ Launches all nodes respecting their dependencies.
+
+        Returns:
+          List of nodes with `status` set to one of Success, Error, Skipped.
+        """
+        nodes_by_name = {node.name: node for node in nodes}
+        self._validate(nodes_by_name)
+        dependents: Dict[str, List[str]] = {name: [] for name in nodes_by_name}
+        for node in nodes:
+            for dependency in node.depends_on:
+                dependents[dependency].append(node.name)
+        remaining = {node.name: set(node.depends_on) for node in nodes}
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as launcher, \
+                ThreadPoolExecutor(max_workers=max(len(nodes), 1)) as coordinator:
+
+            def dispatch_ready_nodes():
+                for name in [n for n, deps in remaining.items() if not deps]:
+                    del remaining[name]
+                    future = coordinator.submit(self._run_node,
+                                                nodes_by_name[name], launcher,
+                                                bool(dependents[name]))
+                    running[future] = nodes_by_name[name]
+
+            dispatch_ready_nodes()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    try:
+                        node.status = future.result()
+                    except Exception as e:
+                        logging.error(f"cannot launch block {node.name}: {e}")
+                        node.status = "Error"
+                        node.error = e
+                    if node.status == "Success":
+                        for dependent in dependents[node.name]:
+                            if dependent in remaining:
+                                remaining[dependent].discard(node.name)
+                    else:
+                        self._skip_dependents(node.name, dependents,
+                                              remaining, nodes_by_name)
+                dispatch_ready_nodes()
+        return nodes
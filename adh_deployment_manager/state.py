@@ -0,0 +1,96 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import adh_deployment_manager.utils as utils
+
+# bump whenever format of state file changes
+_STATE_VERSION = 1
+# number of seconds state of query is trusted without comparing it with ADH
+_STATE_TTL = 60 * 60
+
+
+def get_state_path(config_path: str) -> str:
+    """ Returns location of state file of the config in cache directory."""
+    config_path = os.path.abspath(config_path)
+    path_hash = hashlib.sha1(config_path.encode("utf-8")).hexdigest()
+    config_name = os.path.splitext(os.path.basename(config_path))[0]
+    return os.path.join(utils.get_cache_dir(), "state",
+                        f"{config_name}.{path_hash[:12]}.json")
+
+
+class DeploymentState:
+    """ Queries deployed from config, as they were after the last deployment.
+
+    State is stored as JSON file {customer_id: {title: {...}}}, where each
+    query has `name`, `hash` of its deployed content, `sourceHash` of the
+    content built from local files, `updateTime` reported by ADH,
+    `syncTime` when it was last compared with ADH and `lastOperation`
+    launched by `run`.
+
+    Args:
+      path: location of state file; state is kept only in memory if path
+        isn't provided.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._queries: Dict[str, Dict[str, Dict[str, Any]]] = self._load()
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except OSError:
+            return {}
+        except ValueError as e:
+            logging.warning(f"ignoring corrupted state file {self.path}: {e}")
+            return {}
+        if state.get("version") != _STATE_VERSION:
+            return {}
+        return state.get("customers", {})
+
+    def get(self, customer_id: str, title: str) -> Optional[Dict[str, Any]]:
+        return self._queries.get(customer_id, {}).get(title)
+
+    def set(self, customer_id: str, title: str, **fields) -> None:
+        """ Updates provided fields of the query, other fields are kept."""
+        with self._lock:
+            self._queries.setdefault(customer_id, {}).setdefault(
+                title, {}).update(fields)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            content = json.dumps(
+                {
+                    "version": _STATE_VERSION,
+                    "customers": self._queries
+                },
+                indent=2,
+                sort_keys=True)
+        try:
+            utils.write_file_atomically(self.path, content)
+        except OSError as e:
+            logging.warning(f"cannot save deployment state: {e}")
@@ -0,0 +1,116 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+from typing import Any, Dict, Optional
+
+# placeholders look like identifiers, so regex quantifiers (`{2}`) and
+# JSON literals in query text are never treated as placeholders
+_PLACEHOLDER = re.compile(r"\{([A-Za-z_][\w.-]*)\}")
+# key of `replace` value used for customers without their own value
+_DEFAULT_VALUE = "default"
+
+
+class QueryTemplate:
+    """ Query text compiled into literal parts and placeholders.
+
+    Text is split once, so rendering it with different values only joins
+    the parts.
+
+    Args:
+      text: query text with `{placeholder}` tokens.
+      name: name of the template used in error messages.
+    """
+    __slots__ = ("text", "name", "_literals", "_placeholders",
+                 "placeholders")
+
+    def __init__(self, text: str, name: Optional[str] = None):
+        self.text = text
+        self.name = name
+        parts = _PLACEHOLDER.split(text)
+        self._literals = parts[0::2]
+        self._placeholders = parts[1::2]
+        self.placeholders = frozenset(self._placeholders)
+
+    def render(self, values: Dict[str, Any], strict: bool = True) -> str:
+        """ Replaces placeholders with provided values.
+
+        Args:
+          values: mapping between placeholder names and their values.
+          strict: whether placeholders without values are an error;
+            otherwise they are kept as is.
+
+        Returns:
+          Rendered query text.
+
+        Raises:
+          ValueError: if strict and some placeholders don't have values.
+        """
+        if not self._placeholders:
+            return self.text
+        missing = self.placeholders.difference(values)
+        if missing and strict:
+            raise ValueError(
+                f"{self.name or 'query'} has placeholders without values: "
+                f"{', '.join(sorted(missing))}")
+        parts = [self._literals[0]]
+        for placeholder, literal in zip(self._placeholders,
+                                        self._literals[1:]):
+            parts.append(
+                str(values[placeholder]) if placeholder in
+                values else f"{{{placeholder}}}")
+            parts.append(literal)
+        return "".join(parts)
+
+
+def _is_same_customer(key: Any, customer_id: Any) -> bool:
+    return str(key).lstrip("0") == str(customer_id).lstrip("0")
+
+
+def get_customer_values(replacements: Optional[Dict[str, Any]], customer_id,
+                        ads_data_from=None) -> Dict[str, Any]:
+    """ Resolves values of `replace` config block for the customer.
+
+    Value of placeholder is either the same for all customers or a mapping
+    between customer ids and values, with `default` key used for customers
+    missing from it. `customer_id` and `ads_data_from` placeholders are
+    available unless they are specified in replacements.
+
+    Args:
+      replacements: `replace` block of the config.
+      customer_id: customer which query is built for.
+      ads_data_from: customer whose ads data is queried.
+
+    Returns:
+      Mapping between placeholder names and their values.
+    """
+    values = {
+        "customer_id": customer_id,
+        "ads_data_from": ads_data_from or customer_id
+    }
+    for placeholder, value in (replacements or {}).items():
+        if isinstance(value, dict):
+            customer_values = [
+                customer_value for key, customer_value in value.items()
+                if _is_same_customer(key, customer_id)
+            ]
+            if customer_values:
+                value = customer_values[0]
+            elif _DEFAULT_VALUE in value:
+                value = value[_DEFAULT_VALUE]
+            else:
+                continue
+        values[str(placeholder)] = value
+    return values
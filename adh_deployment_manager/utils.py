@@ -15,11 +15,16 @@
 
 import logging
 import os
-from typing import Dict, Any, List, Optional, Union, NamedTuple
+import threading
+from typing import Dict, Any, Optional, Set
 import googleapiclient.discovery  # type: ignore
 from googleapiclient.errors import HttpError  # type: ignore
+import adh_deployment_manager.metrics as metrics
+import adh_deployment_manager.profiling as profiling
 import time
 import datetime
+import email.utils
+import random
 
 
 def format_date(query_object, base, date_format="%Y-%m-%d"):
@@ -42,26 +47,190 @@ def get_date(date_string: str) -> Dict[str, int]:
     }
 
 
+# HTTP status codes of errors that can disappear on their own
+_RETRIABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+    """ Defines which failed API calls should be retried and when.
+
+    Only errors with retriable status codes (rate limiting and server
+    errors) and connection errors are retried, using exponential backoff
+    with jitter. `Retry-After` header of the response takes precedence
+    over calculated delay.
+
+    Args:
+      max_retries: maximum number of retries.
+      initial_delay: delay before the first retry in seconds.
+      multiplier: factor by which delay grows after each retry.
+      max_delay: maximum delay between two retries.
+      jitter: maximum random deviation from delay, as a fraction of delay.
+      deadline: maximum time in seconds spent on a call including retries.
+      retriable_status_codes: HTTP status codes that should be retried.
+    """
+    def __init__(self,
+                 max_retries: int = 10,
+                 initial_delay: float = 1,
+                 multiplier: float = 2,
+                 max_delay: float = 60,
+                 jitter: float = 0.5,
+                 deadline: float = 600,
+                 retriable_status_codes=_RETRIABLE_STATUS_CODES):
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+        self.retriable_status_codes = retriable_status_codes
+
+    def is_retriable(self, error: Exception) -> bool:
+        if isinstance(error, HttpError):
+            return error.resp.status in self.retriable_status_codes
+        return isinstance(error, (ConnectionError, TimeoutError))
+
+    @staticmethod
+    def _get_retry_after(error: Exception) -> Optional[float]:
+        """ Returns delay requested by server in Retry-After header."""
+        if not isinstance(error, HttpError):
+            return None
+        retry_after = error.resp.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+        try:
+            retry_date = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        return max((retry_date - datetime.datetime.now(
+            datetime.timezone.utc)).total_seconds(), 0)
+
+    def get_delay(self, retry: int, error: Optional[Exception] = None) -> float:
+        """ Calculates delay before the retry.
+
+        Args:
+          retry: number of the retry, starting from 1.
+          error: error that caused the retry.
+        """
+        retry_after = self._get_retry_after(error)
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.initial_delay * self.multiplier**(retry - 1),
+                    self.max_delay)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
 def execute_adh_api_call_with_retry(
         adh_operation_object: googleapiclient.http.HttpRequest,
         max_retries: int = 10,
-        success: Optional[str] = None,
-        retries: int = 0) -> Dict[str, Any]:
+        retries: int = 0,
+        policy: Optional[RetryPolicy] = None) -> Dict[str, Any]:
+    """ Executes API call retrying it on transient errors.
 
-    while success is None and retries <= max_retries:
+    Args:
+      adh_operation_object: request to execute.
+      max_retries: maximum number of retries, used if policy isn't provided.
+      retries: number of retries already made.
+      policy: RetryPolicy which defines when to retry the call.
+
+    Returns:
+      Response of the API call.
+
+    Raises:
+      HttpError: if error isn't retriable or retries are exhausted.
+    """
+    policy = policy or RetryPolicy(max_retries=max_retries)
+    deadline = time.monotonic() + policy.deadline
+    recorder = metrics.CallRecorder(
+        getattr(adh_operation_object, "methodId", None),
+        getattr(adh_operation_object, "uri", None))
+    while True:
+        recorder.start_attempt()
         try:
+            response = adh_operation_object.execute()
+        except (HttpError, ConnectionError, TimeoutError) as e:
+            recorder.end_attempt(
+                getattr(adh_operation_object, "rate_limit_delay", 0))
             retries += 1
-            operation_response = adh_operation_object.execute()
-            success = operation_response
-            # if success.get("name"):
-            #     logging.info(f'job launched: {success.get("name")}')
-        except HttpError as e:
-            logging.warning(e._get_reason())
-            logging.warning("retrying query")
-            time.sleep(10)
-    return operation_response
+            if not policy.is_retriable(e) or retries > policy.max_retries:
+                recorder.finish(e)
+                raise
+            delay = policy.get_delay(retries, e)
+            if time.monotonic() + delay > deadline:
+                recorder.finish(e)
+                raise
+            logging.warning(e._get_reason() if isinstance(e, HttpError) else e)
+            logging.warning(f"retrying query in {delay:.1f} seconds")
+            time.sleep(delay)
+            recorder.add_retry(delay)
+        else:
+            recorder.end_attempt(
+                getattr(adh_operation_object, "rate_limit_delay", 0))
+            recorder.finish()
+            return response
+
+
+def get_service(adh_service):
+    """ Returns API service object which can be used by the current thread.
+
+    Args:
+      adh_service: AdhService, whose service object of the current thread
+        is returned, or API service object, which is returned as is.
+    """
+    if callable(getattr(type(adh_service), "get_service", None)):
+        return adh_service.get_service()
+    return adh_service
+
+
+def get_cache_dir() -> str:
+    """ Returns directory where adh_deployment_manager caches data.
+
+    Can be overridden with ADM_CACHE_DIR environment variable.
+    """
+    cache_dir = os.environ.get("ADM_CACHE_DIR")
+    if cache_dir:
+        return cache_dir
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "adh_deployment_manager")
+
+
+def write_file_atomically(path: str, data: str) -> None:
+    """ Writes data to a file, replacing previous content of the file.
+
+    Data is written to a temporary file first, so readers never see a
+    partially written file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def list_bq_tables(project: str, dataset: str) -> Set[str]:
+    """ Returns names of tables in BigQuery dataset.
+
+    Tables are listed with application default credentials.
+    """
+    # BigQuery client is heavy and only needed to check existing tables
+    from google.cloud import bigquery  # type: ignore
+    client = bigquery.Client(project=project)
+    return {
+        table.table_id
+        for table in client.list_tables(f"{project}.{dataset}")
+    }
 
 
+@profiling.phase("sql")
 def get_file_content(relative_path: str, working_directory: str = None) -> str:
     """ Reads content of local file and return it as text."""
     if not working_directory:
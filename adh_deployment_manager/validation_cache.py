@@ -0,0 +1,69 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+import adh_deployment_manager.utils as utils
+
+# bump whenever format of the cache key changes
+_VALIDATION_CACHE_VERSION = 1
+_VALIDATION_CACHE_TTL = 7 * 24 * 60 * 60
+
+
+class ValidationCache:
+    """ On-disk cache of successful query validations.
+
+    Query is identified by hash of its customer, text and parameter types,
+    so changed query is validated again. Every validated query is stored as
+    an empty file named after its hash, which makes cache safe to share
+    between concurrent runs.
+
+    Args:
+      ttl: number of seconds validation result is reused.
+      cache_dir: directory where validation results are stored.
+    """
+    def __init__(self, ttl=_VALIDATION_CACHE_TTL, cache_dir=None):
+        self.ttl = ttl
+        self.cache_dir = cache_dir or os.path.join(utils.get_cache_dir(),
+                                                   "validation")
+
+    @staticmethod
+    def get_key(customer_id: str, text: str,
+                parameter_types: Optional[Dict[str, Any]]) -> str:
+        content = json.dumps([customer_id, text, parameter_types or {}],
+                             sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir,
+                            f"{key}.v{_VALIDATION_CACHE_VERSION}")
+
+    def is_valid(self, key: str) -> bool:
+        """ Checks whether query was successfully validated within ttl."""
+        try:
+            return time.time() - os.path.getmtime(self._get_path(key)) <= self.ttl
+        except OSError:
+            return False
+
+    def set_valid(self, key: str) -> None:
+        try:
+            utils.write_file_atomically(self._get_path(key), "")
+        except OSError as e:
+            logging.warning(f"cannot cache validation result: {e}")
@@ -0,0 +1,84 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measures startup time of `adm` CLI.
+
+Each measurement runs in a fresh interpreter so nothing is cached in
+`sys.modules`:
+
+    python -m benchmarks.startup --repeat 10
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+_BENCHMARKS = {
+    "import adm": ["-c", "import adh_deployment_manager.cli.adm"],
+    "adm --help": ["-m", "adh_deployment_manager.cli.adm", "--help"],
+}
+# modules which shouldn't be loaded before a command is executed
+_HEAVY_MODULES = ("googleapiclient", "google_auth_oauthlib", "oauth2client",
+                  "httplib2", "yaml")
+
+
+def time_command(args, repeat):
+    """ Returns run times of python with given arguments in seconds. """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args,
+                       check=True,
+                       stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def get_heavy_modules():
+    """ Returns heavy modules loaded by importing `adm`. """
+    output = subprocess.run([
+        sys.executable, "-c", "import sys, adh_deployment_manager.cli.adm; "
+        "print('\\n'.join(sys.modules))"
+    ],
+                            check=True,
+                            capture_output=True,
+                            text=True).stdout
+    return sorted({
+        module.split(".")[0]
+        for module in output.split()
+        if module.split(".")[0] in _HEAVY_MODULES
+    })
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(args)
+    baseline = statistics.median(time_command(["-c", "pass"], args.repeat))
+    print(f"{'python':<12} {baseline * 1000:8.1f} ms")
+    for name, command in _BENCHMARKS.items():
+        median = statistics.median(time_command(command, args.repeat))
+        print(f"{name:<12} {median * 1000:8.1f} ms "
+              f"(+{(median - baseline) * 1000:.1f} ms over python)")
+    heavy_modules = get_heavy_modules()
+    if heavy_modules:
+        print(f"heavy modules loaded on import: {', '.join(heavy_modules)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
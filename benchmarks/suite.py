@@ -0,0 +1,284 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""End-to-end benchmarks of hot paths against fake ADH API.
+
+Time-based metrics are expressed in units of a fixed pure-Python
+calibration workload timed on the same machine, so baselines stored in
+`baselines.json` don't depend on speed of the machine. The suite fails if
+any metric is worse than its baseline by more than the tolerance of the
+metric:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --only deploy run
+    python -m benchmarks.suite --update-baselines
+
+Baselines are regenerated with `--update-baselines` after an intended
+change of performance; tolerances stored next to them are kept.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+import adh_deployment_manager.commands as commands
+from adh_deployment_manager.adh_service import AdhService
+from adh_deployment_manager.config import Config
+from adh_deployment_manager.fake_server import FakeAdhServer
+from adh_deployment_manager.job import PollingPolicy, wait_for_query_success
+from adh_deployment_manager.query import AnalysisQuery
+from benchmarks import startup
+
+_BASELINES = os.path.join(os.path.dirname(__file__), "baselines.json")
+_CUSTOMERS = ["1", "2"]
+# allowed deviation from baseline of metrics without their own tolerance
+_DEFAULT_TOLERANCE = 0.5
+
+
+def calibrate(repeat):
+    """ Seconds spent by a fixed pure-Python workload.
+
+    Time-based metrics are divided by it, so they are comparable between
+    machines of different speed.
+    """
+    document = json.dumps([{
+        "name": f"query_{i}",
+        "values": list(range(20))
+    } for i in range(2000)])
+    times = []
+    # the first run warms up the interpreter and isn't counted
+    for _ in range(max(repeat, 10) + 1):
+        start = time.perf_counter()
+        for _ in range(5):
+            sorted(json.loads(document), key=lambda item: item["name"][::-1])
+        times.append(time.perf_counter() - start)
+    return min(times[1:])
+
+
+def _get_deployment(server, directory, queries, customers=_CUSTOMERS):
+    """ Creates deployment of synthetic config with queries."""
+    config = {
+        "customer_id": customers,
+        "bq_project": "project",
+        "bq_dataset": "dataset",
+        "date_range_setup": {
+            "start_date": "2021-01-01",
+            "end_date": "2021-01-31"
+        },
+        "queries_setup": [{
+            "queries": [f"query_{i}" for i in range(queries)],
+            "parameters": {
+                "date": {
+                    "type": "STRING",
+                    "values": "2021-01-01"
+                }
+            },
+        }]
+    }
+    return server.create_deployment(
+        directory, config, {
+            f"query_{i}": f"SELECT {i} AS value, @date AS date\n"
+            for i in range(queries)
+        })
+
+
+def benchmark_deploy(args):
+    """ Time spent by `Deployer.execute` per deployed query."""
+    with FakeAdhServer(latency=args.latency) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        deployment = _get_deployment(server, directory, args.queries)
+        start = time.perf_counter()
+        commands.Deployer(deployment).execute()
+        elapsed = time.perf_counter() - start
+        deployed = len(server.queries)
+    return {"deploy_cost_per_query": (elapsed / deployed / args.unit, False)}
+
+
+def benchmark_run(args):
+    """ Time spent by `Runner.execute` per launched job."""
+    with FakeAdhServer(latency=args.latency) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        deployment = _get_deployment(server, directory, args.queries)
+        commands.Deployer(deployment).execute()
+        start = time.perf_counter()
+        commands.Runner(deployment).execute(max_workers=args.workers)
+        elapsed = time.perf_counter() - start
+        launched = len(server.operations)
+    return {"run_cost_per_job": (elapsed / launched / args.unit, False)}
+
+
+def benchmark_poll(args):
+    """ Polling API calls per job completed in `wait_for_query_success`."""
+    # durations and delays are scaled down from minutes to seconds
+    policy = PollingPolicy(initial_delay=0.25, delay=0.25, max_delay=3)
+    random.seed(0)
+    with FakeAdhServer(job_duration=(0.5, 2), seed=0) as server:
+        adh_service = AdhService(None,
+                                 "key",
+                                 discovery_document=server.discovery_document)
+        analysis_query = AnalysisQuery(adh_service,
+                                       "1",
+                                       title="query",
+                                       text="SELECT 1")
+        analysis_query.deploy()
+
+        def launch_and_wait(i):
+            operation = analysis_query._run(
+                "2021-01-01", "2021-01-01",
+                f"project.dataset.table_{i}").execute()
+            return wait_for_query_success(adh_service,
+                                          operation["name"],
+                                          policy=policy)
+
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            statuses = list(executor.map(launch_and_wait, range(args.jobs)))
+        calls = (server.calls["adsdatahub.operations.get"] +
+                 server.calls["adsdatahub.operations.list"])
+    return {"poll_calls_per_job": (calls / len(statuses), False)}
+
+
+def benchmark_config(args):
+    """ Time spent by `Config` parsing config with many queries."""
+    with tempfile.TemporaryDirectory() as directory:
+        config = {
+            "customer_id": _CUSTOMERS,
+            "bq_project": "project",
+            "bq_dataset": "dataset",
+            "date_range_setup": {
+                "start_date": "2021-01-01",
+                "end_date": "2021-01-31"
+            },
+            "queries_setup": [{
+                "queries": [f"query_{i}" for i in range(j, j + 10)],
+                "parameters": {
+                    "date": {
+                        "type": "STRING"
+                    }
+                },
+                "wait": "block",
+            } for j in range(0, args.config_queries, 10)]
+        }
+        path = os.path.join(directory, "config.yml")
+        with open(path, "w") as f:
+            yaml.safe_dump(config, f)
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            Config(path)
+            times.append(time.perf_counter() - start)
+    # the fastest run is the least affected by noise of other processes
+    return {"config_parse_cost": (min(times) / args.unit, False)}
+
+
+def benchmark_startup(args):
+    """ Time of `adm --help` as a multiple of bare interpreter startup."""
+    baseline = min(startup.time_command(["-c", "pass"], args.repeat))
+    help_time = min(
+        startup.time_command(startup._BENCHMARKS["adm --help"], args.repeat))
+    return {"startup_ratio": (help_time / baseline, False)}
+
+
+BENCHMARKS = {
+    "deploy": benchmark_deploy,
+    "run": benchmark_run,
+    "poll": benchmark_poll,
+    "config": benchmark_config,
+    "startup": benchmark_startup,
+}
+
+
+def compare(results, baselines, tolerance=None):
+    """ Finds metrics which are worse than baselines.
+
+    Args:
+      results: dict {metric: (value, whether higher value is better)}.
+      baselines: dict {metric: {"value": baseline, "tolerance": tolerance}},
+        where tolerance is allowed deviation from baseline as a fraction of
+        it.
+      tolerance: tolerance used instead of tolerances of baselines.
+
+    Returns:
+      List of messages describing regressions.
+    """
+    regressions = []
+    for metric, (value, higher_is_better) in results.items():
+        if metric not in baselines:
+            continue
+        baseline = baselines[metric]["value"]
+        allowed = tolerance if tolerance is not None else baselines[
+            metric].get("tolerance", _DEFAULT_TOLERANCE)
+        if higher_is_better:
+            regressed = value < baseline * (1 - allowed)
+        else:
+            regressed = value > baseline * (1 + allowed)
+        if regressed:
+            regressions.append(
+                f"{metric}: {value:.3f} (baseline {baseline:.3f})")
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--config-queries", type=int, default=10000)
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=None)
+    parser.add_argument("--baselines", default=_BASELINES)
+    parser.add_argument("--update-baselines", action="store_true")
+    args = parser.parse_args(args)
+    logging.disable(logging.WARNING)
+    args.unit = calibrate(args.repeat)
+    print(f"{'calibration_seconds':<28} {args.unit:12.3f}")
+    results = {}
+    for name in args.only or BENCHMARKS:
+        for metric, (value, higher_is_better) in BENCHMARKS[name](
+                args).items():
+            results[metric] = (value, higher_is_better)
+            print(f"{metric:<28} {value:12.3f} "
+                  f"({'higher' if higher_is_better else 'lower'} is better)")
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, "r") as f:
+            baselines = json.load(f)
+    if args.update_baselines:
+        for metric, (value, _) in results.items():
+            baselines[metric] = {
+                "value": float(f"{value:.4g}"),
+                "tolerance": baselines.get(metric, {}).get(
+                    "tolerance", _DEFAULT_TOLERANCE)
+            }
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return 0
+    regressions = compare(results, baselines, args.tolerance)
+    for regression in regressions:
+        print(f"regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,15 +21,18 @@ setup(name="adh-deployment-manager",
           "Operating System :: OS Independent",
           "License :: OSI Approved :: Apache Software License"
       ],
-      packages=find_packages(),
+      packages=find_packages(exclude=["benchmarks"]),
       install_requires=[
           "pyyaml",
           "google_auth_oauthlib",
           "google-api-python-client",
-          "pandas",
           "oauth2client",
           "google-cloud-bigquery",
       ],
+      extras_require={
+          "async": ["httpx"],
+          "otel": ["opentelemetry-api", "opentelemetry-sdk"],
+      },
       setup_requires=["pytest-runner"],
       tests_requires=["pytest"],
       entry_points={
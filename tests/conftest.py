@@ -0,0 +1,184 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import httplib2  # type: ignore
+import pytest
+from googleapiclient.errors import HttpError  # type: ignore
+
+from adh_deployment_manager.fake_server import FakeAdhServer
+
+_CUSTOMER = "customers/000000001"
+# end time of operation which is still running
+_RUNNING = "1970-01-01T00:00:00Z"
+
+
+def _http_error(status, **headers):
+    return HttpError(httplib2.Response({"status": status, **headers}), b"")
+
+
+class _Request:
+    """ Request which fails with `errors` one by one before returning
+    `response`; `batch_result` is returned when it's executed in a batch."""
+    methodId = None
+
+    def __init__(self, response=None, errors=(), batch_result=None):
+        self.response = response
+        self.errors = list(errors)
+        self.batch_result = batch_result
+        self.calls = 0
+
+    def execute(self, http=None, num_retries=0):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.response
+
+
+class _Batch:
+    def __init__(self, callback, error=None):
+        self.callback = callback
+        self.error = error
+        self.requests = {}
+
+    def add(self, request, request_id):
+        self.requests[request_id] = request
+
+    def execute(self, http=None):
+        if self.error:
+            raise self.error
+        for request_id, request in self.requests.items():
+            if isinstance(request.batch_result, Exception):
+                self.callback(request_id, None, request.batch_result)
+            else:
+                self.callback(request_id, request.batch_result, None)
+
+
+class _FakeOperations:
+    """ Operations resource where every operation is finished after the
+    first call."""
+    def __init__(self, service, names):
+        self.service = service
+        self.names = names
+
+    def _operation(self, name):
+        end_time = (_RUNNING
+                    if not self.service.calls else "2021-01-01T00:00:00Z")
+        return {"name": name, "metadata": {"endTime": end_time}}
+
+    def list(self, pageToken=None, **kwargs):
+        response = {
+            "operations": [self._operation(name) for name in self.names]
+        }
+        self.service.calls.append(("operations.list", pageToken))
+        return _Request(response)
+
+    def get(self, name):
+        response = self._operation(name)
+        self.service.calls.append(("operations.get", name))
+        return _Request(response)
+
+
+class _FakeAnalysisQueries:
+    """ Analysis queries resource which lists queries two per page and
+    accepts every query as valid once `validation_errors` are raised."""
+    def __init__(self, service, titles):
+        self.service = service
+        self.validation_errors = []
+        self.queries = [{
+            "name": f"{_CUSTOMER}/analysisQueries/{i}",
+            "title": title,
+            "queryText": f"SELECT {i}"
+        } for i, title in enumerate(titles)]
+
+    def list(self, parent, pageToken=None, **kwargs):
+        self.service.calls.append(("analysisQueries.list", pageToken))
+        start = int(pageToken or 0)
+        response = {"queries": self.queries[start:start + 2]}
+        if start + 2 < len(self.queries):
+            response["nextPageToken"] = str(start + 2)
+        return _Request(response)
+
+    def validate(self, parent, body):
+        self.service.calls.append(
+            ("analysisQueries.validate", body["query"]["queryText"]))
+        if self.validation_errors:
+            return _Request(errors=[self.validation_errors.pop(0)])
+        return _Request({})
+
+    def start(self, name, body):
+        self.service.calls.append(("analysisQueries.start", body["destTable"]))
+        return _Request({"name": f"operations/{body['destTable']}"})
+
+
+class _FakeService:
+    """ ADH service object which keeps operations and queries in memory.
+
+    Every call is recorded in `calls` as tuple (method, argument); batch
+    requests are kept in `batches` and the ones with numbers in
+    `failed_batches` fail as a whole.
+    """
+    def __init__(self,
+                 operation_names=(),
+                 query_titles=(),
+                 failed_batches=()):
+        self.names = operation_names
+        self.calls = []
+        self.failed_batches = failed_batches
+        self.batches = []
+        self._operations = _FakeOperations(self, operation_names)
+        self._analysis_queries = _FakeAnalysisQueries(self, query_titles)
+
+    def new_batch_http_request(self, callback):
+        error = _http_error(500) if len(
+            self.batches) in self.failed_batches else None
+        self.batches.append(_Batch(callback, error))
+        return self.batches[-1]
+
+    def operations(self):
+        return self._operations
+
+    def customers(self):
+        return self
+
+    def analysisQueries(self):
+        return self._analysis_queries
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def service():
+    return _FakeService([f"operations/{i}" for i in range(5)],
+                        [f"query_{i}" for i in range(5)])
+
+
+# Define fixture with arguments of FakeAdhServer, overridden by test modules
+@pytest.fixture
+def server_options():
+    return {}
+
+
+@pytest.fixture
+def server(server_options):
+    with FakeAdhServer(**server_options) as server:
+        yield server
+
+
+# Define factory of deployments which keep their files in tmp_path
+@pytest.fixture
+def create_deployment(server, tmp_path):
+    def create_deployment(config, queries):
+        return server.create_deployment(str(tmp_path), config, queries)
+
+    return create_deployment
@@ -0,0 +1,190 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import json
+import os
+import threading
+from googleapiclient.errors import HttpError  # type: ignore
+
+import adh_deployment_manager.adh_service as adh_service
+from adh_deployment_manager.adh_service import AdhService, DiscoveryCache
+from adh_deployment_manager.rate_limiter import RateLimiter
+from tests.conftest import _FakeService, _Request, _http_error
+
+_DISCOVERY_URL = "https://example.com/$discovery/rest?version=v1"
+_DOCUMENT = {"name": "adsdatahub", "version": "v1"}
+_SERVICE_DOCUMENT = {
+    "name": "adsdatahub",
+    "version": "v1",
+    "rootUrl": "http://localhost/",
+    "servicePath": "",
+    "resources": {
+        "operations": {
+            "methods": {
+                "get": {
+                    "id": "adsdatahub.operations.get",
+                    "path": "v1/{+name}",
+                    "httpMethod": "GET",
+                    "parameters": {
+                        "name": {
+                            "type": "string",
+                            "location": "path",
+                            "required": True
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def cache(tmp_path):
+    return DiscoveryCache(str(tmp_path), ttl=60)
+
+
+# Define fixture which counts downloads of discovery document
+@pytest.fixture
+def downloads(monkeypatch):
+    downloads = []
+
+    def fetch(discovery_url, developer_key=None):
+        downloads.append(discovery_url)
+        return json.dumps(_DOCUMENT)
+
+    monkeypatch.setattr(adh_service, "fetch_discovery_document", fetch)
+    return downloads
+
+
+def _get_adh_service(service):
+    adh = AdhService.__new__(AdhService)
+    adh.rate_limiter = RateLimiter()
+    adh._local = threading.local()
+    adh._local.service = service
+    return adh
+
+
+# Define fixture with service built from static discovery document
+@pytest.fixture
+def static_service():
+    return AdhService(None,
+                      "key",
+                      discovery_document=_SERVICE_DOCUMENT,
+                      discovery_cache_ttl=0)
+
+
+def _run_in_thread(function):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def _get_discovery_document(cache, discovery_document=None):
+    return AdhService._get_discovery_document("AdsDataHub", "v1",
+                                              _DISCOVERY_URL, "key",
+                                              discovery_document, cache)
+
+
+### TESTS
+# document is downloaded once and then read from cache
+def test_discovery_document_cached(cache, downloads):
+    for _ in range(2):
+        assert _get_discovery_document(cache) == _DOCUMENT
+    assert len(downloads) == 1
+
+
+# stale document is downloaded again
+def test_discovery_document_stale(cache, downloads):
+    _get_discovery_document(cache)
+    for file_name in os.listdir(cache.cache_dir):
+        os.utime(os.path.join(cache.cache_dir, file_name), (0, 0))
+    _get_discovery_document(cache)
+    assert len(downloads) == 2
+
+
+# stale document is used if it cannot be downloaded
+def test_discovery_document_stale_fallback(cache, monkeypatch):
+    cache.set("AdsDataHub", "v1", _DISCOVERY_URL, json.dumps(_DOCUMENT))
+    for file_name in os.listdir(cache.cache_dir):
+        os.utime(os.path.join(cache.cache_dir, file_name), (0, 0))
+
+    def fetch(discovery_url, developer_key=None):
+        raise OSError("network is unreachable")
+
+    monkeypatch.setattr(adh_service, "fetch_discovery_document", fetch)
+    assert _get_discovery_document(cache) == _DOCUMENT
+
+
+# static document is used without downloading
+def test_discovery_document_static(cache, downloads, tmp_path):
+    path = tmp_path / "discovery.json"
+    path.write_text(json.dumps(_DOCUMENT))
+    assert _get_discovery_document(cache, str(path)) == _DOCUMENT
+    assert downloads == []
+
+
+# calls are split into batch requests and responses keep order of requests
+def test_execute_batch_splits_requests():
+    service = _FakeService()
+    requests = [_Request(batch_result={"id": i}) for i in range(120)]
+    responses = _get_adh_service(service).execute_batch(requests,
+                                                        batch_size=50)
+    assert responses == [{"id": i} for i in range(120)]
+    assert [len(batch.requests) for batch in service.batches] == [50, 50, 20]
+    assert all(request.calls == 0 for request in requests)
+
+
+# only calls which failed with a retriable error are retried one by one
+def test_execute_batch_retries_failed_calls():
+    retriable = _Request({"id": 1}, batch_result=_http_error(503))
+    not_found = _Request({"id": 2}, batch_result=_http_error(404))
+    requests = [_Request(batch_result={"id": 0}), retriable, not_found]
+    responses = _get_adh_service(_FakeService()).execute_batch(
+        requests, return_exceptions=True)
+    assert responses[:2] == [{"id": 0}, {"id": 1}]
+    assert responses[2].resp.status == 404
+    assert [request.calls for request in requests] == [0, 1, 0]
+    with pytest.raises(HttpError):
+        _get_adh_service(_FakeService()).execute_batch(requests)
+
+
+# all calls from batch request which failed as a whole are retried
+def test_execute_batch_retries_failed_batch():
+    service = _FakeService(failed_batches={1})
+    requests = [_Request({"id": i}, batch_result={"id": i}) for i in range(4)]
+    responses = _get_adh_service(service).execute_batch(requests,
+                                                        batch_size=2)
+    assert responses == [{"id": i} for i in range(4)]
+    assert [request.calls for request in requests] == [0, 0, 1, 1]
+
+
+# every thread gets its own service object
+def test_service_per_thread(static_service):
+    assert static_service.adh_service is static_service.adh_service
+    assert _run_in_thread(
+        lambda: static_service.adh_service) is not static_service.adh_service
+
+
+# requests are executed with connection of the thread that built them
+def test_request_http_per_thread(static_service):
+    request = _run_in_thread(lambda: static_service.adh_service.operations().
+                             get(name="operations/1"))
+    assert request.http is not static_service.adh_service.operations().get(
+        name="operations/1").http
@@ -0,0 +1,100 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pytest
+import yaml
+
+from adh_deployment_manager.cli import adm
+
+
+def _write_config(directory, query, query_text=None):
+    os.makedirs(directory / "sql")
+    with open(directory / "config.yml", "w") as f:
+        yaml.safe_dump(
+            {
+                "customer_id": "1",
+                "bq_project": "project",
+                "bq_dataset": directory.name,
+                "date_range_setup": {
+                    "start_date": "2021-01-01",
+                    "end_date": "2021-01-01"
+                },
+                "queries_setup": [{
+                    "queries": [query]
+                }]
+            }, f)
+    # config fails if its query file is missing
+    if query_text:
+        with open(directory / "sql" / f"{query}.sql", "w") as f:
+            f.write(query_text)
+
+
+# Define fixtures to be used by pytest
+# adm is run in tmp_path with its caches and developer key
+@pytest.fixture
+def server(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ADM_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("ADH_DEVELOPER_KEY", "key")
+    monkeypatch.delenv("ADH_SECRET_FILE", raising=False)
+    return server
+
+
+def _get_launched_tables(server):
+    return sorted(operation["body"]["destTable"]
+                  for operation in server.operations.values())
+
+
+### TESTS
+# every config is executed with its own queries even if one of them fails
+def test_run_multiple_configs(server, tmp_path):
+    _write_config(tmp_path / "failing", "failing_query")
+    _write_config(tmp_path / "first", "first_query", "SELECT 1")
+    _write_config(tmp_path / "second", "second_query", "SELECT 2")
+    args = adm.parse_args([
+        "-c", "first/config.yml", "-c", "failing/config.yml", "-c",
+        "second/config.yml", "--root-url", server.url, "run", "deploy"
+    ])
+    with pytest.raises(SystemExit) as e:
+        adm.run(args)
+    assert e.value.code == 1
+    assert sorted(query["queryText"] for query in server.queries.values()
+                  ) == ["SELECT 1", "SELECT 2"]
+    assert _get_launched_tables(server) == [
+        "project.first.first_query", "project.second.second_query"
+    ]
+
+
+# single failed config raises its error
+def test_run_single_failed_config(server, tmp_path):
+    _write_config(tmp_path, "failing_query")
+    args = adm.parse_args(["--root-url", server.url, "run", "deploy"])
+    with pytest.raises(Exception) as e:
+        adm.run(args)
+    assert not isinstance(e.value, SystemExit)
+    assert server.operations == {}
+
+
+# number of workers is accepted with short and long option
+@pytest.mark.parametrize("option", ["-w", "--workers"])
+def test_parse_args_workers(option):
+    assert adm.parse_args([option, "4", "run"]).max_workers == 4
+
+
+# rate limit is accepted with short and long option
+@pytest.mark.parametrize("option", ["-r", "--qps"])
+def test_parse_args_qps(option):
+    assert adm.parse_args([option, "2.5", "run"]).qps == 2.5
@@ -0,0 +1,113 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import pytest
+from googleapiclient.errors import HttpError  # type: ignore
+
+httpx = pytest.importorskip("httpx")
+
+from adh_deployment_manager.async_client import AsyncAdhClient
+from adh_deployment_manager.utils import RetryPolicy
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def requests():
+    return []
+
+
+@pytest.fixture
+def responses():
+    return []
+
+
+@pytest.fixture
+def client(requests, responses):
+    def handler(request):
+        requests.append(request)
+        if responses:
+            return responses.pop(0)
+        return httpx.Response(200, json={"name": "operations/1"})
+
+    return AsyncAdhClient(developer_key="key",
+                          root_url="http://adh.test/",
+                          retry_policy=RetryPolicy(initial_delay=0,
+                                                   jitter=0),
+                          transport=httpx.MockTransport(handler))
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+### TESTS
+# call is sent to API method path with developer key
+def test_async_client_start_query(client, requests):
+    response = run(
+        client.start_query("customers/1/analysisQueries/2", {"spec": {}}))
+    assert response == {"name": "operations/1"}
+    assert requests[0].method == "POST"
+    assert requests[0].url.path == "/v1/customers/1/analysisQueries/2:start"
+    assert requests[0].url.params["key"] == "key"
+
+
+# all pages of queries are returned
+def test_async_client_list_queries(client, requests, responses):
+    responses.extend([
+        httpx.Response(200,
+                       json={
+                           "queries": [{
+                               "title": "a"
+                           }],
+                           "nextPageToken": "next"
+                       }),
+        httpx.Response(200, json={"queries": [{
+            "title": "b"
+        }]})
+    ])
+    queries = run(client.list_queries("customers/1"))
+    assert [query["title"] for query in queries] == ["a", "b"]
+    assert requests[1].url.params["pageToken"] == "next"
+
+
+# retriable error is retried
+def test_async_client_retry(client, requests, responses):
+    responses.append(httpx.Response(503))
+    assert run(client.get_operation("operations/1")) == {
+        "name": "operations/1"
+    }
+    assert len(requests) == 2
+
+
+# non-retriable error is raised as HttpError
+def test_async_client_error(client, requests, responses):
+    responses.append(httpx.Response(404, json={"error": {"code": 404}}))
+    with pytest.raises(HttpError) as e:
+        run(client.get_operation("operations/1"))
+    assert e.value.resp.status == 404
+    assert len(requests) == 1
+
+
+# calls are made concurrently
+def test_async_client_concurrent_calls(client, requests):
+    async def start_queries():
+        return await asyncio.gather(*[
+            client.start_query(f"customers/1/analysisQueries/{i}", {})
+            for i in range(20)
+        ])
+
+    assert len(run(start_queries())) == 20
+    assert len(requests) == 20
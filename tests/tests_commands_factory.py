@@ -0,0 +1,68 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import sys
+import pytest
+from unittest import mock
+
+import adh_deployment_manager.commands as commands
+from adh_deployment_manager.commands_factory import CommandsFactory
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def factory():
+    return CommandsFactory()
+
+
+### TESTS
+# all built-in commands are registered
+def test_commands_factory_commands(factory):
+    assert set(factory.commands) == {
+        "deploy", "fetch", "update", "run", "populate", "plan"
+    }
+
+
+# registered command is created with its class
+def test_commands_factory_create_command(factory):
+    assert isinstance(factory.create_command("run", mock.MagicMock()),
+                      commands.Runner)
+
+
+# unknown command is created as null command
+def test_commands_factory_unknown_command(factory):
+    assert isinstance(factory.create_command("unknown", None),
+                      commands.NullCommand)
+
+
+# unknown attribute of commands package raises AttributeError
+def test_commands_unknown_attribute():
+    with pytest.raises(AttributeError):
+        commands.Unknown
+
+
+# importing cli doesn't load API client and auth libraries
+def test_cli_import_is_lazy():
+    output = subprocess.run([
+        sys.executable, "-c", "import sys, adh_deployment_manager.cli.adm; "
+        "print(' '.join(sys.modules))"
+    ],
+                            check=True,
+                            capture_output=True,
+                            text=True).stdout.split()
+    for module in ("googleapiclient", "google_auth_oauthlib",
+                   "oauth2client", "adh_deployment_manager.deployment"):
+        assert module not in output
@@ -17,7 +17,7 @@ import pytest
 
 import os
 
-from adh_deployment_manager.config import Config
+from adh_deployment_manager.config import Config, ConfigError
 from adh_deployment_manager.query import Parameters
 import adh_deployment_manager.utils as utils
 
@@ -156,3 +156,118 @@ def test_define_query_parameters_single():
             "type": "STRING"
         }
     }
+
+
+# extract_queries_setup makes each block depend on the last block with 'wait'
+@pytest.mark.parametrize(
+    "expected,query",
+    [
+        ([], "sample_query_1_1"),  # first block has no dependencies
+        (["block_0"], "sample_query_2_1"),  # previous block has 'wait: each'
+        (["block_1"], "sample_query_3")  # previous block has 'wait: block'
+    ])
+def test_extract_queries_setup_default_dependencies(setup, expected, query):
+    assert expected == setup[query]["depends_on"]
+
+
+# extract_queries_setup uses explicit 'name' and 'depends_on' of the block
+def test_extract_queries_setup_explicit_dependencies():
+    config = Config(_SAMPLE_CONFIG_PATH, os.path.dirname(__file__))
+    config.config = {
+        "queries_setup": [
+            {"name": "first", "queries": ["query_1"], "wait": "block"},
+            {"name": "second", "queries": ["query_2"], "depends_on": None},
+            {"queries": ["query_3"], "depends_on": ["first", "second"]},
+        ]
+    }
+    queries = config.extract_queries_setup()
+    assert queries["query_1"]["block"] == "first"
+    assert queries["query_2"]["depends_on"] == []
+    assert queries["query_3"]["depends_on"] == ["first", "second"]
+
+
+# missing ads_data_from defaults to all customer ids
+def test_ads_data_from_defaults_to_customer_ids(tmp_path):
+    (tmp_path / "config.yml").write_text("customer_id: [1, 2]\n"
+                                         "queries_setup: []\n")
+    config = Config("config.yml", str(tmp_path))
+    assert config.ads_data_from == [1, 2]
+
+
+# invalid configs are rejected when config is compiled
+@pytest.mark.parametrize("queries_setup,error", [
+    ([{"queries": ["query_1"], "wait": "all"}], "wait should be one of"),
+    ([{"queries": ["query_1"], "depends_on": "unknown"}], "unknown block"),
+    ([{"name": "a", "queries": ["query_1"], "depends_on": "b"},
+      {"name": "b", "queries": ["query_2"], "depends_on": "a"}],
+     "Circular dependency"),
+    ([{"queries": ["query_1"]}, {"queries": ["query_1"]}],
+     "more than one block"),
+    ([{"queries": ["query_1"], "parameters": {"p": {"values": 1}}}],
+     "parameter p should have type"),
+    ([{"queries": ["query_1"], "polling": {"interval": 1}}],
+     "unknown polling option"),
+    ([{"queries": ["query_1"], "date_range_setup": {"start_date": "01/01"}}],
+     "start_date should be"),
+    ([{"parameters": {}}], "no queries specified"),
+])
+def test_extract_queries_setup_invalid(queries_setup, error):
+    config = Config(_SAMPLE_CONFIG_PATH, os.path.dirname(__file__))
+    config.config = {"queries_setup": queries_setup}
+    with pytest.raises(ConfigError, match=error):
+        config.extract_queries_setup()
+
+
+# setup of the query is read-only and compiled into blocks
+def test_extract_queries_setup_plan():
+    config = Config(_SAMPLE_CONFIG_PATH, os.path.dirname(__file__))
+    config.config = _CONFIG
+    queries = config.extract_queries_setup()
+    with pytest.raises(AttributeError):
+        queries["sample_query_3"].wait = True
+    with pytest.raises(TypeError):
+        queries["new_query"] = queries["sample_query_3"]
+    assert [block.queries for block in config.blocks
+            ] == [("sample_query_1_1", "sample_query_1_2"),
+                  ("sample_query_2_1", "sample_query_2_2"),
+                  ("sample_query_3", )]
+
+
+# included files add their blocks before blocks of the including file
+def test_config_include(tmp_path):
+    (tmp_path / "team").mkdir()
+    (tmp_path / "team" / "team.yml").write_text(
+        "bq_dataset: team\nqueries_setup:\n"
+        "  - name: team\n    queries: [team_query]\n    wait: block\n")
+    (tmp_path / "config.yml").write_text(
+        "include: team/team.yml\nbq_project: project\nqueries_setup:\n"
+        "  - queries: [query]\n")
+    config = Config("config.yml", str(tmp_path))
+    assert list(config.queries) == ["team_query", "query"]
+    assert config.queries["query"].depends_on == ["team"]
+    assert (config.bq_project, config.bq_dataset) == ("project", "team")
+
+
+# circular includes are rejected
+def test_config_circular_include(tmp_path):
+    (tmp_path / "a.yml").write_text("include: b.yml\nqueries_setup: []\n")
+    (tmp_path / "b.yml").write_text("include: a.yml\nqueries_setup: []\n")
+    with pytest.raises(ConfigError, match="Circular include"):
+        Config("a.yml", str(tmp_path))
+
+
+# config can be provided as already loaded dict
+def test_config_from_dict(tmp_path):
+    (tmp_path / "team.yml").write_text(
+        "queries_setup:\n  - queries: [team_query]\n")
+    config = Config(
+        {
+            "include": "team.yml",
+            "customer_id": 1,
+            "queries_setup": [{
+                "queries": ["query"]
+            }]
+        }, str(tmp_path))
+    assert config.path is None
+    assert config.customer_id == [1]
+    assert list(config.queries) == ["team_query", "query"]
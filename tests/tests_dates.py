@@ -0,0 +1,64 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from adh_deployment_manager.dates import get_date_windows
+
+
+def _format(windows):
+    return [(start.isoformat(), end.isoformat()) for start, end in windows]
+
+
+### TESTS
+# range is split by day by default
+def test_get_date_windows_daily():
+    assert _format(get_date_windows("2021-01-30", "2021-02-01")) == [
+        ("2021-01-30", "2021-01-30"), ("2021-01-31", "2021-01-31"),
+        ("2021-02-01", "2021-02-01")
+    ]
+
+
+# weekly windows follow calendar weeks
+def test_get_date_windows_weekly():
+    assert _format(get_date_windows("2021-01-01", "2021-01-12", "week")) == [
+        ("2021-01-01", "2021-01-03"), ("2021-01-04", "2021-01-10"),
+        ("2021-01-11", "2021-01-12")
+    ]
+
+
+# monthly windows follow calendar months
+def test_get_date_windows_monthly():
+    assert _format(get_date_windows("2020-12-15", "2021-02-10",
+                                    "monthly")) == [
+                                        ("2020-12-15", "2020-12-31"),
+                                        ("2021-01-01", "2021-01-31"),
+                                        ("2021-02-01", "2021-02-10")
+                                    ]
+
+
+# N-day windows start from the first date
+def test_get_date_windows_n_days():
+    assert _format(get_date_windows("2021-01-01", "2021-01-07", 3)) == [
+        ("2021-01-01", "2021-01-03"), ("2021-01-04", "2021-01-06"),
+        ("2021-01-07", "2021-01-07")
+    ]
+
+
+# invalid window raises ValueError
+@pytest.mark.parametrize("window", ["fortnight", 0])
+def test_get_date_windows_invalid(window):
+    with pytest.raises(ValueError):
+        get_date_windows("2021-01-01", "2021-01-07", window)
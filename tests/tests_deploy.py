@@ -0,0 +1,97 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pytest
+from googleapiclient.errors import HttpError  # type: ignore
+
+from adh_deployment_manager.commands.deploy import Deployer
+from adh_deployment_manager.commands.update import Updater
+from adh_deployment_manager.state import DeploymentState
+
+_CUSTOMER = "customers/000000001"
+
+# define sample config with two queries
+_CONFIG = {
+    "customer_id": "1",
+    "bq_project": "project",
+    "bq_dataset": "dataset",
+    "date_range_setup": {
+        "start_date": "2021-01-01",
+        "end_date": "2021-01-03"
+    },
+    "queries_setup": [{
+        "queries": ["good_query", "bad_query"]
+    }]
+}
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def get_deployment(create_deployment):
+    def get_deployment(good_text, bad_text):
+        return create_deployment(_CONFIG, {
+            "good_query": good_text,
+            "bad_query": bad_text
+        })
+
+    return get_deployment
+
+
+def _get_state(deployment, query):
+    return DeploymentState(deployment.state.path).get(_CUSTOMER, query)
+
+
+### TESTS
+# queries deployed before a failure are recorded in state
+def test_deploy_partial_failure(get_deployment):
+    deployment = get_deployment("SELECT 1", "")
+    with pytest.raises(HttpError):
+        Deployer(deployment).execute()
+    assert _get_state(deployment, "good_query")
+    assert not _get_state(deployment, "bad_query")
+
+
+# unchanged queries are recorded in state when deployed without update
+def test_deploy_records_unchanged_queries(get_deployment):
+    deployment = get_deployment("SELECT 1", "SELECT 1")
+    Deployer(deployment).execute()
+    os.remove(deployment.state.path)
+    deployment = get_deployment("SELECT 1", "SELECT 1")
+    Deployer(deployment).execute()
+    assert _get_state(deployment, "good_query")
+    assert _get_state(deployment, "bad_query")
+
+
+# queries updated before a failure are recorded in state
+def test_update_partial_failure(get_deployment, server, monkeypatch):
+    Deployer(get_deployment("SELECT 1", "SELECT 1")).execute()
+    deployment = get_deployment("SELECT 2", "SELECT 2")
+    hashes = {
+        query: _get_state(deployment, query)["hash"]
+        for query in ("good_query", "bad_query")
+    }
+    patch_query = server._patch_query
+
+    def fail_bad_query(name, params, body):
+        if body.get("title") == "bad_query":
+            return 400, {"error": {"code": 400, "message": "invalid query"}}
+        return patch_query(name, params, body)
+
+    monkeypatch.setattr(server, "_patch_query", fail_bad_query)
+    with pytest.raises(HttpError):
+        Updater(deployment).execute()
+    assert _get_state(deployment, "good_query")["hash"] != hashes["good_query"]
+    assert _get_state(deployment, "bad_query")["hash"] == hashes["bad_query"]
@@ -0,0 +1,157 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from adh_deployment_manager.deployment import Deployment
+from adh_deployment_manager.diff import CREATE, UPDATE, UNCHANGED, diff_queries, format_changes, get_query_hash
+from adh_deployment_manager.query import AdhQuery, AnalysisQuery
+from adh_deployment_manager.state import DeploymentState
+
+_CUSTOMER = "customers/000000001"
+_PARAMETERS = {"parameter_1": {"type": "STRING", "values": "1"}}
+
+
+def _get_queries(text="SELECT 1", parameters=_PARAMETERS):
+    adh_query = AdhQuery("query", text, parameters)
+    return [(adh_query, AnalysisQuery(None, "1", query=adh_query))]
+
+
+def _get_remote_query(text="SELECT 1", update_time="2021-01-01T00:00:00Z"):
+    return {
+        "name": f"{_CUSTOMER}/analysisQueries/1",
+        "title": "query",
+        "queryText": text,
+        "parameterTypes": {
+            "PARAMETER_1": {
+                "type": {
+                    "type": "STRING"
+                }
+            }
+        },
+        "updateTime": update_time
+    }
+
+
+def _diff(remote_query, state=None, **kwargs):
+    queries = _get_queries(**kwargs)
+    for _, analysis_query in queries:
+        analysis_query._set_from_get_response({"queries": [remote_query]})
+    return diff_queries(queries, [{"queries": [remote_query]}], state)
+
+
+class _Deployment:
+    """ Deployment which counts queries fetched from ADH."""
+    _diff_queries = Deployment._diff_queries
+    _set_state = Deployment._set_state
+    _plan_queries = Deployment._plan_queries
+
+    def __init__(self, state, remote_query):
+        self.state = state
+        self.state_ttl = 60
+        self.remote_query = remote_query
+        self.fetched = []
+
+    def _fetch_queries(self, analysis_queries):
+        self.fetched.extend(analysis_queries)
+        for analysis_query in analysis_queries:
+            analysis_query._set_from_get_response(
+                {"queries": [self.remote_query]})
+        return [{"queries": [self.remote_query]} for _ in analysis_queries]
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def state(tmp_path):
+    return DeploymentState(str(tmp_path / "state.json"))
+
+
+### TESTS
+# line endings and trailing whitespace don't change query hash
+def test_query_hash_normalized():
+    assert get_query_hash({"title": "q", "queryText": "SELECT 1\r\nFROM t  \n"
+                           }) == get_query_hash({
+                               "title": "q",
+                               "queryText": "SELECT 1\nFROM t",
+                               "parameterTypes": {}
+                           })
+
+
+# missing query is created
+def test_diff_create():
+    changes = diff_queries(_get_queries(), [{}])
+    assert [change.action for change in changes] == [CREATE]
+
+
+# query identical to remote one isn't updated
+def test_diff_unchanged():
+    assert _diff(_get_remote_query())[0].action == UNCHANGED
+
+
+# query with changed text is updated
+def test_diff_update():
+    assert _diff(_get_remote_query(), text="SELECT 2")[0].action == UPDATE
+
+
+# query deployed earlier is compared with deployment state if ADH changed
+# its content, unless it was modified remotely after deployment
+def test_diff_uses_state(state):
+    query_hash = _diff(_get_remote_query(), text="SELECT 2")[0].query_hash
+    state.set(_CUSTOMER, "query", hash=query_hash,
+              updateTime="2021-01-01T00:00:00Z")
+    assert _diff(_get_remote_query(), state,
+                 text="SELECT 2")[0].action == UNCHANGED
+    assert _diff(_get_remote_query(update_time="2021-02-01T00:00:00Z"),
+                 state,
+                 text="SELECT 2")[0].action == UPDATE
+
+
+# state is persisted between runs
+def test_state_saved(state):
+    state.set(_CUSTOMER, "query", hash="abc")
+    state.save()
+    assert DeploymentState(state.path).get(_CUSTOMER, "query") == {
+        "hash": "abc"
+    }
+
+
+# report lists every change
+def test_format_changes():
+    report = format_changes(_diff(_get_remote_query(), text="SELECT 2"))
+    assert report.splitlines() == [
+        f"~ update    {_CUSTOMER} query",
+        "0 to create, 1 to update, 0 unchanged."
+    ]
+
+
+# plan fetches queries missing from state and then uses state only
+def test_plan_uses_state(state):
+    deployment = _Deployment(state, _get_remote_query())
+    assert [c.action for c in deployment._plan_queries(_get_queries())
+            ] == [UNCHANGED]
+    assert len(deployment.fetched) == 1
+    assert [
+        c.action for c in deployment._plan_queries(_get_queries("SELECT 2"))
+    ] == [UPDATE]
+    assert len(deployment.fetched) == 1
+
+
+# stale state is refreshed from ADH
+def test_plan_refreshes_stale_state(state):
+    deployment = _Deployment(state, _get_remote_query())
+    deployment._plan_queries(_get_queries())
+    state.set(_CUSTOMER, "query", syncTime=0)
+    deployment._plan_queries(_get_queries())
+    assert len(deployment.fetched) == 2
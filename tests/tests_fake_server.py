@@ -0,0 +1,120 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import pytest
+from googleapiclient.errors import HttpError  # type: ignore
+
+import adh_deployment_manager.utils as utils
+from adh_deployment_manager.adh_service import AdhService
+from adh_deployment_manager.fake_server import FakeAdhServer
+from adh_deployment_manager.job import Job, check_operation_status
+from adh_deployment_manager.query import AnalysisQuery
+from adh_deployment_manager.query_index import QueryIndex
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def server():
+    with FakeAdhServer(page_size=2, job_duration=0.2) as server:
+        yield server
+
+
+@pytest.fixture
+def service(server):
+    # discovery document is downloaded from the server
+    return AdhService(None, "key", root_url=server.url)
+
+
+def _start(service, title="query"):
+    analysis_query = AnalysisQuery(service,
+                                   "1",
+                                   title=title,
+                                   text="SELECT 1")
+    analysis_query.deploy()
+    return utils.execute_adh_api_call_with_retry(
+        analysis_query._run("2021-01-01", "2021-01-01", "project.dataset.t"))
+
+
+### TESTS
+# deployed query can be found and updated
+def test_fake_server_queries(service):
+    AnalysisQuery(service, "1", title="query", text="SELECT 1").deploy()
+    analysis_query = AnalysisQuery(service, "1", title="query")
+    analysis_query.get()
+    assert analysis_query.text == "SELECT 1"
+    analysis_query.update(text="SELECT 2")
+    analysis_query.get()
+    assert analysis_query.text == "SELECT 2"
+
+
+# query with existing title cannot be created
+def test_fake_server_duplicate_query(service):
+    AnalysisQuery(service, "1", title="query", text="SELECT 1").deploy()
+    with pytest.raises(HttpError) as e:
+        AnalysisQuery(service, "1", title="query", text="SELECT 1").deploy()
+    assert e.value.resp.status == 409
+
+
+# queries are listed page by page
+def test_fake_server_pagination(server, service):
+    for i in range(5):
+        server.add_query(1, f"query_{i}")
+    index = QueryIndex(service)
+    assert index.get("customers/000000001", "query_4")
+    assert server.calls["adsdatahub.customers.analysisQueries.list"] == 3
+
+
+# job runs for job_duration and then succeeds
+def test_fake_server_job(service):
+    operation = _start(service)
+    assert check_operation_status(service,
+                                  operation["name"])["status"] == "Running"
+    time.sleep(0.3)
+    assert check_operation_status(service,
+                                  operation["name"])["status"] == "Success"
+
+
+# cancelled job finishes with error
+def test_fake_server_cancel_job(service):
+    job = Job(_start(service)["name"], service)
+    job.stop()
+    assert job.get_status()["status"] == "Error"
+
+
+# calls of batch request are executed one by one
+def test_fake_server_batch(server, service):
+    for i in range(3):
+        server.add_query(1, f"query_{i}")
+    responses = service.execute_batch([
+        AnalysisQuery(service, "1", title=f"query_{i}")._get()
+        for i in range(3)
+    ])
+    assert [response["queries"][0]["title"] for response in responses
+            ] == ["query_0", "query_1", "query_2"]
+    assert server.calls["batch"] == 1
+
+
+# injected errors are retried
+def test_fake_server_injected_errors():
+    with FakeAdhServer(error_rate=0.5, retry_after=0, seed=1) as server:
+        service = AdhService(None,
+                             "key",
+                             discovery_document=server.discovery_document)
+        for i in range(5):
+            AnalysisQuery(service, "1", title=f"query_{i}",
+                          text="SELECT 1").deploy()
+        assert len(server.queries) == 5
+        assert server.calls["adsdatahub.customers.analysisQueries.create"] > 5
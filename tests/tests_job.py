@@ -0,0 +1,82 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from adh_deployment_manager.job import OperationPoller, PollingPolicy, DurationEstimator
+
+# end time of operation which is still running
+_RUNNING = "1970-01-01T00:00:00Z"
+
+
+### TESTS
+# wait returns final status of the operation
+def test_poller_wait(service):
+    poller = OperationPoller(service, PollingPolicy(initial_delay=0, delay=0))
+    assert poller.wait("operations/0") == {
+        "status": "Success",
+        "errors": None
+    }
+
+
+# all watched operations are refreshed by a single list call per tick
+def test_poller_multiplexes_operations(service):
+    poller = OperationPoller(service,
+                            PollingPolicy(initial_delay=0.1, delay=0.01))
+    futures = [poller.watch(name) for name in service.names]
+    assert all(future.result(timeout=5) for future in futures)
+    assert {method for method, _ in service.calls} == {"operations.list"}
+    assert len(service.calls) <= 2
+
+
+# operations missing from operations listing are fetched individually
+def test_poller_fetches_missing_operations(service):
+    poller = OperationPoller(service, PollingPolicy(initial_delay=0, delay=0))
+    poller.wait("operations/unlisted")
+    assert ("operations.get", "operations/unlisted") in service.calls
+
+
+# next_delay grows exponentially and is capped by max_delay
+@pytest.mark.parametrize("expected,attempt", [(1, 0), (2, 1), (4, 2), (5, 10)])
+def test_polling_policy_backoff(expected, attempt):
+    policy = PollingPolicy(initial_delay=1,
+                           delay=2,
+                           multiplier=2,
+                           max_delay=5,
+                           jitter=0)
+    assert policy.next_delay(attempt) == expected
+
+
+# next_delay waits until expected end of the query
+def test_polling_policy_expected_duration():
+    policy = PollingPolicy(delay=2, jitter=0)
+    assert policy.next_delay(1, elapsed=10, expected_duration=100) == 90
+
+
+# estimator learns duration of finished queries only
+def test_duration_estimator():
+    estimator = DurationEstimator()
+    for i, end_time in enumerate(
+        ["2021-01-01T00:01:00.5Z", _RUNNING, "2021-01-01T00:03:00Z"]):
+        estimator.add({
+            "name": f"operations/{i}",
+            "metadata": {
+                "queryTitle": "query",
+                "startTime": "2021-01-01T00:00:00Z",
+                "endTime": end_time
+            }
+        })
+    assert estimator.expected_duration("query") == 180
+    assert estimator.expected_duration("unknown") is None
@@ -0,0 +1,142 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+import adh_deployment_manager.journal as journal
+from adh_deployment_manager.commands.deploy import Deployer
+from adh_deployment_manager.commands.run import Runner
+from adh_deployment_manager.job import Job
+from adh_deployment_manager.journal import RunJournal
+
+# define sample config with a query launched for three days
+_CONFIG = {
+    "customer_id": "1",
+    "bq_project": "project",
+    "bq_dataset": "dataset",
+    "date_range_setup": {
+        "start_date": "2021-01-01",
+        "end_date": "2021-01-03"
+    },
+    "queries_setup": [{
+        "queries": ["daily_query"],
+        "execution_mode": "batch"
+    }]
+}
+
+
+# Define fixtures to be used by pytest
+# jobs are still running when the next run is resumed
+@pytest.fixture
+def server_options():
+    return {"job_duration": 60}
+
+
+@pytest.fixture
+def deployment(create_deployment):
+    deployment = create_deployment(_CONFIG, {"daily_query": "SELECT 1"})
+    Deployer(deployment).execute()
+    return deployment
+
+
+def _reload(deployment):
+    deployment.journal = RunJournal(deployment.journal.path)
+    return deployment.journal
+
+
+### TESTS
+# the latest record of each job wins and corrupted records are skipped
+def test_journal_load(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    run_journal = RunJournal(path)
+    run_journal.record("job", status=journal.PLANNED, destTable="table")
+    run_journal.record("job", status=journal.LAUNCHED, operation="op")
+    run_journal.close()
+    with open(path, "a") as f:
+        f.write('{"key": "job", "sta')
+    record = RunJournal(path).get("job")
+    assert record["status"] == journal.LAUNCHED
+    assert record["destTable"] == "table"
+    assert record["operation"] == "op"
+
+
+# reset journal forgets jobs of the previous run
+def test_journal_reset(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    run_journal = RunJournal(path)
+    run_journal.record("job", status=journal.PLANNED)
+    run_journal.reset()
+    assert len(run_journal) == 0
+    assert len(RunJournal(path)) == 0
+
+
+# every launched job is journaled with its operation
+def test_run_journals_jobs(server, deployment):
+    Runner(deployment).execute()
+    records = [
+        _reload(deployment).get(
+            journal.get_job_key("customers/000000001",
+                                f"daily_query_2021010{day}",
+                                f"2021-01-0{day}", f"2021-01-0{day}",
+                                f"project.dataset.daily_query_2021010{day}"))
+        for day in (1, 2, 3)
+    ]
+    assert [record["status"] for record in records] == [journal.LAUNCHED] * 3
+    assert {record["operation"] for record in records} == set(server.operations)
+
+
+# resumed run re-attaches to running jobs and relaunches unlaunched ones
+def test_run_resume(server, deployment):
+    Runner(deployment).execute()
+    run_journal = _reload(deployment)
+    # job planned by a run which was killed before launching it
+    key = journal.get_job_key("customers/000000001", "daily_query_20210103",
+                              "2021-01-03", "2021-01-03",
+                              "project.dataset.daily_query_20210103")
+    run_journal.record(key, status=journal.PLANNED)
+    Runner(deployment).execute(resume=True)
+    assert len(server.operations) == 4
+    assert _reload(deployment).get(key)["operation"] in server.operations
+
+
+# status of launched jobs is checked by listing operations, not job by job
+def test_run_resume_lists_operations(server, deployment):
+    Runner(deployment).execute()
+    _reload(deployment)
+    calls = server.calls.copy()
+    Runner(deployment).execute(resume=True)
+    assert len(server.operations) == 3
+    assert server.calls["adsdatahub.operations.get"] == calls[
+        "adsdatahub.operations.get"]
+    assert server.calls["adsdatahub.operations.list"] == calls[
+        "adsdatahub.operations.list"] + 1
+
+
+# resumed run relaunches failed jobs
+def test_run_resume_failed_job(server, deployment):
+    launched_jobs = Runner(deployment).execute()["launched_jobs"]
+    Job(launched_jobs[0], deployment.adh_service).stop()
+    _reload(deployment)
+    relaunched_jobs = Runner(deployment).execute(resume=True)["launched_jobs"]
+    assert len(server.operations) == 4
+    assert launched_jobs[0] not in relaunched_jobs
+    assert list(relaunched_jobs)[1:] == list(launched_jobs)[1:]
+
+
+# run without resume launches all jobs again
+def test_run_without_resume(server, deployment):
+    Runner(deployment).execute()
+    Runner(deployment).execute()
+    assert len(server.operations) == 6
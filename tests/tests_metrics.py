@@ -0,0 +1,157 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import pytest
+from googleapiclient.errors import HttpError  # type: ignore
+
+import adh_deployment_manager.metrics as metrics
+import adh_deployment_manager.utils as utils
+from adh_deployment_manager.adh_service import AdhService
+from adh_deployment_manager.fake_server import FakeAdhServer
+from adh_deployment_manager.query import AnalysisQuery
+
+_CREATE = "adsdatahub.customers.analysisQueries.create"
+
+
+def _get_call(method=_CREATE, status=200, **kwargs):
+    values = dict(method=method,
+                  customer="1",
+                  start_time=1600000000.0,
+                  duration=0.5,
+                  latency=0.2,
+                  retries=0,
+                  sleep=0.0,
+                  status=status)
+    values.update(kwargs)
+    return metrics.ApiCall(**values)
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def collector():
+    hook = metrics.add_hook(metrics.MetricsCollector())
+    yield hook
+    metrics.remove_hook(hook)
+
+
+### TESTS
+# customer id is extracted from URI of API call
+def test_get_customer():
+    assert metrics.get_customer(
+        "https://adsdatahub.googleapis.com/v1/customers/123/analysisQueries"
+    ) == "123"
+    assert metrics.get_customer("operations/abc") is None
+
+
+# calls, retries, latency and sleeps are aggregated
+def test_collector_summary():
+    collector = metrics.MetricsCollector()
+    collector.on_api_call(_get_call())
+    collector.on_api_call(_get_call(status=429, retries=2, sleep=3.0))
+    collector.on_sleep(metrics.RATE_LIMIT, 1.5)
+    assert collector.get_summary() == {
+        "api_calls": 2,
+        "api_seconds": pytest.approx(0.4),
+        "retries": 2,
+        "rate_limit_sleep_seconds": 1.5,
+        "retry_sleep_seconds": 3.0,
+    }
+
+
+# metrics are exported in Prometheus text format
+def test_collector_prometheus(tmp_path):
+    collector = metrics.MetricsCollector(buckets=(0.1, 1))
+    collector.on_api_call(_get_call(status=503, retries=1))
+    path = str(tmp_path / "metrics.prom")
+    collector.write_prometheus(path)
+    with open(path, "r") as f:
+        lines = f.read().splitlines()
+    assert (f'adh_api_calls_total{{method="{_CREATE}",customer="1",'
+            'status="503"} 1') in lines
+    assert (f'adh_api_call_duration_seconds_bucket{{method="{_CREATE}",'
+            'le="0.1"} 0') in lines
+    assert (f'adh_api_call_duration_seconds_bucket{{method="{_CREATE}",'
+            'le="+Inf"} 1') in lines
+    assert f'adh_api_retries_total{{method="{_CREATE}"}} 1' in lines
+
+
+# failing hook doesn't break API calls or other hooks
+def test_failing_hook(collector):
+    class FailingHook(metrics.MetricsHook):
+        def on_api_call(self, call):
+            raise ValueError("failed")
+
+    hook = metrics.add_hook(FailingHook())
+    try:
+        metrics.record_api_call(_get_call())
+    finally:
+        metrics.remove_hook(hook)
+    assert collector.get_summary()["api_calls"] == 1
+
+
+# calls and sleeps are written as JSON lines
+def test_json_lines_exporter(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    exporter = metrics.JsonLinesExporter(path)
+    exporter.on_api_call(_get_call())
+    exporter.on_sleep(metrics.POLLING, 2.0)
+    exporter.close()
+    with open(path, "r") as f:
+        events = [json.loads(line) for line in f]
+    assert events[0]["type"] == "api_call"
+    assert events[0]["method"] == _CREATE
+    assert events[1]["type"] == "sleep"
+    assert events[1]["reason"] == metrics.POLLING
+
+
+# calls made via AdhService are recorded with their retries and status
+def test_instrumented_calls(collector):
+    with FakeAdhServer(error_rate=0.5, retry_after=0.01, seed=1) as server:
+        service = AdhService(None,
+                             "key",
+                             discovery_document=server.discovery_document)
+        for i in range(5):
+            AnalysisQuery(service, "1", title=f"query_{i}",
+                          text="SELECT 1").deploy()
+        with pytest.raises(HttpError):
+            utils.execute_adh_api_call_with_retry(
+                AnalysisQuery(service, "1", title="query_0",
+                              text="SELECT 1")._create(),
+                policy=utils.RetryPolicy(max_retries=0))
+        created = server.calls[_CREATE]
+    statuses = {
+        status: count
+        for (method, customer, status), count in collector.calls.items()
+        if method == _CREATE and customer == "000000001"
+    }
+    assert statuses["200"] == 5
+    assert sum(statuses.values()) == 6
+    assert collector.retries[_CREATE] == created - 6
+    assert collector.get_summary()["retry_sleep_seconds"] > 0
+
+
+# calls are exported as OpenTelemetry spans
+def test_open_telemetry_exporter(tmp_path):
+    pytest.importorskip("opentelemetry.sdk")
+    path = str(tmp_path / "trace.jsonl")
+    exporter = metrics.OpenTelemetryExporter(path=path)
+    exporter.on_api_call(_get_call(status=503))
+    exporter.close()
+    with open(path, "r") as f:
+        spans = [json.loads(line) for line in f]
+    assert spans[0]["name"] == _CREATE
+    assert spans[0]["attributes"]["http.status_code"] == "503"
+    assert spans[0]["status"]["status_code"] == "ERROR"
@@ -0,0 +1,86 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import pstats
+import pytest
+
+import adh_deployment_manager.metrics as metrics
+import adh_deployment_manager.profiling as profiling
+import adh_deployment_manager.utils as utils
+from adh_deployment_manager.config import Config
+from adh_deployment_manager.profiling import Profiler
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def config_path():
+    return os.path.join(os.path.dirname(__file__), "sample_config.yml")
+
+
+### TESTS
+# phases aren't timed unless profiler is started
+def test_phase_without_profiler():
+    with profiling.phase("auth"):
+        pass
+    assert profiling._profiler is None
+
+
+# config and SQL files loading are timed as separate phases
+def test_profiler_phases(config_path):
+    with Profiler(cpu=False) as profiler:
+        Config(config_path)
+        utils.get_file_content("sample_query.sql",
+                               os.path.dirname(__file__))
+    phases = profiler.get_phases()
+    assert phases["config"]["calls"] == 1
+    assert phases["sql"]["calls"] == 1
+    assert profiling._profiler is None
+
+
+# API calls and sleeps recorded by metrics are reported as phases
+def test_profiler_api_phases():
+    with Profiler(cpu=False) as profiler:
+        metrics.record_api_call(
+            metrics.ApiCall(method="adsdatahub.operations.get",
+                            customer=None,
+                            start_time=0,
+                            duration=1.5,
+                            latency=1.0,
+                            retries=1,
+                            sleep=0.5,
+                            status=200))
+        metrics.record_sleep(metrics.POLLING, 10)
+    phases = profiler.get_phases()
+    assert phases["api"] == {"seconds": 1.0, "calls": 1}
+    assert phases["retry_sleep"] == {"seconds": 0.5}
+    assert phases["polling_sleep"] == {"seconds": 10}
+    assert not metrics.is_enabled()
+
+
+# report is written as JSON together with CPU profile
+def test_profiler_write(tmp_path, config_path):
+    with Profiler() as profiler:
+        Config(config_path)
+    path = str(tmp_path / "profile.json")
+    profiler.write(path)
+    with open(path, "r") as f:
+        report = json.load(f)
+    assert report["wall_seconds"] > 0
+    assert "config" in report["phases"]
+    assert any("config.py" in function["function"]
+               for function in report["functions"])
+    assert pstats.Stats(str(tmp_path / "profile.prof")).total_calls > 0
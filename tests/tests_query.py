@@ -13,9 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 
-from adh_deployment_manager.query import Parameters
+import adh_deployment_manager.utils as utils
+from adh_deployment_manager.query import AnalysisQuery, Parameters
+from tests.conftest import _http_error
 
 # define sample config used for running test against
 _CONFIG = {
@@ -87,6 +91,20 @@ def broken_setup():
     }
 
 
+# Define fixture which records sleeps instead of sleeping
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(utils.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def _get_analysis_query(service):
+    analysis_query = AnalysisQuery(service, "1", title="query", text="SELECT 1")
+    analysis_query.name = "customers/000000001/analysisQueries/1"
+    return analysis_query
+
+
 # define invalid parameters that are empty
 @pytest.fixture
 def broken_parameters():
@@ -151,3 +169,41 @@ def test_prepare_parameters_broken_parameters(broken_parameters):
     with pytest.raises(ValueError):
         prepared_parameters = \
             Parameters.prepare_parameters(broken_parameters)
+
+
+# validation is retried on rate limiting instead of rejecting the query
+def test_validate_retries_transient_error(service, sleeps):
+    service.analysisQueries().validation_errors = [_http_error(429)]
+    assert _get_analysis_query(service).validate() == (True, None)
+    assert len(sleeps) == 1
+
+
+# query rejected by the API is reported as invalid without retries
+def test_validate_invalid_query(service, sleeps):
+    service.analysisQueries().validation_errors = [_http_error(400)]
+    is_valid, error = _get_analysis_query(service).validate()
+    assert not is_valid
+    assert error.resp.status == 400
+    assert len(service.calls) == 1
+    assert sleeps == []
+
+
+# query launched by several workers at once is validated once
+def test_run_validates_once(service, monkeypatch):
+    analysis_query = _get_analysis_query(service)
+    validate = analysis_query.validate
+
+    def slow_validate():
+        time.sleep(0.01)
+        return validate()
+
+    monkeypatch.setattr(analysis_query, "validate", slow_validate)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(
+            executor.map(
+                lambda i: analysis_query._run("2021-01-01", "2021-01-01",
+                                              f"table_{i}"), range(8)))
+    validations = [
+        call for call in service.calls if call[0] == "analysisQueries.validate"
+    ]
+    assert len(validations) == 1
@@ -0,0 +1,79 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from adh_deployment_manager.query import AnalysisQuery
+from adh_deployment_manager.query_index import QueryIndex
+
+_CUSTOMER = "customers/000000001"
+
+
+### TESTS
+# all queries of customer are resolved with a single paginated listing
+def test_query_index_lists_customer_once(service):
+    index = QueryIndex(service)
+    analysis_queries = [
+        AnalysisQuery(service, "1", title=f"query_{i}", query_index=index)
+        for i in range(5)
+    ]
+    for i, analysis_query in enumerate(analysis_queries):
+        assert analysis_query.get()
+        assert analysis_query.name == f"{_CUSTOMER}/analysisQueries/{i}"
+    assert [page for _, page in service.calls] == [None, "2", "4"]
+
+
+# missing query is resolved to empty result
+def test_query_index_missing_query(service):
+    analysis_query = AnalysisQuery(service,
+                                   "1",
+                                   title="unknown",
+                                   query_index=QueryIndex(service))
+    assert analysis_query.get() == {}
+    assert analysis_query.name is None
+
+
+# deployed queries are added to index
+def test_query_index_add(service):
+    index = QueryIndex(service)
+    analysis_query = AnalysisQuery(service,
+                                   "1",
+                                   title="new_query",
+                                   query_index=index)
+    analysis_query._set_from_deploy_response({
+        "name": f"{_CUSTOMER}/analysisQueries/new",
+        "title": "new_query"
+    })
+    assert index.get(_CUSTOMER, "new_query")["name"].endswith("/new")
+    assert len(service.calls) == 3
+
+
+# query updated later is not overwritten by older version
+def test_query_index_add_keeps_newer_query(service):
+    index = QueryIndex(service)
+    index.add(_CUSTOMER, {"title": "q", "updateTime": "2021-02-01T00:00:00Z"})
+    index.add(_CUSTOMER, {"title": "q", "updateTime": "2021-01-01T00:00:00Z"})
+    assert index.get(_CUSTOMER, "q")["updateTime"] == "2021-02-01T00:00:00Z"
+
+
+# persisted index is reused by other runs until it's invalidated
+def test_query_index_persisted(service, tmp_path):
+    QueryIndex(service, ttl=60, cache_dir=str(tmp_path)).get(_CUSTOMER, "q")
+    index = QueryIndex(service, ttl=60, cache_dir=str(tmp_path))
+    assert index.get(_CUSTOMER, "query_0")
+    assert len(service.calls) == 3
+    index.invalidate(_CUSTOMER)
+    assert index.get(_CUSTOMER, "query_0")
+    assert len(service.calls) == 6
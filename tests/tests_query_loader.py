@@ -0,0 +1,70 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pytest
+
+import adh_deployment_manager.utils as utils
+from adh_deployment_manager.query_loader import QueryLoader
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def query_files(tmp_path):
+    for i in range(5):
+        (tmp_path / f"query_{i}.sql").write_text(f"# comment\nSELECT {i}\n")
+    return [str(tmp_path / f"query_{i}.sql") for i in range(5)]
+
+
+# Define fixture which counts file reads
+@pytest.fixture
+def reads(monkeypatch):
+    reads = []
+    get_file_content = utils.get_file_content
+
+    def read(path):
+        reads.append(path)
+        return get_file_content(path)
+
+    monkeypatch.setattr(utils, "get_file_content", read)
+    return reads
+
+
+### TESTS
+# all files are read with comments removed
+def test_query_loader_load(query_files):
+    texts = QueryLoader().load(query_files)
+    assert [texts[path] for path in query_files
+            ] == [f"SELECT {i}" for i in range(5)]
+
+
+# unchanged files are read once
+def test_query_loader_cached(query_files, reads):
+    loader = QueryLoader()
+    loader.load(query_files)
+    loader.load(query_files)
+    assert len(reads) == 5
+
+
+# modified file is read again
+def test_query_loader_modified(query_files, reads):
+    loader = QueryLoader()
+    loader.load(query_files)
+    with open(query_files[0], "w") as f:
+        f.write("SELECT 10")
+    os.utime(query_files[0], (0, 0))
+    assert loader.load(query_files)[query_files[0]] == "SELECT 10"
+    assert len(reads) == 6
+
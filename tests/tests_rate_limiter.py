@@ -0,0 +1,60 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from adh_deployment_manager.rate_limiter import RateLimiter, TokenBucket
+
+
+### TESTS
+# get_method_family returns last part of method id
+@pytest.mark.parametrize(
+    "expected,method_id",
+    [("list", "adsdatahub.customers.analysisQueries.list"),
+     ("list", "adsdatahub.operations.list"),
+     ("start", "adsdatahub.customers.analysisQueries.start"),
+     ("default", None)])
+def test_get_method_family(expected, method_id):
+    assert RateLimiter.get_method_family(method_id) == expected
+
+
+# reserve doesn't wait while bucket has tokens
+def test_token_bucket_burst():
+    bucket = TokenBucket(rate=2, capacity=2)
+    assert [bucket.reserve() for _ in range(2)] == [0, 0]
+
+
+# reserve waits for refill once bucket is empty
+def test_token_bucket_wait():
+    bucket = TokenBucket(rate=2, capacity=1)
+    bucket.reserve()
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.01)
+    assert bucket.reserve() == pytest.approx(1, abs=0.01)
+
+
+# families are limited independently, missing families use default rate
+def test_rate_limiter_families():
+    limiter = RateLimiter({"start": 1, "default": 1})
+    assert limiter.reserve("adsdatahub.customers.analysisQueries.start") == 0
+    assert limiter.reserve("adsdatahub.operations.list") == 0
+    assert limiter.reserve("adsdatahub.operations.get") == 0
+    assert limiter.reserve("adsdatahub.operations.list") > 0
+
+
+# calls are not limited if qps isn't provided
+def test_rate_limiter_unlimited():
+    limiter = RateLimiter()
+    assert all(
+        limiter.reserve("adsdatahub.operations.list") == 0 for _ in range(100))
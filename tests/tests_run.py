@@ -0,0 +1,183 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+import googleapiclient.discovery  # type: ignore
+import httplib2  # type: ignore
+import pytest
+
+import adh_deployment_manager.utils as utils
+from adh_deployment_manager.adh_service import AdhService
+from adh_deployment_manager.commands.run import Runner, format_jobs
+from adh_deployment_manager.config import Config
+from adh_deployment_manager.fake_server import get_discovery_document
+from adh_deployment_manager.journal import RunJournal
+from adh_deployment_manager.state import DeploymentState
+
+# define sample config used for running test against
+_CONFIG = {
+    "bq_project": "project",
+    "bq_dataset": "dataset",
+    "date_range_setup": {
+        "start_date": "2021-01-01",
+        "end_date": "2021-01-14"
+    },
+    "queries_setup": [{
+        "queries": ["daily_query"],
+        "execution_mode": "batch"
+    }, {
+        "queries": ["weekly_query"],
+        "execution_mode": "batch",
+        "batch_window": "week",
+        "output_table_suffix": "weekly"
+    }]
+}
+_QUERIES = [f"query_{i}" for i in range(20)]
+
+
+class _SharedHttp:
+    """ Http which keeps the request in flight on itself, so concurrent
+    requests get each other's responses like on a shared connection."""
+    def __init__(self):
+        self.bodies = []
+        self._body = None
+        self._lock = threading.Lock()
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self._body = body
+        time.sleep(0.005)
+        with self._lock:
+            self.bodies.append(body)
+        name = f"operations/{json.loads(self._body)['destTable']}"
+        return httplib2.Response({"status": 200}), json.dumps({"name": name})
+
+
+class _AnalysisQuery:
+    def __init__(self, adh_service, title):
+        self.adh_service = adh_service
+        self.title = title
+        self.name = f"customers/000000001/analysisQueries/{title}"
+        self.customer_id = "customers/000000001"
+
+    def _run(self, start_date, end_date, output_table_name, parameters=None,
+             **kwargs):
+        return utils.get_service(
+            self.adh_service).customers().analysisQueries().start(
+                name=self.name, body={"destTable": output_table_name})
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def runner():
+    runner = Runner.__new__(Runner)
+    runner.config = Config(_CONFIG, os.path.dirname(__file__))
+    runner._existing_tables = set()
+    return runner
+
+
+def _get_tables(runner, query):
+    return [
+        output_table for _, _, _, output_table in runner._get_jobs_for_query(
+            query, runner.config.queries[query])
+    ]
+
+
+@pytest.fixture
+def https(monkeypatch):
+    # connections of service objects built by every thread
+    https = []
+
+    def build_http():
+        https.append(_SharedHttp())
+        return https[-1]
+
+    monkeypatch.setattr(googleapiclient.discovery, "build_http", build_http)
+    return https
+
+
+@pytest.fixture
+def concurrent_runner(https):
+    adh_service = AdhService(None,
+                             "key",
+                             discovery_document=get_discovery_document(
+                                 "https://adsdatahub.googleapis.com/"),
+                             discovery_cache_ttl=0)
+    config = SimpleNamespace(bq_project="project",
+                             bq_dataset="dataset",
+                             queries={query: {} for query in _QUERIES})
+    deployment = SimpleNamespace(
+        config=config,
+        adh_service=adh_service,
+        _get_queries=lambda: [(SimpleNamespace(title=query),
+                               _AnalysisQuery(adh_service, query))
+                              for query in _QUERIES],
+        _fetch_queries=lambda analysis_queries: [{
+            "queries": [{}]
+        } for _ in analysis_queries],
+        state=DeploymentState(),
+        journal=RunJournal())
+    return Runner(deployment)
+
+
+### TESTS
+# batch query is launched for each date window
+def test_get_jobs_for_query_windows(runner):
+    assert len(_get_tables(runner, "daily_query")) == 14
+    assert _get_tables(runner, "weekly_query") == [
+        "project.dataset.weekly_20210101", "project.dataset.weekly_20210104",
+        "project.dataset.weekly_20210111"
+    ]
+
+
+# windows with existing output tables are skipped
+def test_get_jobs_for_query_skip_existing(runner):
+    runner._existing_tables = {"daily_query_20210101", "daily_query_20210102"}
+    tables = _get_tables(runner, "daily_query")
+    assert len(tables) == 12
+    assert tables[0] == "project.dataset.daily_query_20210103"
+
+
+# report lists every job that would be launched
+def test_format_jobs(runner):
+    jobs = [(None, query_identifier, start_date, end_date, output_table,
+             None, None, {})
+            for query_identifier, start_date, end_date, output_table in
+            runner._get_jobs_for_query("weekly_query",
+                                       runner.config.queries["weekly_query"])]
+    assert format_jobs(jobs).splitlines() == [
+        "> launch    weekly_query_20210101 into project.dataset.weekly_20210101",
+        "> launch    weekly_query_20210104 into project.dataset.weekly_20210104",
+        "> launch    weekly_query_20210111 into project.dataset.weekly_20210111",
+        "3 to launch."
+    ]
+
+
+# concurrently launched jobs are launched once and get their own responses
+def test_execute_concurrently(https, concurrent_runner):
+    result = concurrent_runner.execute(max_workers=4)
+    for job, operation in zip(result["jobs"], result["launched_jobs"]):
+        assert operation == (
+            f"operations/project.dataset.{job['query_identifier']}")
+    assert sorted(result["launched_jobs"]) == sorted(
+        f"operations/project.dataset.{query}" for query in _QUERIES)
+    bodies = [body for http in https for body in http.bodies]
+    assert sorted(json.loads(body)["destTable"] for body in bodies) == sorted(
+        f"project.dataset.{query}" for query in _QUERIES)
+    # service of the main thread and of each worker
+    assert 2 < len(https) <= 5
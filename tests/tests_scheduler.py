@@ -0,0 +1,73 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from adh_deployment_manager.scheduler import DagScheduler, Node
+
+# jobs which operations end up with an error
+_FAILED_JOBS = ["failed_job"]
+
+
+# Define fixtures to be used by pytest
+# Define scheduler which records launched jobs
+@pytest.fixture
+def scheduler():
+    scheduler = DagScheduler(
+        launch_job=lambda job: scheduler.launched.append(job) or job,
+        wait_for_jobs=lambda jobs: [{
+            "status": "Error" if job in _FAILED_JOBS else "Success"
+        } for job in jobs],
+        max_workers=2)
+    scheduler.launched = []
+    return scheduler
+
+
+### TESTS
+# run launches node only after its dependencies
+def test_run_respects_dependencies(scheduler):
+    scheduler.run([
+        Node("second", ["first"], [["job_2"]]),
+        Node("first", [], [["job_1"]]),
+    ])
+    assert scheduler.launched == ["job_1", "job_2"]
+
+
+# run skips nodes which depend on a failed node
+def test_run_skips_dependents_of_failed_node(scheduler):
+    nodes = scheduler.run([
+        Node("first", [], [["failed_job"]]),
+        Node("second", ["first"], [["job_2"]]),
+        Node("third", ["second"], [["job_3"]]),
+        Node("independent", [], [["job_4"]]),
+    ])
+    assert [node.status for node in nodes
+            ] == ["Error", "Skipped", "Skipped", "Success"]
+    assert "job_2" not in scheduler.launched
+
+
+# run raises ValueError for circular dependencies
+def test_run_circular_dependencies(scheduler):
+    with pytest.raises(ValueError):
+        scheduler.run([
+            Node("first", ["second"], [["job_1"]]),
+            Node("second", ["first"], [["job_2"]]),
+        ])
+
+
+# run raises ValueError for dependency on unknown node
+def test_run_unknown_dependency(scheduler):
+    with pytest.raises(ValueError):
+        scheduler.run([Node("first", ["unknown"], [["job_1"]])])
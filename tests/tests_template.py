@@ -0,0 +1,83 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from adh_deployment_manager.template import QueryTemplate, get_customer_values
+
+# define sample `replace` block used for running test against
+_REPLACEMENTS = {
+    "bq_project": "project",
+    "bq_dataset": {
+        "123456789": "dataset_1",
+        "default": "dataset"
+    },
+    "table": {
+        "123456789": "table_1"
+    }
+}
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def template():
+    return QueryTemplate(
+        "SELECT * FROM `{bq_project}.{bq_dataset}.{table}` WHERE x = '{customer_id}'",
+        "query.sql")
+
+
+### TESTS
+# placeholders are replaced in a single pass
+def test_template_render_single_pass():
+    assert QueryTemplate("SELECT {a}, {b} FROM {a}").render({
+        "a": "{b}",
+        "b": 1
+    }) == "SELECT {b}, 1 FROM {b}"
+
+
+# text without placeholders is kept, including braces which aren't placeholders
+def test_template_render_no_placeholders():
+    text = "SELECT REGEXP_CONTAINS(x, r'a{2}'), JSON '{\"a\": 1}'"
+    assert QueryTemplate(text).render({}) == text
+
+
+# missing placeholders are reported
+def test_template_render_missing(template):
+    with pytest.raises(ValueError, match="query.sql .* bq_dataset, bq_project"):
+        template.render({"table": "t", "customer_id": 1})
+
+
+# missing placeholders are kept if rendering isn't strict
+def test_template_render_not_strict(template):
+    assert template.render({"table": "t"}, strict=False).endswith(
+        "{bq_dataset}.t` WHERE x = '{customer_id}'")
+
+
+# customer specific values are used for the customer
+def test_get_customer_values_specific(template):
+    values = get_customer_values(_REPLACEMENTS, 123456789)
+    assert template.render(values) == (
+        "SELECT * FROM `project.dataset_1.table_1` WHERE x = '123456789'")
+
+
+# default values are used for other customers and missing ones are omitted
+def test_get_customer_values_default():
+    values = get_customer_values(_REPLACEMENTS, "000000001", "000000002")
+    assert values == {
+        "customer_id": "000000001",
+        "ads_data_from": "000000002",
+        "bq_project": "project",
+        "bq_dataset": "dataset"
+    }
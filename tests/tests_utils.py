@@ -16,10 +16,22 @@
 import pytest
 import os
 
+from googleapiclient.errors import HttpError
 import adh_deployment_manager.utils as utils
+from tests.conftest import _Request, _http_error
 
 # date constant
 _DATE = "1970-01-01"
+_OPERATION = {"name": "operations/1"}
+
+
+# Define fixtures to be used by pytest
+# Define fixture which records sleeps instead of sleeping
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(utils.time, "sleep", sleeps.append)
+    return sleeps
 
 
 # _get_date returns a dict
@@ -39,3 +51,65 @@ def test_get_file_content():
     text = utils.get_file_content("sample_query.sql",
                                   os.path.dirname(__file__))
     assert text == "SELECT test_field FROM test_table"
+
+
+# execute_adh_api_call_with_retry retries rate limiting and server errors
+def test_execute_with_retry_retriable_errors(sleeps):
+    request = _Request(_OPERATION, [_http_error(429), _http_error(503)])
+    response = utils.execute_adh_api_call_with_retry(request)
+    assert response == _OPERATION
+    assert request.calls == 3
+    assert len(sleeps) == 2
+
+
+# execute_adh_api_call_with_retry raises permanent errors without retrying
+def test_execute_with_retry_permanent_error(sleeps):
+    request = _Request(_OPERATION, [_http_error(400)])
+    with pytest.raises(HttpError):
+        utils.execute_adh_api_call_with_retry(request)
+    assert request.calls == 1
+    assert sleeps == []
+
+
+# execute_adh_api_call_with_retry raises last error when retries are exhausted
+def test_execute_with_retry_exhausted_retries(sleeps):
+    request = _Request(_OPERATION, [_http_error(500) for _ in range(5)])
+    with pytest.raises(HttpError):
+        utils.execute_adh_api_call_with_retry(request, max_retries=2)
+    assert request.calls == 3
+
+
+# execute_adh_api_call_with_retry waits as long as Retry-After header says
+def test_execute_with_retry_retry_after(sleeps):
+    request = _Request(_OPERATION, [_http_error(429, **{"retry-after": "7"})])
+    utils.execute_adh_api_call_with_retry(request)
+    assert sleeps == [7]
+
+
+# RetryPolicy delay grows exponentially and is capped by max_delay
+@pytest.mark.parametrize("expected,retry", [(1, 1), (2, 2), (4, 3), (5, 10)])
+def test_retry_policy_delay(expected, retry):
+    policy = utils.RetryPolicy(initial_delay=1,
+                               multiplier=2,
+                               max_delay=5,
+                               jitter=0)
+    assert policy.get_delay(retry) == expected
+
+
+# execute_adh_api_call_with_retry stops retrying once deadline is reached
+def test_execute_with_retry_deadline(sleeps):
+    request = _Request(_OPERATION, [_http_error(500), _http_error(500)])
+    policy = utils.RetryPolicy(initial_delay=10, jitter=0, deadline=15)
+    with pytest.raises(HttpError):
+        utils.execute_adh_api_call_with_retry(request, policy=policy)
+    assert sleeps == [10]
+
+
+# write_file_atomically replaces file and leaves no temporary files behind
+def test_write_file_atomically(tmp_path):
+    path = str(tmp_path / "cache" / "file.json")
+    utils.write_file_atomically(path, "first")
+    utils.write_file_atomically(path, "second")
+    with open(path) as f:
+        assert f.read() == "second"
+    assert os.listdir(tmp_path / "cache") == ["file.json"]
@@ -0,0 +1,61 @@
+#
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pytest
+
+from adh_deployment_manager.query import AnalysisQuery
+from adh_deployment_manager.validation_cache import ValidationCache
+
+
+# Define fixtures to be used by pytest
+@pytest.fixture
+def cache(tmp_path):
+    return ValidationCache(ttl=60, cache_dir=str(tmp_path))
+
+
+def _get_analysis_query(service, cache, text="SELECT 1"):
+    analysis_query = AnalysisQuery(service,
+                                   "1",
+                                   title="query",
+                                   text=text,
+                                   validation_cache=cache)
+    analysis_query.name = "customers/000000001/analysisQueries/1"
+    return analysis_query
+
+
+### TESTS
+# unchanged query is validated once across query objects
+def test_validation_cached(service, cache):
+    for _ in range(3):
+        assert _get_analysis_query(service, cache).validate() == (True, None)
+    assert service.calls == [("analysisQueries.validate", "SELECT 1")]
+
+
+# changed query is validated again
+def test_validation_cache_changed_query(service, cache):
+    _get_analysis_query(service, cache).validate()
+    _get_analysis_query(service, cache, "SELECT 2").validate()
+    assert service.calls == [("analysisQueries.validate", "SELECT 1"),
+                             ("analysisQueries.validate", "SELECT 2")]
+
+
+# expired validation result is not reused
+def test_validation_cache_expired(service, cache):
+    _get_analysis_query(service, cache).validate()
+    for file_name in os.listdir(cache.cache_dir):
+        os.utime(os.path.join(cache.cache_dir, file_name), (0, 0))
+    _get_analysis_query(service, cache).validate()
+    assert len(service.calls) == 2